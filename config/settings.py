@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 
 from pathlib import Path
 import os
+import sys
 from dotenv import load_dotenv
 load_dotenv()
 from datetime import timedelta
@@ -45,6 +46,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     'rest_framework',
     'rest_framework.authtoken',
     'corsheaders',
@@ -188,6 +190,14 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'receipts.tasks.reconcile_unprocessed_receipts',
         'schedule': 3600,
     },
+    'retry_due_categorizations': {
+        'task': 'transactions.tasks.retry_due_categorizations_task',
+        'schedule': 3600,
+    },
+    'aggregate_merchant_catalogue': {
+        'task': 'transactions.tasks.aggregate_merchant_catalogue_task',
+        'schedule': 86400,  # Daily
+    },
     'update_spending_frequency': {
         'task': 'budgeting.tasks.update_spending_frequency',
         'schedule': 345600,  # Every 96 hours
@@ -208,6 +218,41 @@ GOOGLE_CLIENT_SECRET = os.getenv('GOOGLE_CLIENT_SECRET')
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 CELERY_BROKER_URL = 'redis://localhost:6379/0'
 CELERY_RESULT_BACKEND = 'redis://localhost:6379/0'
+
+# The email pipeline runs as chained stages on dedicated queues so slow LLM
+# fallbacks never starve emails that a saved parser handles in milliseconds.
+# Each queue gets its own worker pool and concurrency (see script.sh).
+CELERY_TASK_ROUTES = {
+    'transactions.tasks.process_raw_email_task': {'queue': 'email_parse'},
+    'transactions.tasks.ai_extract_raw_email_task': {'queue': 'email_llm'},
+    'transactions.tasks.persist_raw_email_task': {'queue': 'email_persist'},
+    'transactions.tasks.categorize_transaction_task': {'queue': 'categorize'},
+}
+# Long-running LLM tasks should not be prefetched by a busy worker process.
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+
+# Shared cache, also used to store pipeline metrics counters across workers.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv('CACHE_REDIS_URL', 'redis://localhost:6379/1'),
+    }
+}
+# Tests run against a per-process in-memory cache instead of Redis.
+if 'test' in sys.argv:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'tests',
+        }
+    }
+
+# Upper bound on how long an analytics response stays cached; entries are
+# normally invalidated earlier by a bump of the user's data version.
+RESPONSE_CACHE_TIMEOUT = int(os.getenv('RESPONSE_CACHE_TIMEOUT', 60 * 60 * 24))
+
+# Optional bearer token that lets a Prometheus scraper read /api/transactions/metrics/.
+METRICS_AUTH_TOKEN = os.getenv('METRICS_AUTH_TOKEN')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 GMAIL_REDIRECT_URI = os.getenv('GMAIL_REDIRECT_URI')
@@ -1,4 +1,7 @@
-celery -A config worker -l info
+celery -A config worker -l info -Q celery -n default@%h
+celery -A config worker -l info -Q email_parse,email_persist -c 8 -n fast@%h
+celery -A config worker -l info -Q email_llm -c 4 -n llm@%h
+celery -A config worker -l info -Q categorize -c 2 -n categorize@%h
 celery -A config beat -l info
 python3 manage.py runserver
 
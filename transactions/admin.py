@@ -31,6 +31,16 @@ class RawEmailAdmin(admin.ModelAdmin):
     readonly_fields = ('fetched_at', 'transaction_data')
 
 
+@admin.register(RejectedEmail)
+class RejectedEmailAdmin(admin.ModelAdmin):
+    """Admin interface for emails discarded by the pre-classifier."""
+    search_fields = ('user__username', 'email_id', 'subject', 'sender')
+    list_display = ('user', 'email_id', 'bank_name', 'subject', 'reason', 'rejected_at')
+    list_filter = ('reason', 'bank_name')
+    ordering = ('-rejected_at',)
+    readonly_fields = ('rejected_at',)
+
+
 admin.site.register(TransactionCategory)
 class TransactionCategoryAdmin(admin.ModelAdmin):
     """Admin interface for TransactionCategory model."""
@@ -86,3 +96,21 @@ class ParserFunctionAdmin(admin.ModelAdmin):
     )
     add_fieldsets = fieldsets
     list_display = ('name', 'description')
+
+
+@admin.register(UserCategorizationIndex)
+class UserCategorizationIndexAdmin(admin.ModelAdmin):
+    """Admin interface for persisted per-user categorization indexes."""
+    search_fields = ('user__username',)
+    list_display = ('user', 'version', 'vectorizer_signature', 'updated_at')
+    exclude = ('vectors', 'narrations', 'labels')
+    readonly_fields = ('version', 'vectorizer_signature', 'updated_at')
+
+
+@admin.register(MerchantCategory)
+class MerchantCategoryAdmin(admin.ModelAdmin):
+    """Admin interface for the shared merchant catalogue."""
+    search_fields = ('merchant_key',)
+    list_display = ('merchant_key', 'category', 'confidence', 'user_count', 'updated_at')
+    list_filter = ('category',)
+    ordering = ('-user_count',)
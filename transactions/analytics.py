@@ -0,0 +1,193 @@
+"""
+Shared analytics queries for the summary-style endpoints and the PDF report.
+Everything reads DailyTransactionRollup and computes debit and credit figures
+together with conditional aggregation, so each call is one database round trip.
+"""
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import Dict, List, Optional
+
+from django.db.models import F, Q, Sum
+from django.db.models.functions import TruncMonth, TruncWeek
+
+from .models import DailyTransactionRollup
+
+DEBIT = Q(transaction_type='debit')
+CREDIT = Q(transaction_type='credit')
+
+GRANULARITIES = ('day', 'week', 'month')
+
+# What a time series can be split by: the rollup value and the label field.
+SPLIT_FIELDS = {
+    'category': ('category_id', 'category__name'),
+    'bank': ('bank_name', 'bank_name'),
+}
+
+# Largest number of periods one time series may span, and the default span.
+MAX_SERIES_PERIODS = 1000
+DEFAULT_SERIES_PERIODS = 30
+
+
+def rollups_for(user, start: Optional[date] = None, end: Optional[date] = None, **filters):
+    """The user's daily rollups between two dates, both inclusive."""
+    rollups = DailyTransactionRollup.objects.filter(user=user, **filters)
+    if start:
+        rollups = rollups.filter(day__gte=start)
+    if end:
+        rollups = rollups.filter(day__lte=end)
+    return rollups
+
+
+def _conditional_sums():
+    return {
+        'debit_total': Sum('total_amount', filter=DEBIT),
+        'debit_count': Sum('transaction_count', filter=DEBIT),
+        'credit_total': Sum('total_amount', filter=CREDIT),
+        'credit_count': Sum('transaction_count', filter=CREDIT),
+    }
+
+
+def _totals(debit_total, debit_count, credit_total, credit_count) -> Dict:
+    debit_total = debit_total or Decimal('0')
+    credit_total = credit_total or Decimal('0')
+    return {
+        'debit': {'total_amount': debit_total, 'total_count': debit_count or 0},
+        'credit': {'total_amount': credit_total, 'total_count': credit_count or 0},
+        'balance': credit_total - debit_total,
+    }
+
+
+def summarize(user, start: Optional[date] = None, end: Optional[date] = None) -> Dict:
+    """Debit and credit totals, counts and the net balance for a period."""
+    row = rollups_for(user, start, end).aggregate(**_conditional_sums())
+    return _totals(row['debit_total'], row['debit_count'], row['credit_total'], row['credit_count'])
+
+
+def category_breakdown(user, start: Optional[date] = None, end: Optional[date] = None,
+                       categorized_only: bool = False) -> List[Dict]:
+    """
+    Per-category debit and credit totals and counts for a period, ordered by
+    debit total (largest first). Uncategorized transactions have a None
+    category unless categorized_only is set.
+    """
+    rollups = rollups_for(user, start, end)
+    if categorized_only:
+        rollups = rollups.filter(category__isnull=False)
+    rows = rollups.values('category_id', 'category__name').annotate(**_conditional_sums()).order_by(
+        F('debit_total').desc(nulls_last=True)
+    )
+    return [
+        {
+            'category_id': row['category_id'],
+            'category_name': row['category__name'],
+            'debit_total': row['debit_total'] or Decimal('0'),
+            'debit_count': row['debit_count'] or 0,
+            'credit_total': row['credit_total'] or Decimal('0'),
+            'credit_count': row['credit_count'] or 0,
+        }
+        for row in rows
+    ]
+
+
+def period_report(user, start: Optional[date] = None, end: Optional[date] = None) -> Dict:
+    """
+    Totals, balance and the per-category breakdown for a period, from one
+    grouped query; the totals are the sums of the category rows.
+    """
+    categories = category_breakdown(user, start, end)
+    report = _totals(
+        sum((row['debit_total'] for row in categories), Decimal('0')),
+        sum(row['debit_count'] for row in categories),
+        sum((row['credit_total'] for row in categories), Decimal('0')),
+        sum(row['credit_count'] for row in categories),
+    )
+    report['categories'] = categories
+    return report
+
+
+def period_start(day: date, granularity: str) -> date:
+    """The first day of the period containing `day`; weeks start on Monday."""
+    if granularity == 'week':
+        return day - timedelta(days=day.weekday())
+    if granularity == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def next_period(start: date, granularity: str) -> date:
+    if granularity == 'week':
+        return start + timedelta(days=7)
+    if granularity == 'month':
+        return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return start + timedelta(days=1)
+
+
+def periods_between(start: date, end: date, granularity: str) -> List[date]:
+    """The start of every period from the one containing `start` to the one containing `end`."""
+    periods = []
+    current = period_start(start, granularity)
+    while current <= end:
+        periods.append(current)
+        current = next_period(current, granularity)
+    return periods
+
+
+def series_start(end: date, granularity: str, count: int = DEFAULT_SERIES_PERIODS) -> date:
+    """The start of the period `count - 1` periods before the one containing `end`."""
+    start = period_start(end, granularity)
+    for _ in range(count - 1):
+        start = period_start(start - timedelta(days=1), granularity)
+    return start
+
+
+def timeseries(user, start: date, end: date, granularity: str = 'day', split_by: Optional[str] = None) -> Dict:
+    """
+    Debit and credit totals per period between two dates (inclusive), from one
+    grouped rollup query. Periods without transactions are filled with zeros,
+    so every series has one value per entry of 'periods'. With split_by
+    ('category' or 'bank') there is one series per category or bank,
+    largest total spend first; otherwise a single series.
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"Unknown granularity '{granularity}'.")
+    if split_by is not None and split_by not in SPLIT_FIELDS:
+        raise ValueError(f"Cannot split a time series by '{split_by}'.")
+    periods = periods_between(start, end, granularity)
+    if len(periods) > MAX_SERIES_PERIODS:
+        raise ValueError(f"A time series may span at most {MAX_SERIES_PERIODS} periods.")
+
+    truncate = {'day': F('day'), 'week': TruncWeek('day'), 'month': TruncMonth('day')}[granularity]
+    group_fields = ['period']
+    if split_by:
+        group_fields += list(dict.fromkeys(SPLIT_FIELDS[split_by]))
+    rows = rollups_for(user, start, end).annotate(period=truncate).values(*group_fields).annotate(
+        debit_total=Sum('total_amount', filter=DEBIT),
+        credit_total=Sum('total_amount', filter=CREDIT),
+    ).order_by()
+
+    key_field, label_field = SPLIT_FIELDS[split_by] if split_by else (None, None)
+    position = {period: i for i, period in enumerate(periods)}
+    series = {}
+    for row in rows:
+        key = row[key_field] if key_field else None
+        if key not in series:
+            series[key] = {
+                'key': key,
+                'label': row[label_field] if label_field else None,
+                'debit': [Decimal('0')] * len(periods),
+                'credit': [Decimal('0')] * len(periods),
+            }
+        period = row['period']
+        i = position[period.date() if hasattr(period, 'date') else period]
+        series[key]['debit'][i] += row['debit_total'] or Decimal('0')
+        series[key]['credit'][i] += row['credit_total'] or Decimal('0')
+
+    if not split_by and not series:
+        series[None] = {
+            'key': None, 'label': None,
+            'debit': [Decimal('0')] * len(periods), 'credit': [Decimal('0')] * len(periods),
+        }
+    return {
+        'periods': periods,
+        'series': sorted(series.values(), key=lambda entry: sum(entry['debit']), reverse=True),
+    }
@@ -0,0 +1,146 @@
+import json
+import logging
+import math
+import os
+import statistics
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+from typing import Dict, List
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from transactions.models import Transaction, TransactionCategory
+from transactions.services import categorization_service
+from transactions.services.categorization_service import CategorizationService
+from transactions.tasks import categorize_transactions_for_user
+from .narrations import MERCHANTS, NarrationGenerator
+from .stub_llm import StubAIService
+
+User = get_user_model()
+
+FIXTURE_PATH = os.path.join(os.path.dirname(__file__), 'labelled_narrations.json')
+
+
+def load_labelled_fixture() -> List[Dict[str, str]]:
+    with open(FIXTURE_PATH) as fixture:
+        return json.load(fixture)
+
+
+def summarize(values: List[float], scale: float = 1.0) -> Dict[str, float]:
+    """Median and max; with a handful of runs a p95 would just be the max."""
+    if not values:
+        return {'median': 0.0, 'max': 0.0}
+    return {'median': statistics.median(values) * scale, 'max': max(values) * scale}
+
+
+@contextmanager
+def test_database():
+    """
+    Runs the block against a freshly migrated test database and a local
+    in-memory cache, and drops the database afterwards, so the benchmark never
+    writes to the configured database or shares its cache.
+    """
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def _create_transactions(user, rows, start, categories=None):
+    transactions = [
+        Transaction(
+            user=user,
+            transaction_type=row.get('transaction_type', 'debit'),
+            amount=Decimal(1000 + i),
+            date=start + timedelta(minutes=i),
+            narration=row['narration'],
+            bank_name=row.get('bank_name'),
+            category_id=categories[row['category']] if categories else None,
+        )
+        for i, row in enumerate(rows)
+    ]
+    return Transaction.objects.bulk_create(transactions)
+
+
+def run_categorization_benchmark(history: int = 2000, pending: int = 500, batches: int = 10,
+                                 llm_accuracy: float = 0.9, llm_latency: float = 0.0,
+                                 use_fixture: bool = True, seed: int = 42) -> Dict:
+    """
+    Measures categorize_transactions_for_user on a throwaway user in a test
+    database. `history` categorized transactions are created first, then
+    `pending` uncategorized ones arrive in `batches` runs, like successive
+    email syncs. Each run commits, as it would in a worker.
+    """
+    generator = NarrationGenerator(seed)
+    history_rows = list(generator.generate(history))
+    pending_rows = list(generator.generate(pending))
+    if use_fixture:
+        pending_rows.extend(load_labelled_fixture())
+
+    stub = StubAIService({row['narration']: row['category'] for row in pending_rows},
+                         accuracy=llm_accuracy, latency=llm_latency)
+    previous_factory = CategorizationService.ai_service_factory
+    CategorizationService.ai_service_factory = staticmethod(lambda: stub)
+    # Keep the benchmark's own log lines out of the measurement.
+    logging.disable(logging.INFO)
+
+    try:
+        with test_database():
+            categories = {
+                name: TransactionCategory.objects.get_or_create(name=name)[0].id
+                for name in list(MERCHANTS) + ["Unknown"]
+            }
+            user = User.objects.create(username=f"benchmark-{uuid.uuid4().hex[:12]}")
+            start = timezone.now() - timedelta(days=365)
+            _create_transactions(user, history_rows, start, categories)
+
+            run_seconds = []
+            per_transaction = []
+            created = []
+            batch_size = max(1, math.ceil(len(pending_rows) / max(1, batches)))
+            for batch_start in range(0, len(pending_rows), batch_size):
+                batch = pending_rows[batch_start:batch_start + batch_size]
+                created.extend(_create_transactions(
+                    user, batch, start + timedelta(days=180, minutes=batch_start)
+                ))
+                started = time.perf_counter()
+                categorize_transactions_for_user(user.id)
+                run_seconds.append(time.perf_counter() - started)
+                per_transaction.append(run_seconds[-1] / len(batch))
+
+            assigned = dict(
+                Transaction.objects.filter(id__in=[tx.id for tx in created]).values_list('id', 'category__name')
+            )
+            correct = sum(1 for tx, row in zip(created, pending_rows) if assigned.get(tx.id) == row['category'])
+            covered = sum(1 for tx in created if assigned.get(tx.id) not in (None, "Unknown"))
+            user_id = user.id
+    finally:
+        CategorizationService.ai_service_factory = previous_factory
+        logging.disable(logging.NOTSET)
+
+    categorization_service._lookups.pop(user_id, None)
+
+    total_seconds = sum(run_seconds)
+    return {
+        'config': {
+            'history': history, 'pending': len(pending_rows), 'batches': len(run_seconds),
+            'llm_accuracy': llm_accuracy, 'llm_latency': llm_latency, 'fixture': use_fixture, 'seed': seed,
+        },
+        'throughput_tx_per_second': len(pending_rows) / total_seconds if total_seconds else None,
+        'total_seconds': total_seconds,
+        'run_latency_seconds': summarize(run_seconds),
+        'per_transaction_latency_ms': summarize(per_transaction, scale=1000),
+        'accuracy': correct / len(pending_rows) if pending_rows else None,
+        'coverage': covered / len(pending_rows) if pending_rows else None,
+        'llm_calls': stub.calls,
+        'llm_items': stub.items,
+    }
@@ -0,0 +1,98 @@
+"""
+Compares the cosine scores of the n-gram similarity engine with the difflib
+ratios the categorizer used before, to calibrate SIMILARITY_THRESHOLD.
+
+Cosine similarity of character n-grams is lower than difflib's ratio on the
+same pair when only reference numbers differ, so difflib's 0.85 cut-off
+cannot be reused as is. For each candidate threshold the report gives the
+share of narrations the engine would categorize from history, how often
+that decision agrees with difflib above 0.85, and how often the category it
+reuses is the right one.
+"""
+import difflib
+import random
+import re
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from transactions.services.narration_similarity import NarrationIndex
+
+# The threshold the difflib implementation used.
+DIFFLIB_THRESHOLD = 0.85
+
+_DIGIT_RE = re.compile(r'\d')
+
+
+def repeat_payments(rows: Sequence[Dict[str, str]], repeats: int, seed: int = 42) -> List[Dict[str, str]]:
+    """
+    Copies of each narration with its digits redrawn, the way a repeat
+    payment to the same merchant differs only in its references.
+    """
+    rng = random.Random(seed)
+    return [
+        {'narration': _DIGIT_RE.sub(lambda _: rng.choice('0123456789'), row['narration']), 'category': row['category']}
+        for row in rows
+        for _ in range(repeats)
+    ]
+
+
+def best_difflib_matches(history: Sequence[Dict[str, str]], narrations: Sequence[str]) -> List[Tuple[str, float]]:
+    """(category, ratio) of the best difflib match of each narration, as the old categorizer scored them."""
+    history = [(row['narration'].lower(), row['category']) for row in history]
+    matches = []
+    for narration in narrations:
+        narration = narration.lower()
+        best_ratio, best_category = 0.0, None
+        for candidate, category in history:
+            ratio = difflib.SequenceMatcher(None, narration, candidate).ratio()
+            if ratio > best_ratio:
+                best_ratio, best_category = ratio, category
+        matches.append((best_category, best_ratio))
+    return matches
+
+
+def agreement_table(history: Sequence[Dict[str, str]], queries: Sequence[Dict[str, str]],
+                    thresholds: Sequence[float]) -> List[Dict[str, float]]:
+    """
+    Scores `queries` against `history` with both engines and returns, per
+    cosine threshold: the share accepted, the agreement of that decision with
+    difflib above DIFFLIB_THRESHOLD and the precision of accepted categories.
+    """
+    narrations = [row['narration'] for row in queries]
+    truth = np.array([row['category'] for row in queries], dtype=object)
+
+    index = NarrationIndex()
+    for row in history:
+        index.add(row['narration'], row['category'])
+    cosine = index.best_matches(narrations)
+    cosine_categories = np.array([category for category, _ in cosine], dtype=object)
+    cosine_scores = np.array([score for _, score in cosine])
+
+    difflib_matches = best_difflib_matches(history, narrations)
+    difflib_categories = np.array([category for category, _ in difflib_matches], dtype=object)
+    difflib_accepted = np.array([ratio for _, ratio in difflib_matches]) > DIFFLIB_THRESHOLD
+
+    table = [{
+        'threshold': DIFFLIB_THRESHOLD,
+        'engine': 'difflib',
+        'accepted': float(difflib_accepted.mean()),
+        'agreement': 1.0,
+        'precision': _precision(difflib_categories, truth, difflib_accepted),
+    }]
+    for threshold in thresholds:
+        accepted = cosine_scores > threshold
+        table.append({
+            'threshold': threshold,
+            'engine': 'cosine',
+            'accepted': float(accepted.mean()),
+            'agreement': float((accepted == difflib_accepted).mean()),
+            'precision': _precision(cosine_categories, truth, accepted),
+        })
+    return table
+
+
+def _precision(predicted: np.ndarray, truth: np.ndarray, accepted: np.ndarray) -> float:
+    if not accepted.any():
+        return float('nan')
+    return float((predicted[accepted] == truth[accepted]).mean())
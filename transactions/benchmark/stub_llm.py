@@ -0,0 +1,44 @@
+import time
+import zlib
+from typing import Dict, List
+
+from transactions.services.ai_service import CATEGORIZATION_BATCH_SIZE
+
+
+class StubAIService:
+    """
+    Stands in for AIService in benchmarks. It answers from the benchmark's
+    ground truth, gets a deterministic share of narrations wrong ("Unknown"),
+    and can simulate per-call latency. It measures the pipeline around the
+    LLM, not the quality of a real model.
+    """
+
+    def __init__(self, labels: Dict[str, str], accuracy: float = 0.9, latency: float = 0.0):
+        self.labels = labels
+        self.accuracy = accuracy
+        self.latency = latency
+        self.calls = 0
+        self.items = 0
+
+    def _answer(self, narration: str, categories: List[str]) -> str:
+        label = self.labels.get(narration)
+        if label not in categories or zlib.crc32(narration.encode('utf-8')) % 1000 >= self.accuracy * 1000:
+            return "Unknown"
+        return label
+
+    def _call(self, item_count: int):
+        self.calls += 1
+        self.items += item_count
+        if self.latency:
+            time.sleep(self.latency)
+
+    def categorize_transaction(self, narration: str, categories: List[str], examples: List[Dict]) -> str:
+        self._call(1)
+        return self._answer(narration, categories)
+
+    def categorize_transactions(self, narrations: List[str], categories: List[str], examples: List[Dict],
+                                batch_size: int = CATEGORIZATION_BATCH_SIZE) -> Dict[str, str]:
+        distinct = list(dict.fromkeys(narrations))
+        for start in range(0, len(distinct), batch_size):
+            self._call(len(distinct[start:start + batch_size]))
+        return {narration: self._answer(narration, categories) for narration in narrations}
@@ -0,0 +1,138 @@
+import re
+import logging
+from typing import Optional, Tuple, Dict, List
+
+logger = logging.getLogger(__name__)
+
+# Each rule maps a rejection reason to the patterns that identify it.
+# Rules are grouped by where they are checked: subject, sender or body.
+SUBJECT_REJECT_RULES = {
+    'login_alert': [
+        r'log\s?-?in (?:alert|notification|confirmation)', r'sign\s?-?in (?:alert|notification)',
+        r'successful (?:log\s?-?in|sign\s?-?in)', r'new (?:device|log\s?-?in|sign\s?-?in)',
+    ],
+    'security_notice': [
+        r'security (?:alert|notice|update)', r'password (?:reset|change|changed|update)',
+        r'\botp\b', r'one[- ]time (?:password|pin)', r'(?:pin|token) (?:reset|change|activation)',
+        r'verify your (?:email|account|device)',
+    ],
+    'failed_transaction': [
+        r'failed (?:card )?transaction', r'transaction (?:declined|failed|unsuccessful)',
+        r'insufficient (?:funds|balance)',
+    ],
+    'statement': [r'\be-?statement\b', r'account statement', r'statement of account'],
+    'marketing': [
+        r'newsletter', r'special offer', r'exclusive (?:offer|deal)', r'\bpromo(?:tion)?s?\b',
+        r'\bwebinar\b', r'\bsurvey\b', r'happy (?:new year|birthday|holidays)', r'season\'?s greetings',
+    ],
+}
+
+SENDER_REJECT_RULES = {
+    'marketing': [r'newsletter@', r'marketing@', r'promo(?:tions?)?@', r'news@', r'offers?@'],
+}
+
+BODY_REJECT_RULES = {
+    'login_alert': [r'you have logged-?\s?in successfully', r'successfully (?:logged|signed) (?:in|into)'],
+    'security_notice': [r'your password (?:has been|was) (?:reset|changed)', r'your one[- ]time (?:password|pin)'],
+    'failed_transaction': [
+        r'failed (?:card )?transaction', r'transaction (?:was |has been )?(?:declined|unsuccessful)',
+    ],
+}
+
+# Body rules that only reject when the email carries no transaction signal,
+# because promotional text, overdraft tips ("insufficient funds") and login
+# notices often appear in the footer of genuine alerts.
+WEAK_BODY_REJECT_RULES = {
+    'marketing': [r'\bunsubscribe\b', r'special offer', r'limited[- ]time', r'\bpromo code\b', r'win (?:up to|big)'],
+    'login_alert': [r'log\s?-?in confirmation'],
+    'failed_transaction': [r'insufficient funds'],
+}
+
+# Signals that an email is a genuine debit/credit alert.
+TRANSACTION_SIGNAL_RE = re.compile(
+    r'\b(?:debit|credit|debited|credited|transaction|transfer|withdrawal|payment)\b'
+    r'|you (?:just )?(?:sent|received|spent)|(?:NGN|₦)\s*[\d,]+|\bN\s?[\d,]+\.\d{2}',
+    re.IGNORECASE,
+)
+
+# Extra per-bank rules, keyed by the bank name produced by GmailService.get_bank_name.
+# Each entry has the same shape as the global rule groups above.
+BANK_RULES: Dict[str, Dict[str, Dict[str, List[str]]]] = {
+    'Kuda Bank': {
+        'subject': {'marketing': [r'kuda (?:tips|news)', r'refer (?:a|your) friend']},
+    },
+    'Opay': {
+        'subject': {'marketing': [r'cashback (?:offer|reward)', r'opay (?:weekly|monthly) (?:report|summary)']},
+    },
+    'Moniepoint': {
+        'body': {'security_notice': [r'your (?:device|account) has been (?:linked|unlinked)']},
+    },
+}
+
+_TAG_RE = re.compile(r'<(?:script|style)[^>]*>.*?</(?:script|style)>|<[^>]+>', re.IGNORECASE | re.DOTALL)
+
+
+def _compile_rules(rules: Dict[str, List[str]]) -> List[Tuple[str, 're.Pattern']]:
+    return [(reason, re.compile('|'.join(patterns), re.IGNORECASE)) for reason, patterns in rules.items()]
+
+
+def _merge_rules(base: Dict[str, List[str]], extra: Dict[str, List[str]]) -> Dict[str, List[str]]:
+    merged = {reason: list(patterns) for reason, patterns in base.items()}
+    for reason, patterns in extra.items():
+        merged.setdefault(reason, []).extend(patterns)
+    return merged
+
+
+class EmailClassifier:
+    """
+    A fast, rule-based filter that decides whether an email is a transaction
+    alert before any parsing or LLM work is done. Rules are compiled once per
+    bank and reused for every email.
+    """
+
+    _compiled_cache: Dict[str, Dict[str, list]] = {}
+
+    def _rules_for_bank(self, bank_name: Optional[str]) -> Dict[str, list]:
+        key = bank_name or ''
+        if key not in self._compiled_cache:
+            bank_rules = BANK_RULES.get(key, {})
+            self._compiled_cache[key] = {
+                'subject': _compile_rules(_merge_rules(SUBJECT_REJECT_RULES, bank_rules.get('subject', {}))),
+                'sender': _compile_rules(_merge_rules(SENDER_REJECT_RULES, bank_rules.get('sender', {}))),
+                'body': _compile_rules(_merge_rules(BODY_REJECT_RULES, bank_rules.get('body', {}))),
+                'weak_body': _compile_rules(_merge_rules(WEAK_BODY_REJECT_RULES, bank_rules.get('weak_body', {}))),
+            }
+        return self._compiled_cache[key]
+
+    @staticmethod
+    def body_text(email_body: str) -> str:
+        """Cheap HTML-to-text conversion, good enough for keyword matching."""
+        return ' '.join(_TAG_RE.sub(' ', email_body or '').split())
+
+    def classify(self, subject: str = '', sender: str = '', body: str = '',
+                 bank_name: Optional[str] = None, require_signal: bool = True) -> Tuple[bool, Optional[str]]:
+        """
+        Returns (is_transactional, rejection_reason). The reason is of the form
+        "<rule>:<where>", e.g. "login_alert:subject", or None when accepted.
+        With require_signal=False only explicit reject rules are applied.
+        """
+        rules = self._rules_for_bank(bank_name)
+        subject = subject or ''
+        sender = sender or ''
+        text = self.body_text(body)
+
+        for where, value in (('subject', subject), ('sender', sender), ('body', text)):
+            for reason, pattern in rules[where]:
+                if value and pattern.search(value):
+                    return False, f"{reason}:{where}"
+
+        if not require_signal:
+            return True, None
+
+        if not TRANSACTION_SIGNAL_RE.search(subject) and not TRANSACTION_SIGNAL_RE.search(text):
+            for reason, pattern in rules['weak_body']:
+                if pattern.search(text):
+                    return False, f"{reason}:body"
+            return False, 'no_transaction_signal'
+
+        return True, None
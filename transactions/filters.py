@@ -0,0 +1,80 @@
+from datetime import datetime, time, timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+# Trigram indexes cannot serve patterns shorter than one trigram.
+MIN_SEARCH_LENGTH = 3
+
+# The 'category' value that selects uncategorized transactions.
+UNCATEGORIZED = 'uncategorized'
+
+
+def _split(value: str):
+    return [part.strip() for part in value.split(',') if part.strip()]
+
+
+def _amount(name: str, value: str) -> Decimal:
+    try:
+        return Decimal(value)
+    except InvalidOperation:
+        raise ValueError(f"'{name}' must be a number.")
+
+
+def _day_start(name: str, value: str) -> datetime:
+    day = parse_date(value)
+    if day is None:
+        raise ValueError(f"'{name}' must be a date (YYYY-MM-DD).")
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def filter_transactions(queryset, params):
+    """
+    Applies the transaction list filters in `params` (a QueryDict) to a
+    Transaction queryset. Raises ValueError for invalid values.
+
+    - category: comma-separated category ids, or 'uncategorized'
+    - bank: comma-separated bank names
+    - type: 'debit' or 'credit'
+    - min_amount / max_amount: inclusive amount bounds
+    - startdate / enddate: inclusive local dates
+    - search: case-insensitive narration substring, served by the
+      transaction_narr_upper_trgm index
+    """
+    if params.get('category'):
+        categories = _split(params['category'])
+        condition = Q(category__isnull=True) if UNCATEGORIZED in categories else Q()
+        ids = [value for value in categories if value != UNCATEGORIZED]
+        if any(not value.isdigit() for value in ids):
+            raise ValueError("'category' must be category ids or 'uncategorized'.")
+        if ids:
+            condition |= Q(category_id__in=ids)
+        queryset = queryset.filter(condition)
+
+    if params.get('bank'):
+        queryset = queryset.filter(bank_name__in=_split(params['bank']))
+
+    if params.get('type'):
+        if params['type'] not in ('debit', 'credit'):
+            raise ValueError("'type' must be 'debit' or 'credit'.")
+        queryset = queryset.filter(transaction_type=params['type'])
+
+    if params.get('min_amount'):
+        queryset = queryset.filter(amount__gte=_amount('min_amount', params['min_amount']))
+    if params.get('max_amount'):
+        queryset = queryset.filter(amount__lte=_amount('max_amount', params['max_amount']))
+
+    if params.get('startdate'):
+        queryset = queryset.filter(date__gte=_day_start('startdate', params['startdate']))
+    if params.get('enddate'):
+        queryset = queryset.filter(date__lt=_day_start('enddate', params['enddate']) + timedelta(days=1))
+
+    search = (params.get('search') or '').strip()
+    if search:
+        if len(search) < MIN_SEARCH_LENGTH:
+            raise ValueError(f"'search' must be at least {MIN_SEARCH_LENGTH} characters.")
+        queryset = queryset.filter(narration__icontains=search)
+
+    return queryset
@@ -0,0 +1,48 @@
+import json
+
+from django.core.management.base import BaseCommand
+from transactions.benchmark.runner import run_categorization_benchmark
+
+
+class Command(BaseCommand):
+    help = ('Benchmarks categorize_transactions_for_user on synthetic Nigerian bank narrations with a stub LLM. '
+            'It runs in a temporary test database that is dropped afterwards.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--history', type=int, default=2000, help='Already categorized transactions (0 = cold start).')
+        parser.add_argument('--pending', type=int, default=500, help='Uncategorized transactions to categorize.')
+        parser.add_argument('--batches', type=int, default=10, help='Number of runs the pending transactions arrive in.')
+        parser.add_argument('--llm-accuracy', type=float, default=0.9, help='Share of narrations the stub LLM gets right.')
+        parser.add_argument('--llm-latency', type=float, default=0.0, help='Simulated seconds per stub LLM call.')
+        parser.add_argument('--no-fixture', action='store_true', help='Leave out the hand-labelled fixture narrations.')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON.')
+
+    def handle(self, *args, **options):
+        result = run_categorization_benchmark(
+            history=options['history'],
+            pending=options['pending'],
+            batches=options['batches'],
+            llm_accuracy=options['llm_accuracy'],
+            llm_latency=options['llm_latency'],
+            use_fixture=not options['no_fixture'],
+            seed=options['seed'],
+        )
+
+        if options['json']:
+            self.stdout.write(json.dumps(result, indent=2))
+            return
+
+        config = result['config']
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"Categorized {config['pending']} transactions in {config['batches']} runs "
+            f"against {config['history']} categorized ones"
+        ))
+        self.stdout.write(f"throughput:        {result['throughput_tx_per_second']:.1f} tx/s")
+        self.stdout.write(f"run latency:       median {result['run_latency_seconds']['median']:.3f}s, "
+                          f"max {result['run_latency_seconds']['max']:.3f}s")
+        self.stdout.write(f"per transaction:   median {result['per_transaction_latency_ms']['median']:.2f}ms, "
+                          f"max {result['per_transaction_latency_ms']['max']:.2f}ms")
+        self.stdout.write(f"accuracy:          {result['accuracy']:.1%}")
+        self.stdout.write(f"coverage:          {result['coverage']:.1%}")
+        self.stdout.write(f"stub LLM calls:    {result['llm_calls']} ({result['llm_items']} narrations)")
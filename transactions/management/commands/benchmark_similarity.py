@@ -0,0 +1,108 @@
+import difflib
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from transactions.benchmark.narrations import NarrationGenerator
+from transactions.benchmark.runner import load_labelled_fixture
+from transactions.benchmark.similarity_calibration import agreement_table, repeat_payments
+from transactions.models import Transaction
+from transactions.services.categorization_service import SIMILARITY_THRESHOLD
+from transactions.services.narration_similarity import NarrationIndex
+
+def synthetic_narrations(count, generator):
+    rows = list(generator.generate(count))
+    return [row['narration'] for row in rows], [row['category'] for row in rows]
+
+
+class Command(BaseCommand):
+    help = ('Benchmarks the vectorized narration similarity engine against the old difflib scan. '
+            'With --calibrate, reports how often its threshold decisions agree with difflib instead.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000], help='History sizes to test.')
+        parser.add_argument('--pending', type=int, default=500, help='Number of uncategorized narrations to score.')
+        parser.add_argument('--difflib-sample', type=int, default=5,
+                            help='Pending narrations actually scored with difflib; the rest is extrapolated.')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--calibrate', action='store_true',
+                            help='Compare cosine thresholds with difflib above 0.85 instead of timing both.')
+        parser.add_argument('--user', type=int,
+                            help="Calibrate on this user's categorized transactions rather than the labelled "
+                                 "fixture; --pending of them are held out and matched against the rest.")
+
+    def handle(self, *args, **options):
+        if options['calibrate']:
+            self.calibrate(options)
+            return
+
+        generator = NarrationGenerator(options['seed'])
+        pending, _ = synthetic_narrations(options['pending'], generator)
+
+        self.stdout.write(f"{'history':>10}{'difflib s':>14}{'vector build s':>16}{'vector score s':>16}{'speedup':>10}")
+        for size in options['sizes']:
+            history, labels = synthetic_narrations(size, generator)
+            history_rows = [{'narration': n, 'category__name': l} for n, l in zip(history, labels)]
+
+            sample = pending[:max(1, options['difflib_sample'])]
+            started = time.perf_counter()
+            for narration in sample:
+                narration_lower = narration.lower()
+                max(history_rows, key=lambda item: difflib.SequenceMatcher(None, narration_lower, item['narration'].lower()).ratio())
+            difflib_seconds = (time.perf_counter() - started) / len(sample) * len(pending)
+
+            started = time.perf_counter()
+            index = NarrationIndex()
+            for narration, label in zip(history, labels):
+                index.add(narration, label)
+            index.matrix
+            build_seconds = time.perf_counter() - started
+
+            started = time.perf_counter()
+            index.best_matches(pending)
+            score_seconds = time.perf_counter() - started
+
+            speedup = difflib_seconds / max(score_seconds, 1e-9)
+            self.stdout.write(f"{size:>10}{difflib_seconds:>14.2f}{build_seconds:>16.2f}{score_seconds:>16.2f}{speedup:>9.0f}x")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Scored {len(pending)} pending narrations per size; difflib times are extrapolated "
+            f"from {options['difflib_sample']} narrations."
+        ))
+
+    def calibrate(self, options):
+        if options['user']:
+            rows = [
+                {'narration': row['narration'], 'category': row['category__name']}
+                for row in Transaction.objects.filter(user_id=options['user'], category__isnull=False)
+                .values('narration', 'category__name')
+            ]
+            if len(rows) <= options['pending']:
+                raise CommandError(f"User {options['user']} has only {len(rows)} categorized transactions.")
+            random.Random(options['seed']).shuffle(rows)
+            queries, history = rows[:options['pending']], rows[options['pending']:]
+            source = f"{len(queries)} held-out transactions of user {options['user']}"
+        else:
+            # Real narrations from the fixture plus synthetic history; the queries are repeat
+            # payments of the real narrations and new synthetic ones.
+            labelled = load_labelled_fixture()
+            generator = NarrationGenerator(options['seed'])
+            history = labelled + [
+                {'narration': row['narration'], 'category': row['category']}
+                for row in generator.generate(options['sizes'][0])
+            ]
+            queries = repeat_payments(labelled, repeats=4, seed=options['seed']) + [
+                {'narration': row['narration'], 'category': row['category']}
+                for row in generator.generate(options['pending'])
+            ]
+            source = f"{len(queries)} repeat payments of the labelled fixture and synthetic narrations"
+
+        thresholds = [round(0.5 + 0.02 * step, 2) for step in range(20)]
+        self.stdout.write(f"Scoring {source} against {len(history)} categorized narrations.")
+        self.stdout.write(f"{'engine':>8}{'threshold':>11}{'accepted':>10}{'agreement':>11}{'precision':>11}")
+        for row in agreement_table(history, queries, thresholds):
+            marker = ' <- SIMILARITY_THRESHOLD' if row['engine'] == 'cosine' and row['threshold'] == SIMILARITY_THRESHOLD else ''
+            self.stdout.write(
+                f"{row['engine']:>8}{row['threshold']:>11.2f}{row['accepted']:>10.3f}"
+                f"{row['agreement']:>11.3f}{row['precision']:>11.3f}{marker}"
+            )
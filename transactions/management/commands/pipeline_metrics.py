@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand
+from transactions import metrics
+
+
+class Command(BaseCommand):
+    help = 'Prints a summary of the stored email processing pipeline metrics.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prometheus', action='store_true', help='Print the raw Prometheus exposition instead.')
+        parser.add_argument('--reset', action='store_true', help='Clear all stored counters after printing.')
+
+    def handle(self, *args, **options):
+        if options['prometheus']:
+            self.stdout.write(metrics.render_prometheus())
+        else:
+            self._print_summary(metrics.snapshot())
+
+        if options['reset']:
+            metrics.reset()
+            self.stdout.write(self.style.SUCCESS('Pipeline metrics have been reset.'))
+
+    def _print_summary(self, data):
+        self.stdout.write(self.style.MIGRATE_HEADING('Stage latencies'))
+        self.stdout.write(f"{'stage':<20}{'count':>8}{'avg ms':>10}{'p50 <=':>10}{'p95 <=':>10}")
+        for stage, histogram in data['stages'].items():
+            count = histogram['count']
+            avg_ms = histogram['sum'] / count if count else 0
+            p50 = self._format_bound(metrics.estimate_quantile(histogram, 0.5))
+            p95 = self._format_bound(metrics.estimate_quantile(histogram, 0.95))
+            self.stdout.write(f"{stage:<20}{count:>8}{avg_ms:>10.1f}{p50:>10}{p95:>10}")
+
+        self.stdout.write('')
+        self.stdout.write(self.style.MIGRATE_HEADING('Outcomes by parsing method'))
+        total = sum(data['outcomes'].values())
+        for outcome, count in data['outcomes'].items():
+            share = (count / total * 100) if total else 0
+            self.stdout.write(f"{outcome:<36}{count:>8}{share:>8.1f}%")
+
+        self.stdout.write('')
+        llm = data['llm_calls']
+        average = llm['sum'] / llm['count'] if llm['count'] else 0
+        self.stdout.write(self.style.MIGRATE_HEADING('LLM calls per email'))
+        self.stdout.write(f"emails: {llm['count']}, total LLM calls: {llm['sum']}, average: {average:.2f}")
+        previous = 0
+        for bound, cumulative in llm['buckets']:
+            self.stdout.write(f"  <= {bound}: {cumulative - previous}")
+            previous = cumulative
+
+    def _format_bound(self, value):
+        if value is None:
+            return '-'
+        if value == float('inf'):
+            return '>60s'
+        return f"{value * 1000:.0f}ms"
@@ -0,0 +1,27 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from transactions.services.categorization_service import UserCategoryLookup, reload_categorization_index
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = ('Rebuilds the persisted categorization index from scratch. Use after bulk changes that bypass '
+            'categorization, e.g. clean_narrations or deleting transactions.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, help='Only rebuild the index of this user id.')
+
+    def handle(self, *args, **options):
+        users = User.objects.all()
+        if options['user']:
+            users = users.filter(id=options['user'])
+
+        for user_id in users.values_list('id', flat=True):
+            lookup = UserCategoryLookup(user_id)
+            lookup.rebuild()
+            # Workers holding the old index must reload it.
+            reload_categorization_index(user_id)
+            self.stdout.write(f"User {user_id}: {len(lookup.index)} distinct narrations indexed.")
+
+        self.stdout.write(self.style.SUCCESS('Categorization indexes rebuilt.'))
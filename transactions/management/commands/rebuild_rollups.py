@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from transactions.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the daily transaction rollups from the Transaction table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, help='Only rebuild the rollups of this user id.')
+
+    def handle(self, *args, **options):
+        count = rebuild_rollups(user_id=options['user'])
+        scope = f"user {options['user']}" if options['user'] else 'all users'
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} daily rollup rows for {scope}."))
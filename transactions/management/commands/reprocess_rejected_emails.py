@@ -0,0 +1,44 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import Max, Min, Q
+from transactions.models import RejectedEmail
+from transactions.tasks import sync_user_transactions_task
+
+
+class Command(BaseCommand):
+    help = (
+        'Forgets rejected emails so the next sync fetches and classifies them again, '
+        'e.g. after a rejection rule was found to match genuine alerts.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, help='Only reprocess the rejected emails of this user id.')
+        parser.add_argument(
+            '--reason',
+            help="Only reprocess emails rejected for this reason, either in full ('login_alert:body', "
+                 "'no_transaction_signal') or by where it matched ('body').",
+        )
+        parser.add_argument('--sync', action='store_true', help='Queue a sync over the affected dates right away.')
+
+    def handle(self, *args, **options):
+        rejected = RejectedEmail.objects.all()
+        if options['user']:
+            rejected = rejected.filter(user_id=options['user'])
+        reason = options['reason']
+        if reason:
+            rejected = rejected.filter(Q(reason=reason) | Q(reason__endswith=f":{reason}"))
+
+        ranges = list(
+            rejected.filter(sent_date__isnull=False).values('user_id').annotate(start=Min('sent_date'), end=Max('sent_date'))
+        )
+        deleted, _ = rejected.delete()
+        self.stdout.write(self.style.SUCCESS(f"Forgot {deleted} rejected emails."))
+
+        if options['sync']:
+            for row in ranges:
+                # The Gmail 'before:' filter is exclusive, so the range ends a day later.
+                sync_user_transactions_task.delay(
+                    row['user_id'], row['start'].isoformat(), (row['end'] + timedelta(days=1)).isoformat()
+                )
+            self.stdout.write(self.style.SUCCESS(f"Queued a sync for {len(ranges)} users."))
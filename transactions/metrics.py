@@ -0,0 +1,235 @@
+import time
+import logging
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+# Counters are stored in the shared cache (Redis) so every Celery worker and
+# web process reads and writes the same numbers.
+KEY_PREFIX = 'metrics:email_pipeline'
+
+# The stages process_raw_email_task walks through, in order.
+PIPELINE_STAGES = (
+    'saved_parsers',
+    'parser_generation',
+    'ai_extraction',
+    'direct_prompt',
+    'regex_fallback',
+    'data_recovery',
+    'persistence',
+)
+
+# Final outcomes of an email, in addition to RawEmail.parsing_method values.
+PIPELINE_OUTCOMES = (
+    'dynamic_html_parser_success',
+    'ai_generated_parser_success',
+    'ai_fallback_success',
+    'ai_direct_prompt_fallback_success',
+    'regex_fallback_success',
+    'all_methods_failed',
+    'creation_failed_data_error',
+    'non_transactional_deleted',
+)
+
+# Histogram bucket upper bounds, in seconds.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+LLM_CALL_BUCKETS = (0, 1, 2, 3, 4, 5)
+
+# Endpoints served through transactions.response_cache, by their cache name.
+RESPONSE_CACHE_ENDPOINTS = (
+    'summary',
+    'spending_statistics',
+    'budget_suggestion',
+    'timeseries',
+)
+RESPONSE_CACHE_KEY_PREFIX = 'metrics:response_cache'
+
+
+def _key(*parts) -> str:
+    return ':'.join([KEY_PREFIX] + [str(part) for part in parts])
+
+
+def _incr(key: str, delta: int = 1):
+    """Increments a cache counter, creating it if needed. Never raises."""
+    try:
+        try:
+            cache.incr(key, delta)
+        except ValueError:
+            if not cache.add(key, delta, timeout=None):
+                cache.incr(key, delta)
+    except Exception as e:
+        logger.debug(f"Could not record metric {key}: {e}")
+
+
+def _bucket_for(value, buckets) -> str:
+    for bound in buckets:
+        if value <= bound:
+            return str(bound)
+    return '+Inf'
+
+
+def record_stage_latency(stage: str, seconds: float):
+    _incr(_key('stage', stage, 'bucket', _bucket_for(seconds, LATENCY_BUCKETS)))
+    _incr(_key('stage', stage, 'count'))
+    _incr(_key('stage', stage, 'sum_ms'), int(seconds * 1000))
+
+
+@contextmanager
+def stage_timer(stage: str):
+    """Times the wrapped block and records it as one observation of `stage`."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage_latency(stage, time.perf_counter() - started)
+
+
+def record_email_outcome(outcome: str, llm_calls: int = 0):
+    """Records the final outcome of one email and how many LLM calls it took."""
+    _incr(_key('outcome', outcome))
+    _incr(_key('llm_calls', 'bucket', _bucket_for(llm_calls, LLM_CALL_BUCKETS)))
+    _incr(_key('llm_calls', 'count'))
+    _incr(_key('llm_calls', 'sum'), llm_calls)
+
+
+def _response_cache_key(endpoint: str, result: str) -> str:
+    return f"{RESPONSE_CACHE_KEY_PREFIX}:{endpoint}:{result}"
+
+
+def record_response_cache(endpoint: str, hit: bool):
+    """Counts one lookup in the analytics response cache."""
+    _incr(_response_cache_key(endpoint, 'hit' if hit else 'miss'))
+
+
+def _histogram_keys(prefix_parts, buckets) -> List[str]:
+    keys = [_key(*prefix_parts, 'bucket', str(bound)) for bound in buckets]
+    keys.append(_key(*prefix_parts, 'bucket', '+Inf'))
+    return keys
+
+
+def _read_histogram(values: Dict[str, int], prefix_parts, buckets, sum_suffix='sum') -> Dict:
+    """Returns cumulative bucket counts plus count and sum for one histogram."""
+    cumulative = []
+    running = 0
+    for bound, key in zip(list(buckets) + ['+Inf'], _histogram_keys(prefix_parts, buckets)):
+        running += values.get(key, 0)
+        cumulative.append((bound, running))
+    return {
+        'buckets': cumulative,
+        'count': values.get(_key(*prefix_parts, 'count'), 0),
+        'sum': values.get(_key(*prefix_parts, sum_suffix), 0),
+    }
+
+
+def _all_keys() -> List[str]:
+    keys = []
+    for stage in PIPELINE_STAGES:
+        keys += _histogram_keys(('stage', stage), LATENCY_BUCKETS)
+        keys += [_key('stage', stage, 'count'), _key('stage', stage, 'sum_ms')]
+    keys += [_key('outcome', outcome) for outcome in PIPELINE_OUTCOMES]
+    keys += _histogram_keys(('llm_calls',), LLM_CALL_BUCKETS)
+    keys += [_key('llm_calls', 'count'), _key('llm_calls', 'sum')]
+    keys += [
+        _response_cache_key(endpoint, result)
+        for endpoint in RESPONSE_CACHE_ENDPOINTS for result in ('hit', 'miss')
+    ]
+    return keys
+
+
+def snapshot() -> Dict:
+    """Reads all stored counters in a single cache round trip."""
+    try:
+        values = cache.get_many(_all_keys())
+    except Exception as e:
+        logger.error(f"Could not read pipeline metrics: {e}")
+        values = {}
+
+    return {
+        'stages': {
+            stage: _read_histogram(values, ('stage', stage), LATENCY_BUCKETS, sum_suffix='sum_ms')
+            for stage in PIPELINE_STAGES
+        },
+        'outcomes': {outcome: values.get(_key('outcome', outcome), 0) for outcome in PIPELINE_OUTCOMES},
+        'llm_calls': _read_histogram(values, ('llm_calls',), LLM_CALL_BUCKETS),
+        'response_cache': {
+            endpoint: _read_response_cache(values, endpoint) for endpoint in RESPONSE_CACHE_ENDPOINTS
+        },
+    }
+
+
+def _read_response_cache(values: Dict[str, int], endpoint: str) -> Dict:
+    hits = values.get(_response_cache_key(endpoint, 'hit'), 0)
+    misses = values.get(_response_cache_key(endpoint, 'miss'), 0)
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': hits / (hits + misses) if hits + misses else None,
+    }
+
+
+def estimate_quantile(histogram: Dict, quantile: float) -> Optional[float]:
+    """Upper-bound estimate of a quantile from cumulative histogram buckets."""
+    total = histogram['count']
+    if not total:
+        return None
+    target = total * quantile
+    for bound, cumulative in histogram['buckets']:
+        if cumulative >= target:
+            return float('inf') if bound == '+Inf' else float(bound)
+    return None
+
+
+def render_prometheus() -> str:
+    """Renders the stored counters in the Prometheus text exposition format."""
+    data = snapshot()
+    lines = [
+        '# HELP email_pipeline_stage_seconds Time spent in each process_raw_email_task stage.',
+        '# TYPE email_pipeline_stage_seconds histogram',
+    ]
+    for stage, histogram in data['stages'].items():
+        for bound, cumulative in histogram['buckets']:
+            lines.append(f'email_pipeline_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+        lines.append(f'email_pipeline_stage_seconds_sum{{stage="{stage}"}} {histogram["sum"] / 1000:.3f}')
+        lines.append(f'email_pipeline_stage_seconds_count{{stage="{stage}"}} {histogram["count"]}')
+
+    lines += [
+        '# HELP email_pipeline_outcomes_total Processed emails by final parsing method.',
+        '# TYPE email_pipeline_outcomes_total counter',
+    ]
+    for outcome, count in data['outcomes'].items():
+        lines.append(f'email_pipeline_outcomes_total{{parsing_method="{outcome}"}} {count}')
+
+    histogram = data['llm_calls']
+    lines += [
+        '# HELP email_pipeline_llm_calls_per_email Number of LLM calls made while processing one email.',
+        '# TYPE email_pipeline_llm_calls_per_email histogram',
+    ]
+    for bound, cumulative in histogram['buckets']:
+        lines.append(f'email_pipeline_llm_calls_per_email_bucket{{le="{bound}"}} {cumulative}')
+    lines.append(f'email_pipeline_llm_calls_per_email_sum {histogram["sum"]}')
+    lines.append(f'email_pipeline_llm_calls_per_email_count {histogram["count"]}')
+
+    lines += [
+        '# HELP response_cache_requests_total Analytics response cache lookups by endpoint and result.',
+        '# TYPE response_cache_requests_total counter',
+    ]
+    for endpoint, counts in data['response_cache'].items():
+        lines.append(f'response_cache_requests_total{{endpoint="{endpoint}",result="hit"}} {counts["hits"]}')
+        lines.append(f'response_cache_requests_total{{endpoint="{endpoint}",result="miss"}} {counts["misses"]}')
+    lines += [
+        '# HELP response_cache_hit_ratio Share of analytics response cache lookups served from the cache.',
+        '# TYPE response_cache_hit_ratio gauge',
+    ]
+    for endpoint, counts in data['response_cache'].items():
+        if counts['hit_rate'] is not None:
+            lines.append(f'response_cache_hit_ratio{{endpoint="{endpoint}"}} {counts["hit_rate"]:.4f}')
+
+    return '\n'.join(lines) + '\n'
+
+
+def reset():
+    """Deletes every stored pipeline and response cache counter."""
+    cache.delete_many(_all_keys())
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.1 on 2026-10-19 09:00
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("transactions", "0016_bank"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RejectedEmail",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("email_id", models.CharField(max_length=255)),
+                ("bank_name", models.CharField(blank=True, max_length=100, null=True)),
+                ("sender", models.CharField(blank=True, default="", max_length=255)),
+                ("subject", models.CharField(blank=True, default="", max_length=255)),
+                ("reason", models.CharField(max_length=100)),
+                ("sent_date", models.DateTimeField(blank=True, null=True)),
+                ("rejected_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("user", "email_id")},
+            },
+        ),
+    ]
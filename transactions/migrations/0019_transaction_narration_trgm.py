@@ -0,0 +1,26 @@
+# Generated by Django 5.2.1 on 2026-10-19 12:00
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import AddIndexConcurrently, TrigramExtension
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction.
+    atomic = False
+
+    dependencies = [
+        ("transactions", "0018_usercategorizationindex_categorizationindexentry"),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        AddIndexConcurrently(
+            model_name="transaction",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["narration"],
+                name="transaction_narration_trgm",
+                opclasses=["gin_trgm_ops"],
+            ),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.1 on 2026-10-19 13:00
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("transactions", "0019_transaction_narration_trgm"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="transaction",
+            name="created_at",
+            field=models.DateTimeField(
+                auto_now_add=True, default=django.utils.timezone.now
+            ),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="transaction",
+            name="categorization_attempts",
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="transaction",
+            name="next_categorization_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.1 on 2026-10-19 14:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("transactions", "0020_transaction_categorization_attempts"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MerchantCategory",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("merchant_key", models.CharField(max_length=255, unique=True)),
+                ("confidence", models.FloatField()),
+                ("user_count", models.PositiveIntegerField()),
+                ("votes", models.JSONField(default=dict)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "category",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="transactions.transactioncategory",
+                    ),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,103 @@
+# Generated by Django 5.2.1 on 2026-10-19 15:00
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def build_rollups(apps, schema_editor):
+    from django.db.models import Count, Sum
+    from django.db.models.functions import TruncDate
+
+    Transaction = apps.get_model("transactions", "Transaction")
+    DailyTransactionRollup = apps.get_model("transactions", "DailyTransactionRollup")
+    rows = (
+        Transaction.objects.annotate(day=TruncDate("date"))
+        .values("user_id", "day", "category_id", "transaction_type", "bank_name")
+        .annotate(total_amount=Sum("amount"), transaction_count=Count("id"))
+        .order_by()
+    )
+    DailyTransactionRollup.objects.bulk_create(
+        (
+            DailyTransactionRollup(
+                user_id=row["user_id"],
+                day=row["day"],
+                category_id=row["category_id"],
+                transaction_type=row["transaction_type"],
+                bank_name=row["bank_name"] or "",
+                total_amount=row["total_amount"],
+                transaction_count=row["transaction_count"],
+            )
+            for row in rows.iterator(chunk_size=5000)
+        ),
+        batch_size=5000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("transactions", "0021_merchantcategory"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DailyTransactionRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField()),
+                (
+                    "transaction_type",
+                    models.CharField(
+                        choices=[("debit", "Debit"), ("credit", "Credit")],
+                        max_length=10,
+                    ),
+                ),
+                ("bank_name", models.CharField(blank=True, default="", max_length=100)),
+                (
+                    "total_amount",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=17),
+                ),
+                ("transaction_count", models.IntegerField(default=0)),
+                (
+                    "category",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="transactions.transactioncategory",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="daily_rollups",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(fields=["user", "day"], name="rollup_user_day_idx")
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("user", "day", "category", "transaction_type", "bank_name"),
+                        name="unique_daily_rollup",
+                        nulls_distinct=False,
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(build_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.1 on 2026-10-19 16:00
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction.
+    atomic = False
+
+    dependencies = [
+        ("transactions", "0022_dailytransactionrollup"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="transaction",
+            index=models.Index(
+                fields=["user", "-date", "-id"], name="transaction_user_date_id_idx"
+            ),
+        ),
+    ]
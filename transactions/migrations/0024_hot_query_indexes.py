@@ -0,0 +1,54 @@
+# Generated by Django 5.2.1 on 2026-10-19 17:00
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction.
+    atomic = False
+
+    dependencies = [
+        ("transactions", "0023_transaction_user_date_id_idx"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="transaction",
+            index=models.Index(
+                fields=["user", "transaction_type", "date"],
+                name="transaction_user_type_date_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="transaction",
+            index=models.Index(
+                fields=["user", "category"], name="transaction_user_category_idx"
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="transaction",
+            index=models.Index(
+                condition=models.Q(
+                    ("category__isnull", True), ("next_categorization_at__isnull", False)
+                ),
+                fields=["next_categorization_at"],
+                name="transaction_retry_due_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="rawemail",
+            index=models.Index(
+                fields=["user", "parsed", "parsing_method"],
+                name="rawemail_user_parsed_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="rawemail",
+            index=models.Index(
+                condition=models.Q(("parsed", False)),
+                fields=["user"],
+                name="rawemail_unparsed_idx",
+            ),
+        ),
+    ]
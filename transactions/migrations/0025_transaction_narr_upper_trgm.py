@@ -0,0 +1,27 @@
+# Generated by Django 5.2.1 on 2026-10-19 18:00
+
+import django.contrib.postgres.indexes
+import django.db.models.functions.text
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction.
+    atomic = False
+
+    dependencies = [
+        ("transactions", "0024_hot_query_indexes"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="transaction",
+            index=django.contrib.postgres.indexes.GinIndex(
+                django.contrib.postgres.indexes.OpClass(
+                    django.db.models.functions.text.Upper("narration"), name="gin_trgm_ops"
+                ),
+                name="transaction_narr_upper_trgm",
+            ),
+        ),
+    ]
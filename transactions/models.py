@@ -1,6 +1,9 @@
 import uuid
-from django.db import models
+from django.db import models, transaction as db_transaction
 from django.conf import settings
+from django.utils import timezone
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.db.models.functions import Upper
 
 TRANSACTION_TYPES = (
     ('debit', 'Debit'),
@@ -50,15 +53,106 @@ class Transaction(models.Model):
     receipt_items = models.JSONField(null=True, blank=True) # For receipt uploads
     is_manually_categorized = models.BooleanField(default=False)
     narration_cleaned = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Failed categorization attempts and when the next one is due (null = whenever).
+    categorization_attempts = models.PositiveSmallIntegerField(default=0)
+    next_categorization_at = models.DateTimeField(null=True, blank=True)
 
     class Meta:
         # This uniqueness constraint is key to preventing duplicates
         unique_together = ('user', 'amount', 'date', 'transaction_type')
         ordering = ['-date']
+        indexes = [
+            # Serves pg_trgm similarity lookups on narration, e.g. during reconciliation.
+            GinIndex(fields=['narration'], opclasses=['gin_trgm_ops'], name='transaction_narration_trgm'),
+            # Serves narration__icontains, which Django compiles to UPPER(narration) LIKE UPPER(...).
+            GinIndex(OpClass(Upper('narration'), name='gin_trgm_ops'), name='transaction_narr_upper_trgm'),
+            # Serves the keyset pagination of TransactionListView, and any (user, -date) listing.
+            models.Index(fields=['user', '-date', '-id'], name='transaction_user_date_id_idx'),
+            # Date-ranged debit/credit aggregates.
+            models.Index(fields=['user', 'transaction_type', 'date'], name='transaction_user_type_date_idx'),
+            # Transactions of one category, and the uncategorized backlog (category IS NULL).
+            models.Index(fields=['user', 'category'], name='transaction_user_category_idx'),
+            # Failed categorizations whose backoff expires, for retry_due_categorizations_task.
+            models.Index(
+                fields=['next_categorization_at'], name='transaction_retry_due_idx',
+                condition=models.Q(category__isnull=True, next_categorization_at__isnull=False),
+            ),
+        ]
 
     def __str__(self):
         return f"{self.transaction_type.capitalize()} of ₦{self.amount} on {self.date}"
 
+    def requeue_for_categorization(self):
+        """
+        Marks a transaction that lost its category as due for categorization.
+        Incremental runs only look at rows created after their checkpoint, or
+        rows whose next_categorization_at has passed.
+        """
+        self.next_categorization_at = timezone.now()
+        self.categorization_attempts = 0
+
+    def save(self, *args, **kwargs):
+        """
+        Saves the transaction and moves its amount between daily rollups in the
+        same DB transaction. Either way the user's cached analytics are invalidated.
+        A transaction whose category is cleared is requeued for categorization.
+        """
+        from .response_cache import bump_data_version
+        from .rollups import ROLLUP_FIELDS, apply_rollup_change
+
+        update_fields = kwargs.get('update_fields')
+        # update_fields may name 'category' or 'user'; ROLLUP_FIELDS holds attnames.
+        if update_fields is not None and not {
+            self._meta.get_field(field).attname for field in update_fields
+        } & set(ROLLUP_FIELDS):
+            super().save(*args, **kwargs)
+            bump_data_version([self.user_id])
+            return
+
+        with db_transaction.atomic():
+            before = None
+            if not self._state.adding and self.pk:
+                before = Transaction.objects.filter(pk=self.pk).values(*ROLLUP_FIELDS).first()
+            if before and before['category_id'] is not None and self.category_id is None:
+                self.requeue_for_categorization()
+                if update_fields is not None:
+                    kwargs['update_fields'] = set(update_fields) | {'next_categorization_at', 'categorization_attempts'}
+            super().save(*args, **kwargs)
+            apply_rollup_change(before, self)
+            # Covers saves that change no rollup field, e.g. only the narration.
+            bump_data_version([self.user_id])
+
+
+class DailyTransactionRollup(models.Model):
+    """
+    Pre-aggregated totals of a user's transactions per day, category,
+    transaction type and bank. Kept in step with Transaction writes by
+    transactions.rollups and rebuildable with the rebuild_rollups command.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="daily_rollups")
+    day = models.DateField()
+    category = models.ForeignKey(TransactionCategory, null=True, blank=True, on_delete=models.CASCADE)
+    transaction_type = models.CharField(choices=TRANSACTION_TYPES, max_length=10)
+    bank_name = models.CharField(max_length=100, blank=True, default='')
+    total_amount = models.DecimalField(max_digits=17, decimal_places=2, default=0)
+    transaction_count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'day', 'category', 'transaction_type', 'bank_name'],
+                name='unique_daily_rollup',
+                nulls_distinct=False,
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'day'], name='rollup_user_day_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user} {self.day} {self.transaction_type}: ₦{self.total_amount} ({self.transaction_count})"
+
 
 class Budget(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="budgets")
@@ -124,17 +218,88 @@ class RawEmail(models.Model):
 
     class Meta:
         unique_together = ('user', 'email_id')
+        indexes = [
+            # Reprocessing looks up a user's emails by parse status and method.
+            models.Index(fields=['user', 'parsed', 'parsing_method'], name='rawemail_user_parsed_idx'),
+            # Unparsed emails are a small fraction of the table.
+            models.Index(fields=['user'], name='rawemail_unparsed_idx', condition=models.Q(parsed=False)),
+        ]
 
     def __str__(self):
         return f"RawEmail {self.email_id} for {self.user}"
 
 
+class RejectedEmail(models.Model):
+    """Records emails the pre-classifier discarded at ingestion, and why."""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    email_id = models.CharField(max_length=255)
+    bank_name = models.CharField(max_length=100, null=True, blank=True)
+    sender = models.CharField(max_length=255, blank=True, default='')
+    subject = models.CharField(max_length=255, blank=True, default='')
+    reason = models.CharField(max_length=100)
+    sent_date = models.DateTimeField(null=True, blank=True)
+    rejected_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('user', 'email_id')
+
+    def __str__(self):
+        return f"RejectedEmail {self.email_id} ({self.reason})"
+
+
 
 class UserTransactionCategorizationState(models.Model):
+    """Checkpoint of categorize_transactions_for_user: created_at of the newest transaction it examined."""
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     last_processed_date = models.DateTimeField(null=True, blank=True)
 
 
+class UserCategorizationIndex(models.Model):
+    """
+    A serialized snapshot of a user's similarity index: the distinct
+    narrations, their category labels and their vectors. `version` is the id
+    of the last CategorizationIndexEntry folded into the snapshot.
+    """
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="categorization_index")
+    version = models.BigIntegerField(default=0)
+    vectorizer_signature = models.CharField(max_length=50)
+    narrations = models.JSONField(default=list)
+    labels = models.JSONField(default=list)
+    vectors = models.BinaryField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Categorization index for {self.user} ({len(self.labels)} narrations, v{self.version})"
+
+
+class CategorizationIndexEntry(models.Model):
+    """A categorization or correction not yet folded into the user's index snapshot."""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="categorization_index_entries")
+    narration = models.TextField()
+    category_name = models.CharField(max_length=100)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['id']
+
+
+
+class MerchantCategory(models.Model):
+    """
+    A shared, anonymous merchant catalogue entry: a canonical merchant key and
+    the category most users put it in. Only aggregate vote counts are kept,
+    never users or raw narrations.
+    """
+    merchant_key = models.CharField(max_length=255, unique=True)
+    category = models.ForeignKey(TransactionCategory, on_delete=models.CASCADE)
+    confidence = models.FloatField()
+    user_count = models.PositiveIntegerField()
+    votes = models.JSONField(default=dict)  # category name -> number of distinct users
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.merchant_key} -> {self.category.name} ({self.confidence:.0%} of {self.user_count} users)"
+
 
 class ItemPurchaseFrequency(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
@@ -6,7 +6,6 @@ import matplotlib.pyplot as plt
 import numpy as np
 from datetime import timedelta
 
-from django.db.models import Sum
 from django.utils import timezone
 from datetime import timedelta, datetime
 
@@ -17,6 +16,7 @@ from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, Tabl
 from reportlab.lib.units import inch
 
 from .models import Transaction
+from . import analytics
 
 class PDFReportGenerator:
     """
@@ -55,14 +55,19 @@ class PDFReportGenerator:
         
         transactions = Transaction.objects.filter(user=self.user, date__range=[self.start_date, self.end_date])
         debits = transactions.filter(transaction_type='debit')
-        credits = transactions.filter(transaction_type='credit')
-        
-        total_spent = debits.aggregate(Sum('amount'))['amount__sum'] or 0
-        total_earned = credits.aggregate(Sum('amount'))['amount__sum'] or 0
+
+        # Totals and the category breakdown come from one rollup query; only
+        # the debit table reads raw rows.
+        report = analytics.period_report(self.user, *self._days(self.start_date, self.end_date))
+        total_spent = report['debit']['total_amount']
+        total_earned = report['credit']['total_amount']
         
         self._add_summary_dashboard(total_earned, total_spent)
         
-        spending_by_category = debits.values('category__name').annotate(total=Sum('amount')).order_by('-total')
+        spending_by_category = [
+            {'category__name': row['category_name'], 'total': row['debit_total']}
+            for row in report['categories'] if row['debit_count']
+        ]
         if spending_by_category:
             self._add_spending_chart(spending_by_category, total_spent)
         
@@ -74,6 +79,10 @@ class PDFReportGenerator:
         buffer.seek(0)
         return buffer
 
+    def _days(self, start, end):
+        """The local dates of two datetimes, for the day-based rollup queries."""
+        return timezone.localtime(start).date(), timezone.localtime(end).date()
+
     def _add_header(self):
         self.story.append(Paragraph("Your Financial Report", self.styles['h1']))
         self.story.append(Paragraph(f"For {self.start_date.strftime('%B %d, %Y')} to {self.end_date.strftime('%B %d, %Y')}", self.styles['h3']))
@@ -162,13 +171,11 @@ class PDFReportGenerator:
         # 1. Get 90-day spending data for trend analysis
         historical_days = 90
         historical_start_date = self.end_date - timedelta(days=historical_days)
-        spending_90_days = Transaction.objects.filter(
-            user=self.user, transaction_type='debit', date__range=[historical_start_date, self.end_date]
-        ).values('category__name').annotate(total=Sum('amount'))
+        spending_90_days = analytics.category_breakdown(self.user, *self._days(historical_start_date, self.end_date))
         
         # 2. THE FIX: Create a more precise lookup for 30-day average spend
         avg_monthly_spend_90_days = {
-            item['category__name']: ((item['total'] or 0) / historical_days) * 30
+            item['category_name']: (item['debit_total'] / historical_days) * 30
             for item in spending_90_days
         }
 
@@ -0,0 +1,132 @@
+"""
+Caches the responses of read-only analytics endpoints per user.
+
+A response is keyed by (endpoint, user, normalized query parameters, the
+user's data version, the global category version, today's date). The data
+version is a counter bumped whenever one of the user's transactions is
+written, so a cached response is never served after the data behind it
+changed; there is no TTL to tune. The category version covers renaming or
+deleting a shared TransactionCategory, and the date covers endpoints whose
+default range is relative to today.
+"""
+import hashlib
+import logging
+from functools import wraps
+from typing import Iterable
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction as db_transaction
+from django.utils import timezone
+from rest_framework.response import Response
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'response_cache'
+
+# Safety net only: entries are normally invalidated by a version bump.
+DEFAULT_TIMEOUT = getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 60 * 60 * 24)
+
+
+def _data_version_key(user_id) -> str:
+    return f"{KEY_PREFIX}:data_version:{user_id}"
+
+
+_CATEGORY_VERSION_KEY = f"{KEY_PREFIX}:category_version"
+
+
+def _incr(key: str):
+    try:
+        try:
+            cache.incr(key)
+        except ValueError:
+            if not cache.add(key, 1, timeout=None):
+                cache.incr(key)
+    except Exception as e:
+        logger.debug(f"Could not bump response cache version {key}: {e}")
+
+
+def bump_data_version(user_ids: Iterable):
+    """
+    Invalidates the cached responses of the given users once the current DB
+    transaction commits. Bumping before the commit would let a concurrent
+    request cache the old data under the new version.
+    """
+    keys = {_data_version_key(user_id) for user_id in user_ids if user_id is not None}
+    if not keys:
+        return
+
+    def bump():
+        for key in keys:
+            _incr(key)
+
+    db_transaction.on_commit(bump)
+
+
+def bump_category_version():
+    """Invalidates every user's cached responses, e.g. after a category is renamed."""
+    db_transaction.on_commit(lambda: _incr(_CATEGORY_VERSION_KEY))
+
+
+def normalize_params(query_params) -> str:
+    """Query parameters in a canonical order, with empty values dropped."""
+    items = sorted(
+        (name, value)
+        for name in query_params
+        for value in query_params.getlist(name)
+        if value != ''
+    )
+    return '&'.join(f"{name}={value}" for name, value in items)
+
+
+def cache_key(endpoint: str, user_id, query_params):
+    """Returns the response cache key, or None when the versions cannot be read."""
+    try:
+        versions = cache.get_many([_data_version_key(user_id), _CATEGORY_VERSION_KEY])
+    except Exception as e:
+        logger.debug(f"Could not read response cache versions for user {user_id}: {e}")
+        return None
+    params = hashlib.sha1(normalize_params(query_params).encode('utf-8')).hexdigest()
+    return ':'.join([
+        KEY_PREFIX, endpoint, str(user_id),
+        f"v{versions.get(_data_version_key(user_id), 0)}.{versions.get(_CATEGORY_VERSION_KEY, 0)}",
+        timezone.localdate().isoformat(), params,
+    ])
+
+
+def cached_response(endpoint: str, timeout: int = DEFAULT_TIMEOUT):
+    """
+    Decorates an APIView get() so its response is served from the cache for
+    as long as the user's data is unchanged. Only 200 and 404 responses are
+    cached; anything else, and every request when the cache is unavailable,
+    goes straight to the view.
+    """
+    def decorator(view_method):
+        @wraps(view_method)
+        def wrapper(view, request, *args, **kwargs):
+            key = cache_key(endpoint, request.user.id, request.query_params)
+            if key is None:
+                return view_method(view, request, *args, **kwargs)
+
+            try:
+                cached = cache.get(key)
+            except Exception as e:
+                logger.debug(f"Could not read cached response {key}: {e}")
+                cached = None
+            if cached is not None:
+                metrics.record_response_cache(endpoint, hit=True)
+                status, data = cached
+                return Response(data, status=status)
+
+            metrics.record_response_cache(endpoint, hit=False)
+            response = view_method(view, request, *args, **kwargs)
+            if response.status_code in (200, 404):
+                try:
+                    cache.set(key, (response.status_code, response.data), timeout=timeout)
+                except Exception as e:
+                    logger.debug(f"Could not cache response {key}: {e}")
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,152 @@
+"""
+Maintains DailyTransactionRollup, the per-day aggregate of each user's
+transactions by category, type and bank that the analytics endpoints read.
+
+Every write path that changes a rollup field (amount, date, category,
+transaction type, bank or user) must move the transaction's contribution with
+apply_rollup_change / apply_rollup_changes inside the same DB transaction.
+Transaction.save does this automatically; bulk_update callers do it explicitly.
+"""
+import logging
+from collections import defaultdict
+from decimal import Decimal
+from typing import Dict, Iterable, Optional, Tuple
+
+from django.db import IntegrityError, transaction as db_transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import DailyTransactionRollup, Transaction
+from .response_cache import bump_data_version
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_FIELDS = ('user_id', 'date', 'category_id', 'transaction_type', 'bank_name', 'amount')
+
+RollupKey = Tuple[int, object, Optional[int], str, str]
+
+
+def _day(value):
+    if timezone.is_aware(value):
+        return timezone.localtime(value).date()
+    return value.date() if hasattr(value, 'date') else value
+
+
+def snapshot(tx) -> dict:
+    """The rollup fields of a Transaction instance, to pass as `before` once it is modified in memory."""
+    return {field: getattr(tx, field) for field in ROLLUP_FIELDS}
+
+
+def contribution(row) -> Optional[Tuple[RollupKey, Decimal]]:
+    """Returns (rollup key, amount) for a Transaction instance or a values() dict of ROLLUP_FIELDS."""
+    if row is None:
+        return None
+    get = row.get if isinstance(row, dict) else lambda field: getattr(row, field)
+    if get('date') is None or get('amount') is None:
+        return None
+    key = (get('user_id'), _day(get('date')), get('category_id'), get('transaction_type'), get('bank_name') or '')
+    return key, Decimal(get('amount'))
+
+
+def apply_deltas(deltas: Dict[RollupKey, Tuple[Decimal, int]]):
+    """
+    Adds (amount, count) deltas to rollup rows, creating or deleting rows as
+    needed, and invalidates the cached analytics of every user touched.
+    """
+    changed_users = set()
+    with db_transaction.atomic():
+        for (user_id, day, category_id, transaction_type, bank_name), (amount, count) in deltas.items():
+            if not amount and not count:
+                continue
+            changed_users.add(user_id)
+            lookup = {
+                'user_id': user_id, 'day': day, 'category_id': category_id,
+                'transaction_type': transaction_type, 'bank_name': bank_name,
+            }
+            updated = DailyTransactionRollup.objects.filter(**lookup).update(
+                total_amount=F('total_amount') + amount, transaction_count=F('transaction_count') + count
+            )
+            if not updated:
+                try:
+                    with db_transaction.atomic():
+                        DailyTransactionRollup.objects.create(total_amount=amount, transaction_count=count, **lookup)
+                except IntegrityError:
+                    # Created concurrently by another writer; add to it instead.
+                    DailyTransactionRollup.objects.filter(**lookup).update(
+                        total_amount=F('total_amount') + amount, transaction_count=F('transaction_count') + count
+                    )
+            elif count < 0:
+                DailyTransactionRollup.objects.filter(transaction_count__lte=0, **lookup).delete()
+        bump_data_version(changed_users)
+
+
+def apply_rollup_changes(changes: Iterable[Tuple[object, object]]):
+    """
+    Moves each transaction's contribution from its old state to its new one.
+    Each change is (before, after), where either side may be None (created or
+    deleted) and each is a Transaction or a values() dict of ROLLUP_FIELDS.
+    """
+    deltas: Dict[RollupKey, list] = defaultdict(lambda: [Decimal('0'), 0])
+    for before, after in changes:
+        old, new = contribution(before), contribution(after)
+        if old == new:
+            continue
+        if old:
+            deltas[old[0]][0] -= old[1]
+            deltas[old[0]][1] -= 1
+        if new:
+            deltas[new[0]][0] += new[1]
+            deltas[new[0]][1] += 1
+    apply_deltas({key: tuple(value) for key, value in deltas.items()})
+
+
+def apply_rollup_change(before, after):
+    apply_rollup_changes([(before, after)])
+
+
+def rebuild_rollups(user_id=None) -> int:
+    """Recomputes rollups from the Transaction table, for one user or everyone. Returns the row count."""
+    transactions = Transaction.objects.all()
+    rollups = DailyTransactionRollup.objects.all()
+    if user_id is not None:
+        transactions = transactions.filter(user_id=user_id)
+        rollups = rollups.filter(user_id=user_id)
+
+    rows = transactions.annotate(day=TruncDate('date')).values(
+        'user_id', 'day', 'category_id', 'transaction_type', 'bank_name'
+    ).annotate(total_amount=Sum('amount'), transaction_count=Count('id')).order_by()
+
+    with db_transaction.atomic():
+        rollups.delete()
+        created = DailyTransactionRollup.objects.bulk_create(
+            (
+                DailyTransactionRollup(
+                    user_id=row['user_id'], day=row['day'], category_id=row['category_id'],
+                    transaction_type=row['transaction_type'], bank_name=row['bank_name'] or '',
+                    total_amount=row['total_amount'], transaction_count=row['transaction_count'],
+                )
+                for row in rows.iterator(chunk_size=5000)
+            ),
+            batch_size=5000,
+        )
+        bump_data_version(
+            [user_id] if user_id is not None else transactions.values_list('user_id', flat=True).distinct()
+        )
+    return len(created)
+
+
+def move_category_to_uncategorized(category_id):
+    """
+    Called before a TransactionCategory is deleted: its transactions become
+    uncategorized, so their totals move to the uncategorized rollups. The
+    category's own rollup rows are removed by the cascade.
+    """
+    deltas = {}
+    for row in DailyTransactionRollup.objects.filter(category_id=category_id).values(
+        'user_id', 'day', 'transaction_type', 'bank_name', 'total_amount', 'transaction_count'
+    ):
+        key = (row['user_id'], row['day'], None, row['transaction_type'], row['bank_name'])
+        amount, count = deltas.get(key, (Decimal('0'), 0))
+        deltas[key] = (amount + row['total_amount'], count + row['transaction_count'])
+    apply_deltas(deltas)
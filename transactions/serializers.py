@@ -39,6 +39,35 @@ class TransactionUpdateSerializer(serializers.ModelSerializer):
         fields = ['category']
 
 
+# Largest number of transactions one bulk update may change.
+MAX_BULK_UPDATE_SIZE = 1000
+
+
+class TransactionCategoryAssignmentSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    category = serializers.IntegerField(allow_null=True)
+
+
+class TransactionBulkUpdateSerializer(serializers.Serializer):
+    """
+    Validates a list of {"id": ..., "category": ...} pairs. Category ids are
+    checked with a single query rather than one lookup per item.
+    """
+    updates = TransactionCategoryAssignmentSerializer(many=True, allow_empty=False, max_length=MAX_BULK_UPDATE_SIZE)
+
+    def validate_updates(self, updates):
+        ids = [item['id'] for item in updates]
+        if len(set(ids)) != len(ids):
+            raise serializers.ValidationError("Each transaction may appear only once.")
+        category_ids = {item['category'] for item in updates if item['category'] is not None}
+        existing = set(TransactionCategory.objects.filter(id__in=category_ids).values_list('id', flat=True))
+        if category_ids - existing:
+            raise serializers.ValidationError(
+                f"Unknown categories: {', '.join(map(str, sorted(category_ids - existing)))}."
+            )
+        return updates
+
+
 
 class BudgetItemSerializer(serializers.ModelSerializer):
     category_name = serializers.CharField(source='category.name', read_only=True)
@@ -4,13 +4,17 @@ import logging
 import time
 from typing import Optional, Dict, Any, List
 
-from bs4 import BeautifulSoup
 from google.generativeai import GenerativeModel, configure as configure_google_ai
 from google.api_core.exceptions import GoogleAPIError
 from openai import OpenAI, APIError
 
+from .prompt_minimizer import PromptMinimizer, token_usage, unminimized_text
+
 logger = logging.getLogger(__name__)
 
+# Maximum number of distinct narrations sent in one batch categorization prompt.
+CATEGORIZATION_BATCH_SIZE = 40
+
 # --- AI Configuration ---
 GEMINI_CLIENTS = []
 for i in range(1, 4):
@@ -39,6 +43,7 @@ class AIService:
     """
     def __init__(self):
         self.gemini_client_index = 0
+        self.minimizer = PromptMinimizer()
 
     def _get_extraction_prompt(self) -> str:
         return """
@@ -70,8 +75,12 @@ If you cannot find a specific piece of information, set its value to null.
 If the email is not a transaction alert, return a JSON object with \"transaction_type\" set to null.
 """
 
-    def _parse_with_gemini(self, text_content: str, attempt: int = 1) -> Optional[Dict[str, Any]]:
-        """Attempts to parse transaction data using Google's Gemini."""
+    def _parse_with_gemini(self, text_content: str, attempt: int = 1, bank_name: Optional[str] = None,
+                           raw_input: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Attempts to parse transaction data using Google's Gemini. `raw_input` is
+        the unminimized email text, used only to count the tokens saved.
+        """
         if not GEMINI_CLIENTS:
             logger.warning("No Google Gemini clients available.")
             return None
@@ -81,6 +90,10 @@ If the email is not a transaction alert, return a JSON object with \"transaction
         try:
             full_prompt = self._get_extraction_prompt() + "\n\nEmail Content:\n" + text_content
             response = client.generate_content(full_prompt)
+            token_usage.record(
+                'extract_transaction', bank_name, full_prompt, response.text,
+                None if raw_input is None else self._get_extraction_prompt() + "\n\nEmail Content:\n" + raw_input,
+            )
             
             cleaned_response = response.text.strip().replace("```json", "").replace("```", "").strip()
             return json.loads(cleaned_response)
@@ -103,7 +116,8 @@ If the email is not a transaction alert, return a JSON object with \"transaction
             logger.error(f"An unexpected error occurred with Gemini client: {e}")
             return None
 
-    def _parse_with_openai(self, text_content: str) -> Optional[Dict[str, Any]]:
+    def _parse_with_openai(self, text_content: str, bank_name: Optional[str] = None,
+                           raw_input: Optional[str] = None) -> Optional[Dict[str, Any]]:
         """Attempts to parse transaction data using OpenAI's GPT-4o as a fallback."""
         if not OPENAI_CLIENT:
             logger.warning("OpenAI client not available.")
@@ -120,7 +134,13 @@ If the email is not a transaction alert, return a JSON object with \"transaction
                 ],
                 temperature=0.0,
             )
-            return json.loads(response.choices[0].message.content)
+            content = response.choices[0].message.content
+            token_usage.record(
+                'extract_transaction_openai', bank_name,
+                self._get_extraction_prompt() + text_content, content,
+                None if raw_input is None else self._get_extraction_prompt() + raw_input,
+            )
+            return json.loads(content)
         except APIError as e:
             logger.error(f"OpenAI API error: {e}")
             return None
@@ -128,29 +148,28 @@ If the email is not a transaction alert, return a JSON object with \"transaction
             logger.error(f"An unexpected error occurred with OpenAI client: {e}")
             return None
 
-    def extract_transaction_from_email(self, email_body: str) -> Optional[Dict[str, Any]]:
+    def extract_transaction_from_email(self, email_body: str, bank_name: Optional[str] = None) -> Optional[Dict[str, Any]]:
         """
         Parses raw email text to extract transaction details using Google Gemini,
         with a fallback to OpenAI's GPT-4o after 5 failed attempts.
         """
-        soup = BeautifulSoup(email_body, 'html.parser')
-        clean_text = ' '.join(soup.stripped_strings)
-        clean_text = ' '.join(clean_text.split())
+        clean_text = self.minimizer.minimize_text(email_body)
 
         if len(clean_text) < 40:
             logger.info("Skipping email processing: content too short.")
             return None
-        
+
+        raw_text = unminimized_text(email_body)
         for i in range(len(GEMINI_CLIENTS) * 2): # Try each key twice
-            parsed_data = self._parse_with_gemini(clean_text, attempt=i + 1)
+            parsed_data = self._parse_with_gemini(clean_text, attempt=i + 1, bank_name=bank_name, raw_input=raw_text)
             if parsed_data:
                 if parsed_data.get("error") == "API_KEY_INVALID":
                     logger.warning("Gemini API key is invalid, switching to OpenAI.")
-                    return self._parse_with_openai(clean_text)
+                    return self._parse_with_openai(clean_text, bank_name=bank_name, raw_input=raw_text)
                 return parsed_data
             time.sleep(5)
 
-        return self._parse_with_openai(clean_text)
+        return self._parse_with_openai(clean_text, bank_name=bank_name, raw_input=raw_text)
 
     def _get_categorization_prompt(self, narration: str, categories: List[str], examples: List[Dict]) -> str:
         """Generates a few-shot prompt for accurate categorization."""
@@ -183,6 +202,7 @@ Respond ONLY with the name of the category from the list. If no category is a go
         prompt = self._get_categorization_prompt(narration, categories, examples)
         try:
             response = client.generate_content(prompt)
+            token_usage.record('categorize_transaction', None, prompt, response.text)
             category = response.text.strip().strip('"')
             if category in categories:
                 return category
@@ -209,7 +229,85 @@ Respond ONLY with the name of the category from the list. If no category is a go
         category = self._categorize_with_gemini(narration, categories, examples)
         return category or "Unknown"
 
-    def recover_missing_data_from_text(self, text_block: str) -> Optional[Dict[str, Any]]:
+    def _get_batch_categorization_prompt(self, narrations: List[str], categories: List[str], examples: List[Dict]) -> str:
+        """Generates one few-shot prompt that categorizes several numbered narrations at once."""
+
+        example_str = "\n".join([f"- Narration: \"{ex['narration']}\" -> Category: \"{ex['category__name']}\"" for ex in examples])
+        items_str = "\n".join([f"{i}. \"{narration}\"" for i, narration in enumerate(narrations, start=1)])
+
+        return f"""
+You are an expert financial transaction categorizer. Your goal is to assign the most relevant category to each new transaction based on its narration and examples of past categorizations.
+
+**Available Categories:**
+{', '.join(categories)}
+
+**Examples of Previously Categorized Transactions:**
+{example_str if example_str else "No examples available."}
+
+**New Transactions to Categorize:**
+{items_str}
+
+Respond ONLY with a JSON object that maps every transaction number to the name of its category from the list, e.g. {{"1": "{categories[0] if categories else 'Unknown'}", "2": "Unknown"}}.
+If no category is a good fit for a transaction, use "Unknown".
+"""
+
+    def _categorize_batch_with_gemini(self, narrations: List[str], categories: List[str],
+                                      examples: List[Dict]) -> Optional[Dict[str, Any]]:
+        """Internal method to categorize a batch using Gemini. Returns the raw JSON map, keyed by item number."""
+        if not GEMINI_CLIENTS:
+            logger.warning("No Google Gemini clients available for categorization.")
+            return None
+
+        client = GEMINI_CLIENTS[self.gemini_client_index]
+        prompt = self._get_batch_categorization_prompt(narrations, categories, examples)
+        try:
+            response = client.generate_content(prompt)
+            token_usage.record('categorize_transactions_batch', None, prompt, response.text)
+            cleaned_response = response.text.strip().replace("```json", "").replace("```", "").strip()
+            result = json.loads(cleaned_response)
+            if not isinstance(result, dict):
+                logger.error(f"Batch categorization returned {type(result).__name__} instead of a JSON object.")
+                return None
+            return result
+        except (GoogleAPIError, ValueError) as e:
+            logger.error(f"Google Gemini API error during batch categorization: {e}")
+            return None
+        except Exception as e:
+            logger.error(f"Unexpected Gemini error during batch categorization: {e}")
+            return None
+
+    def categorize_transactions(self, narrations: List[str], categories: List[str], examples: List[Dict],
+                                batch_size: int = CATEGORIZATION_BATCH_SIZE) -> Dict[str, str]:
+        """
+        Categorizes many narrations with one prompt per batch of distinct
+        narrations, instead of one prompt per transaction.
+
+        Args:
+            narrations: The narrations to categorize. Identical ones are sent once.
+            categories: A list of possible category names.
+            examples: A list of dicts, with {{"narration": str, "category__name": str}}, for few-shot prompting.
+            batch_size: The maximum number of narrations per prompt.
+
+        Returns:
+            A dict mapping each narration to the name of its category. Answers that
+            are missing or not in `categories` become "Unknown".
+        """
+        canonical = {category.lower(): category for category in categories}
+        distinct = list(dict.fromkeys(narration for narration in narrations if narration))
+        results = {narration: "Unknown" for narration in narrations}
+
+        for start in range(0, len(distinct), batch_size):
+            batch = distinct[start:start + batch_size]
+            answers = self._categorize_batch_with_gemini(batch, categories, examples) or {}
+            for i, narration in enumerate(batch, start=1):
+                answer = answers.get(str(i))
+                category = canonical.get(answer.strip().strip('"').lower()) if isinstance(answer, str) else None
+                if category is None:
+                    logger.debug(f"Batch categorization gave no valid category for \"{narration}\": {answer!r}")
+                results[narration] = category or "Unknown"
+        return results
+
+    def recover_missing_data_from_text(self, text_block: str, bank_name: Optional[str] = None) -> Optional[Dict[str, Any]]:
         """
         Takes a jumbled block of text from a failed parse and attempts
         to recover the essential transaction details from it.
@@ -245,13 +343,14 @@ Respond ONLY with a valid JSON object containing the keys you were able to find.
             
             client = GEMINI_CLIENTS[self.gemini_client_index]
             response = client.generate_content(prompt)
+            token_usage.record('recover_missing_data', bank_name, prompt, response.text)
             cleaned_response = response.text.strip().replace("```json", "").replace("```", "").strip()
             return json.loads(cleaned_response)
         except GoogleAPIError as e:
             if "429" in str(e):
                 logger.warning("Gemini API rate limit hit during data recovery. Waiting 60 seconds before retrying...")
                 time.sleep(60)
-                return self.recover_missing_data_from_text(text_block)
+                return self.recover_missing_data_from_text(text_block, bank_name=bank_name)
             logger.error(f"Google Gemini API error during data recovery: {e}")
             return None
         except ValueError as e:
@@ -303,10 +402,13 @@ If you cannot find a specific piece of information, set its value to null.
             logger.error(f"An unexpected error occurred during receipt processing: {e}")
             return None
 
-    def generate_parser_function(self, email_html: str) -> Optional[str]:
+    def generate_parser_function(self, email_html: str, bank_name: Optional[str] = None) -> Optional[str]:
         """
         Uses Gemini to write a Python function that can parse the given email HTML.
+        Scripts, styles and comments are stripped from the HTML first; its
+        structure is kept, since the parser will run on the original email.
         """
+        minimized_html = self.minimizer.minimize_html(email_html)
         prompt = f"""
 You are an expert Python programmer specializing in web scraping with BeautifulSoup.
 Your task is to write a single Python function named `parse_email` that takes a BeautifulSoup `soup` object as input.
@@ -329,7 +431,7 @@ Your function will be executed in a restricted scope where only the following mo
 
 Here is the HTML to parse:
 ```html
-{email_html}
+{minimized_html}
 ```
 
 Respond ONLY with the complete, raw Python code for the function. Do not add comments, explanations, or example usage.
@@ -341,23 +443,25 @@ Respond ONLY with the complete, raw Python code for the function. Do not add com
             
             client = GEMINI_CLIENTS[self.gemini_client_index]
             response = client.generate_content(prompt)
+            token_usage.record(
+                'generate_parser_function', bank_name, prompt, response.text, prompt.replace(minimized_html, email_html, 1)
+            )
             return response.text.strip().strip('`').strip('python').strip()
         except Exception as e:
             logger.error(f"Gemini parser generation failed: {e}")
             return None
 
-    def extract_transaction_from_email_with_direct_prompt(self, email_body: str) -> Optional[Dict[str, Any]]:
+    def extract_transaction_from_email_with_direct_prompt(self, email_body: str, bank_name: Optional[str] = None) -> Optional[Dict[str, Any]]:
         """
-        Sends the entire email body to the AI and asks it to extract the transaction details
+        Sends the minimized email body to the AI and asks it to extract the transaction details
         in a specific format. This is a fallback when other parsing methods fail.
         """
-        soup = BeautifulSoup(email_body, 'html.parser')
-        clean_text = ' '.join(soup.stripped_strings)
-        clean_text = ' '.join(clean_text.split())
+        clean_text = self.minimizer.minimize_text(email_body)
 
         if len(clean_text) < 40:
             logger.info("Skipping email processing: content too short.")
             return None
+        raw_text = unminimized_text(email_body)
 
         prompt = f"""
 You are an expert financial data extraction API. You will be given the text content of a bank transaction email.
@@ -384,6 +488,10 @@ Respond ONLY with a valid JSON object containing the keys you were able to find.
                 client = GEMINI_CLIENTS[self.gemini_client_index]
                 logger.info(f"Attempting direct AI extraction with Google Gemini (Key {self.gemini_client_index + 1}, Attempt {i + 1})...")
                 response = client.generate_content(prompt)
+                token_usage.record(
+                    'extract_transaction_direct', bank_name, prompt, response.text,
+                    prompt.replace(clean_text, raw_text, 1),
+                )
                 cleaned_response = response.text.strip().replace("```json", "").replace("```", "").strip()
                 return json.loads(cleaned_response)
             except GoogleAPIError as e:
@@ -399,4 +507,4 @@ Respond ONLY with a valid JSON object containing the keys you were able to find.
             except Exception as e:
                 logger.error(f"An unexpected error occurred with Gemini client: {e}")
         
-        return self._parse_with_openai(clean_text)
+        return self._parse_with_openai(clean_text, bank_name=bank_name, raw_input=raw_text)
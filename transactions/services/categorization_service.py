@@ -0,0 +1,488 @@
+import logging
+import threading
+from collections import deque
+from datetime import timedelta
+from typing import Optional, List, Dict, Tuple, Iterable
+
+from cachetools import LRUCache
+from django.core.cache import cache
+from django.db import IntegrityError, transaction as db_transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from transactions.models import (
+    Transaction, TransactionCategory, UserCategorizationIndex, CategorizationIndexEntry
+)
+from transactions.rollups import ROLLUP_FIELDS, apply_rollup_changes
+from .ai_service import AIService
+from .keyword_rules import get_user_rules
+from .merchant_catalogue import get_merchant_catalogue
+from .narration_normalizer import merchant_key
+from .narration_similarity import NarrationIndex, NarrationVectorizer
+
+logger = logging.getLogger(__name__)
+
+# Minimum cosine similarity (character n-grams) for reusing a past category.
+# Cosine scores run lower than the difflib ratios the old 0.85 cut-off was set
+# for; 0.74 agrees best with difflib above 0.85 (about 96% of decisions, see
+# `benchmark_similarity --calibrate`).
+SIMILARITY_THRESHOLD = 0.74
+AI_EXAMPLE_COUNT = 10
+
+# How many users' lookups a single worker process keeps in memory.
+MAX_CACHED_USERS = 256
+
+# Entries applied on top of a stored snapshot before it is rewritten.
+SNAPSHOT_COMPACT_ENTRIES = 500
+
+# Retry schedule for transactions the LLM could not categorize. After the last
+# attempt they are assigned "Unknown".
+MAX_CATEGORIZATION_ATTEMPTS = 5
+CATEGORIZATION_RETRY_BASE = timedelta(hours=1)
+CATEGORIZATION_RETRY_MAX_DELAY = timedelta(days=7)
+
+
+def _version_key(user_id) -> str:
+    return f"categorization:version:{user_id}"
+
+
+def _generation_key(user_id) -> str:
+    return f"categorization:generation:{user_id}"
+
+
+def get_index_generation(user_id) -> int:
+    try:
+        return cache.get(_generation_key(user_id), 0)
+    except Exception as e:
+        logger.debug(f"Could not read categorization index generation for user {user_id}: {e}")
+        return 0
+
+
+def get_categorization_version(user_id) -> int:
+    try:
+        return cache.get(_version_key(user_id), 0)
+    except Exception as e:
+        logger.debug(f"Could not read categorization version for user {user_id}: {e}")
+        return 0
+
+
+def bump_categorization_version(user_id):
+    """
+    Tells every worker that new categorization entries exist for this user,
+    so their in-memory lookups sync before the next match.
+    """
+    key = _version_key(user_id)
+    try:
+        try:
+            cache.incr(key)
+        except ValueError:
+            if not cache.add(key, 1, timeout=None):
+                cache.incr(key)
+    except Exception as e:
+        logger.debug(f"Could not bump categorization version for user {user_id}: {e}")
+
+
+def reload_categorization_index(user_id):
+    """
+    Makes every worker reload the user's stored snapshot instead of only
+    applying new entries. Call this after the snapshot was rebuilt.
+    """
+    try:
+        cache.set(_generation_key(user_id), get_index_generation(user_id) + 1, timeout=None)
+    except Exception as e:
+        logger.debug(f"Could not bump categorization index generation for user {user_id}: {e}")
+    bump_categorization_version(user_id)
+
+
+def record_categorizations(user_id, pairs: Iterable[Tuple[str, str]]):
+    """
+    Stores (narration, category name) pairs, e.g. new categorizations, manual
+    corrections or reconciliation updates, so that every worker's lookup and
+    the persisted index pick them up incrementally.
+    """
+    entries = [
+        CategorizationIndexEntry(user_id=user_id, narration=narration, category_name=category_name)
+        for narration, category_name in pairs
+        if narration and category_name and category_name != "Unknown"
+    ]
+    if entries:
+        CategorizationIndexEntry.objects.bulk_create(entries)
+        bump_categorization_version(user_id)
+
+
+class UserCategoryLookup:
+    """
+    An in-memory view of one user's categorized narrations. It is loaded once
+    per worker from the persisted UserCategorizationIndex snapshot and then
+    kept current by applying the CategorizationIndexEntry rows recorded since,
+    so only new data is ever vectorized.
+    """
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.version = None
+        self.generation = None
+        self.watermark = 0
+        self.unfolded = 0
+        self.index = NarrationIndex()
+        self.merchant_categories: Dict[str, str] = {}
+        self.recent = deque(maxlen=AI_EXAMPLE_COUNT)
+
+    def load(self):
+        """Loads the stored snapshot, rebuilding it if it is missing or unreadable, then syncs."""
+        self.generation = get_index_generation(self.user_id)
+        snapshot = UserCategorizationIndex.objects.filter(user_id=self.user_id).first()
+        vectorizer = NarrationVectorizer()
+        index = None
+        if snapshot and snapshot.vectorizer_signature == vectorizer.signature:
+            try:
+                index = NarrationIndex.from_snapshot(snapshot.narrations, snapshot.labels, snapshot.vectors, vectorizer)
+            except (ValueError, OSError) as e:
+                logger.warning(f"Discarding unreadable categorization index for user {self.user_id}: {e}")
+
+        if index is None:
+            self.rebuild()
+        else:
+            self.index = index
+            self.merchant_categories = {}
+            for narration, category_name in zip(snapshot.narrations, snapshot.labels):
+                key = merchant_key(narration)
+                if key:
+                    self.merchant_categories[key] = category_name
+            self.watermark = snapshot.version
+            self.unfolded = 0
+            self.recent = deque(
+                ({'narration': n, 'category__name': c} for n, c in zip(snapshot.narrations, snapshot.labels)),
+                maxlen=AI_EXAMPLE_COUNT,
+            )
+            logger.info(f"Loaded categorization index for user {self.user_id} with {len(index)} distinct narrations.")
+        self.sync()
+
+    def rebuild(self):
+        """Vectorizes the user's whole categorized history and stores it as a new snapshot."""
+        stored_version = UserCategorizationIndex.objects.filter(user_id=self.user_id).values_list('version', flat=True).first()
+        latest_entry = CategorizationIndexEntry.objects.filter(user_id=self.user_id).aggregate(Max('id'))['id__max']
+        self.watermark = max(stored_version or 0, latest_entry or 0)
+        self.index = NarrationIndex()
+        self.merchant_categories = {}
+        self.recent = deque(maxlen=AI_EXAMPLE_COUNT)
+        rows = Transaction.objects.filter(
+            user_id=self.user_id,
+            category__isnull=False
+        ).exclude(category__name="Unknown").order_by('date').values('narration', 'category__name')
+        for row in rows.iterator(chunk_size=2000):
+            self.add(row['narration'], row['category__name'])
+        logger.info(f"Built categorization index for user {self.user_id} with {len(self.index)} distinct narrations.")
+        self.save_snapshot()
+
+    def sync(self):
+        """Applies the entries recorded by any worker since this lookup last synced."""
+        # Read the version first so a write racing with this query triggers another sync.
+        self.version = get_categorization_version(self.user_id)
+        entries = CategorizationIndexEntry.objects.filter(
+            user_id=self.user_id, id__gt=self.watermark
+        ).values_list('id', 'narration', 'category_name')
+        for entry_id, narration, category_name in entries:
+            self.add(narration, category_name)
+            self.watermark = entry_id
+            self.unfolded += 1
+        if self.unfolded >= SNAPSHOT_COMPACT_ENTRIES:
+            self.save_snapshot()
+
+    def save_snapshot(self):
+        """
+        Persists the index and deletes the entries it now includes. A snapshot
+        is never replaced by an older one written concurrently by another worker.
+        Workers whose lookups are behind can no longer sync the deleted entries,
+        so deleting any makes every worker reload the snapshot instead.
+        """
+        fields = {
+            'version': self.watermark,
+            'vectorizer_signature': self.index.vectorizer.signature,
+            'narrations': self.index.narrations(),
+            'labels': list(self.index.labels),
+            'vectors': self.index.to_bytes(),
+        }
+        with db_transaction.atomic():
+            updated = UserCategorizationIndex.objects.filter(
+                user_id=self.user_id, version__lte=self.watermark
+            ).update(updated_at=timezone.now(), **fields)
+            if not updated and not UserCategorizationIndex.objects.filter(user_id=self.user_id).exists():
+                try:
+                    with db_transaction.atomic():
+                        UserCategorizationIndex.objects.create(user_id=self.user_id, **fields)
+                except IntegrityError:
+                    pass
+            deleted, _ = CategorizationIndexEntry.objects.filter(user_id=self.user_id, id__lte=self.watermark).delete()
+        self.unfolded = 0
+        if deleted:
+            db_transaction.on_commit(self._reload_elsewhere)
+
+    def _reload_elsewhere(self):
+        reload_categorization_index(self.user_id)
+        # This lookup already holds everything the snapshot does.
+        self.generation = get_index_generation(self.user_id)
+
+    def add(self, narration: str, category_name: str):
+        if not narration or not category_name or category_name == "Unknown":
+            return
+        key = merchant_key(narration)
+        if key:
+            self.merchant_categories[key] = category_name
+        if self.index.label_for(narration) == category_name:
+            return
+        self.index.add(narration, category_name)
+        self.recent.append({'narration': narration, 'category__name': category_name})
+
+    def match_many(self, narrations: List[str]) -> List[Tuple[Optional[str], float, str]]:
+        """
+        Returns (category, score, source) for each narration. Exact narrations
+        and the user's known merchant keys are answered from hash maps, then
+        the shared merchant catalogue; only the rest are scored against the
+        history, in one batch.
+        """
+        catalogue = get_merchant_catalogue()
+        results: List[Tuple[Optional[str], float, str]] = [(None, 0.0, 'similarity')] * len(narrations)
+        to_score = []
+        for i, narration in enumerate(narrations):
+            exact = self.index.label_for(narration)
+            if exact:
+                results[i] = (exact, 1.0, 'exact')
+                continue
+            key = merchant_key(narration)
+            if key and key in self.merchant_categories:
+                results[i] = (self.merchant_categories[key], 1.0, 'merchant_key')
+                continue
+            shared = catalogue.match(key)
+            if shared:
+                results[i] = (shared[0], shared[1], 'merchant_catalogue')
+                continue
+            to_score.append(i)
+
+        scored = self.index.best_matches([narrations[i] for i in to_score])
+        for i, (category_name, score) in zip(to_score, scored):
+            results[i] = (category_name if score > SIMILARITY_THRESHOLD else None, score, 'similarity')
+        return results
+
+    def match(self, narration: str) -> Tuple[Optional[str], float, str]:
+        """Returns the best matching category, its score and how it was found."""
+        return self.match_many([narration])[0]
+
+    def examples(self, count: int = AI_EXAMPLE_COUNT) -> List[Dict[str, str]]:
+        return list(self.recent)[-count:]
+
+
+_lookups = LRUCache(maxsize=MAX_CACHED_USERS)
+_lookups_lock = threading.Lock()
+
+
+def get_user_lookup(user_id) -> UserCategoryLookup:
+    """Returns this worker's lookup for the user, loading it lazily and syncing it if stale."""
+    with _lookups_lock:
+        lookup = _lookups.get(user_id)
+        if lookup is None:
+            lookup = UserCategoryLookup(user_id)
+            _lookups[user_id] = lookup
+    if lookup.version is None:
+        lookup.load()
+    elif lookup.version != get_categorization_version(user_id):
+        if lookup.generation != get_index_generation(user_id):
+            lookup.load()
+        else:
+            lookup.sync()
+    return lookup
+
+
+class CategorizationService:
+    """
+    Categorizes transactions using the user's keyword rules and the per-user
+    in-memory lookup (exact narration, then merchant key, then the shared
+    merchant catalogue, then n-gram similarity) first and
+    only falls back to the LLM for narrations the lookup cannot resolve.
+    """
+
+    # Creates the LLM client on first use; the benchmark suite swaps in a stub.
+    ai_service_factory = AIService
+
+    def __init__(self, ai_service=None):
+        self._ai_service = ai_service
+        self._category_ids: Optional[Dict[str, int]] = None
+
+    @property
+    def ai_service(self):
+        if self._ai_service is None:
+            self._ai_service = self.ai_service_factory()
+        return self._ai_service
+
+    @property
+    def category_ids(self) -> Dict[str, int]:
+        if self._category_ids is None:
+            self._category_ids = dict(TransactionCategory.objects.values_list('name', 'id'))
+        return self._category_ids
+
+    def resolve(self, tx) -> Optional[str]:
+        """Categorizes from the user's keyword rules and history only. Never calls the LLM."""
+        return self.resolve_many([tx]).get(tx.id)
+
+    def resolve_many(self, transactions) -> Dict[int, str]:
+        """
+        Categorizes many transactions of one user without the LLM: the user's
+        keyword rules are applied first, then the rest are matched against
+        their history in a single batched similarity pass.
+        Returns {transaction id: category name} for the ones that could be resolved.
+        """
+        if not transactions:
+            return {}
+        resolved = {}
+        rules = get_user_rules(transactions[0].user_id)
+        remaining = []
+        for tx in transactions:
+            rule = rules.match(tx.narration)
+            if rule:
+                logger.info(f"Categorized tx {tx.id} as '{rule[0]}' via keyword rule '{rule[1]}'")
+                resolved[tx.id] = rule[0]
+            else:
+                remaining.append(tx)
+        if not remaining:
+            return resolved
+
+        lookup = get_user_lookup(remaining[0].user_id)
+        matches = lookup.match_many([tx.narration for tx in remaining])
+        for tx, (category_name, score, source) in zip(remaining, matches):
+            if category_name:
+                logger.info(f"Categorized tx {tx.id} as '{category_name}' via {source} match (score: {score:.2f})")
+                resolved[tx.id] = category_name
+        return resolved
+
+    def categorize_many(self, transactions, use_llm: bool = True) -> Dict[int, str]:
+        """
+        Categorizes many transactions of one user. History matches are resolved
+        in one batched pass; the rest are grouped by merchant key and only one
+        narration per group is sent to the LLM, in batched prompts.
+        Returns {transaction id: category name}.
+        """
+        resolved = self.resolve_many(transactions)
+        pending = [tx for tx in transactions if tx.id not in resolved]
+        if not pending or not use_llm:
+            return resolved
+
+        if not self.category_ids:
+            logger.warning(f"Cannot categorize {len(pending)} transactions: No TransactionCategory records exist.")
+            return resolved
+
+        groups: Dict[str, list] = {}
+        for tx in pending:
+            key = merchant_key(tx.narration) or ' '.join((tx.narration or '').lower().split())
+            groups.setdefault(key, []).append(tx)
+        representatives = [group[0].narration for group in groups.values()]
+
+        logger.info(f"Using AI to categorize {len(pending)} transactions ({len(representatives)} distinct narrations)...")
+        categories = self.ai_service.categorize_transactions(
+            narrations=representatives,
+            categories=list(self.category_ids),
+            examples=get_user_lookup(pending[0].user_id).examples(),
+        )
+        for narration, group in zip(representatives, groups.values()):
+            category_name = categories.get(narration, "Unknown")
+            for tx in group:
+                resolved[tx.id] = category_name
+        return resolved
+
+    def categorize(self, tx, use_llm: bool = True) -> Optional[str]:
+        """Returns the category name for a transaction, or None if it could not be resolved."""
+        category_name = self.resolve(tx)
+        if category_name or not use_llm:
+            return category_name
+
+        if not self.category_ids:
+            logger.warning(f"Cannot categorize tx {tx.id}: No TransactionCategory records exist.")
+            return None
+
+        logger.info(f"Using AI to categorize transaction {tx.id}...")
+        category_name = self.ai_service.categorize_transaction(
+            narration=tx.narration,
+            categories=list(self.category_ids),
+            examples=get_user_lookup(tx.user_id).examples(),
+        )
+        logger.info(f"AI categorized tx {tx.id} as '{category_name}'")
+        return category_name
+
+    def _category_id(self, category_name: str) -> int:
+        category_id = self.category_ids.get(category_name)
+        if category_id is None:
+            category_obj, _ = TransactionCategory.objects.get_or_create(name=category_name)
+            category_id = self.category_ids[category_name] = category_obj.id
+        return category_id
+
+    def assign(self, tx, category_name: str):
+        """Saves the category on the transaction and records it in the user's index."""
+        self.assign_many([(tx, category_name)])
+
+    def assign_many(self, assignments: List[Tuple[Transaction, str]]) -> List[Tuple[Transaction, str]]:
+        """
+        Saves the categories of many transactions of one user with a single
+        bulk_update and records them in the user's index in one batch.
+
+        The in-memory rows may be stale by the time the LLM has answered, so
+        the rows are locked and re-read first: only transactions that are
+        still uncategorized are written, and the rollups move from their
+        current state in the database. Returns the assignments that were saved.
+        """
+        if not assignments:
+            return []
+        with db_transaction.atomic():
+            current = {
+                row['id']: row
+                for row in Transaction.objects.select_for_update().filter(
+                    id__in=[tx.id for tx, _ in assignments], category__isnull=True
+                ).values('id', *ROLLUP_FIELDS)
+            }
+            assignments = [(tx, category_name) for tx, category_name in assignments if tx.id in current]
+            changes = []
+            for tx, category_name in assignments:
+                before = current[tx.id]
+                tx.category_id = self._category_id(category_name)
+                tx.next_categorization_at = None
+                changes.append((before, dict(before, category_id=tx.category_id)))
+            Transaction.objects.bulk_update(
+                [tx for tx, _ in assignments], ['category', 'next_categorization_at'], batch_size=500
+            )
+            apply_rollup_changes(changes)
+        if not assignments:
+            return []
+        user_id = assignments[0][0].user_id
+        lookup = get_user_lookup(user_id)
+        for tx, category_name in assignments:
+            lookup.add(tx.narration, category_name)
+        record_categorizations(user_id, [(tx.narration, category_name) for tx, category_name in assignments])
+        return assignments
+
+    def defer(self, tx) -> bool:
+        """Records a failed categorization attempt. See defer_many."""
+        return bool(self.defer_many([tx]))
+
+    def defer_many(self, transactions) -> List[Transaction]:
+        """
+        Records a failed categorization attempt for each transaction and
+        schedules the next one with exponential backoff. Transactions that have
+        used up MAX_CATEGORIZATION_ATTEMPTS are assigned "Unknown" instead.
+        Returns the transactions that were scheduled for a retry.
+        """
+        now = timezone.now()
+        retrying, exhausted = [], []
+        for tx in transactions:
+            tx.categorization_attempts += 1
+            if tx.categorization_attempts >= MAX_CATEGORIZATION_ATTEMPTS:
+                exhausted.append(tx)
+                continue
+            delay = min(CATEGORIZATION_RETRY_BASE * 2 ** (tx.categorization_attempts - 1), CATEGORIZATION_RETRY_MAX_DELAY)
+            tx.next_categorization_at = now + delay
+            retrying.append(tx)
+
+        Transaction.objects.bulk_update(
+            retrying + exhausted, ['categorization_attempts', 'next_categorization_at'], batch_size=500
+        )
+        self.assign_many([(tx, "Unknown") for tx in exhausted])
+        for tx in retrying:
+            logger.info(f"Could not categorize tx {tx.id} (attempt {tx.categorization_attempts}); retrying after {tx.next_categorization_at}.")
+        return retrying
@@ -0,0 +1,101 @@
+import logging
+import re
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from cachetools import LRUCache
+from django.core.cache import cache
+
+from transactions.models import UserCategoryMapping
+
+logger = logging.getLogger(__name__)
+
+# How many users' compiled rules a single worker process keeps in memory.
+MAX_CACHED_RULE_SETS = 1024
+
+
+def _rules_version_key(user_id) -> str:
+    return f"categorization:rules_version:{user_id}"
+
+
+def get_keyword_rules_version(user_id) -> int:
+    try:
+        return cache.get(_rules_version_key(user_id), 0)
+    except Exception as e:
+        logger.debug(f"Could not read keyword rules version for user {user_id}: {e}")
+        return 0
+
+
+def bump_keyword_rules_version(user_id):
+    """Makes every worker recompile the user's keyword rules on next use."""
+    key = _rules_version_key(user_id)
+    try:
+        try:
+            cache.incr(key)
+        except ValueError:
+            if not cache.add(key, 1, timeout=None):
+                cache.incr(key)
+    except Exception as e:
+        logger.debug(f"Could not bump keyword rules version for user {user_id}: {e}")
+
+
+class KeywordRuleSet:
+    """
+    A user's keyword -> category rules compiled into a single case-insensitive
+    pattern, so a narration is checked against every keyword in one pass.
+    When several keywords match, the longest one wins, then the earliest.
+    """
+
+    def __init__(self, rules: List[Tuple[str, str]]):
+        self.categories: Dict[str, str] = {}
+        for keyword, category_name in rules:
+            keyword = ' '.join(str(keyword or '').lower().split())
+            if keyword and keyword not in self.categories:
+                self.categories[keyword] = category_name
+
+        self.pattern = None
+        if self.categories:
+            alternatives = '|'.join(re.escape(keyword) for keyword in sorted(self.categories, key=len, reverse=True))
+            self.pattern = re.compile(rf'(?<!\w)(?:{alternatives})(?!\w)', re.IGNORECASE)
+
+    def __len__(self):
+        return len(self.categories)
+
+    def match(self, narration: str) -> Optional[Tuple[str, str]]:
+        """Returns (category name, matched keyword), or None if no rule applies."""
+        if self.pattern is None or not narration:
+            return None
+        text = ' '.join(narration.split())
+        best = None
+        for found in self.pattern.finditer(text):
+            keyword = found.group(0).lower()
+            if best is None or len(keyword) > len(best):
+                best = keyword
+        return (self.categories[best], best) if best else None
+
+
+def compile_user_rules(user_id) -> KeywordRuleSet:
+    mappings = UserCategoryMapping.objects.filter(user_id=user_id).select_related('transaction_category').order_by('id')
+    rules = []
+    for mapping in mappings:
+        keywords = mapping.keywords if isinstance(mapping.keywords, list) else []
+        rules.extend((keyword, mapping.transaction_category.name) for keyword in keywords if isinstance(keyword, str))
+    return KeywordRuleSet(rules)
+
+
+_rule_sets = LRUCache(maxsize=MAX_CACHED_RULE_SETS)
+_rule_sets_lock = threading.Lock()
+
+
+def get_user_rules(user_id) -> KeywordRuleSet:
+    """Returns this worker's compiled rules for the user, recompiling them if they changed."""
+    version = get_keyword_rules_version(user_id)
+    with _rule_sets_lock:
+        cached = _rule_sets.get(user_id)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    rule_set = compile_user_rules(user_id)
+    with _rule_sets_lock:
+        _rule_sets[user_id] = (version, rule_set)
+    return rule_set
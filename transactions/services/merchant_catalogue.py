@@ -0,0 +1,127 @@
+import logging
+import threading
+from collections import Counter, defaultdict
+from typing import Dict, Optional, Tuple
+
+from django.core.cache import cache
+from django.db import transaction as db_transaction
+
+from transactions.models import MerchantCategory, Transaction, TransactionCategory
+from .narration_normalizer import merchant_key
+
+logger = logging.getLogger(__name__)
+
+# A merchant is only published once this many distinct users have categorized
+# it, so the catalogue never reveals anything about an individual user.
+MIN_MERCHANT_USERS = 5
+
+# Share of those users that must agree on the category.
+MIN_MERCHANT_CONFIDENCE = 0.6
+
+_VERSION_KEY = "categorization:merchant_catalogue:version"
+
+
+def get_catalogue_version() -> int:
+    try:
+        return cache.get(_VERSION_KEY, 0)
+    except Exception as e:
+        logger.debug(f"Could not read merchant catalogue version: {e}")
+        return 0
+
+
+def _bump_catalogue_version():
+    try:
+        try:
+            cache.incr(_VERSION_KEY)
+        except ValueError:
+            if not cache.add(_VERSION_KEY, 1, timeout=None):
+                cache.incr(_VERSION_KEY)
+    except Exception as e:
+        logger.debug(f"Could not bump merchant catalogue version: {e}")
+
+
+def aggregate_merchant_votes(transactions) -> Dict[str, Tuple[Counter, int]]:
+    """
+    Turns (user id, narration, category name) rows into per-merchant votes.
+    Returns {merchant key: (distinct users per category, distinct users)}.
+    """
+    voters = defaultdict(set)
+    for user_id, narration, category_name in transactions:
+        key = merchant_key(narration)
+        if key and category_name and category_name != "Unknown":
+            voters[(key, category_name)].add(user_id)
+
+    votes: Dict[str, Counter] = defaultdict(Counter)
+    users = defaultdict(set)
+    for (key, category_name), category_users in voters.items():
+        votes[key][category_name] = len(category_users)
+        users[key].update(category_users)
+    return {key: (counter, len(users[key])) for key, counter in votes.items()}
+
+
+def rebuild_merchant_catalogue() -> int:
+    """
+    Rebuilds the shared catalogue from every categorized transaction and
+    returns the number of published merchants.
+    """
+    # Only debits: payees are merchants, while credit narrations name the people who sent money.
+    rows = Transaction.objects.filter(
+        category__isnull=False,
+        transaction_type='debit'
+    ).values_list('user_id', 'narration', 'category__name').iterator(chunk_size=5000)
+    votes = aggregate_merchant_votes(rows)
+
+    category_ids = dict(TransactionCategory.objects.values_list('name', 'id'))
+    entries = []
+    for key, (counter, user_count) in votes.items():
+        category_name, top_votes = counter.most_common(1)[0]
+        confidence = top_votes / user_count
+        if user_count < MIN_MERCHANT_USERS or confidence < MIN_MERCHANT_CONFIDENCE:
+            continue
+        entries.append(MerchantCategory(
+            merchant_key=key[:255],
+            category_id=category_ids[category_name],
+            confidence=confidence,
+            user_count=user_count,
+            votes=dict(counter),
+        ))
+
+    with db_transaction.atomic():
+        MerchantCategory.objects.all().delete()
+        MerchantCategory.objects.bulk_create(entries, batch_size=1000)
+    _bump_catalogue_version()
+    logger.info(f"Rebuilt merchant catalogue: {len(entries)} merchants published out of {len(votes)} seen.")
+    return len(entries)
+
+
+class MerchantCatalogue:
+    """This worker's in-memory copy of the shared catalogue: merchant key -> (category, confidence)."""
+
+    def __init__(self):
+        self.version = None
+        self.entries: Dict[str, Tuple[str, float]] = {}
+
+    def load(self):
+        self.version = get_catalogue_version()
+        self.entries = {
+            key: (category_name, confidence)
+            for key, category_name, confidence in MerchantCategory.objects.values_list(
+                'merchant_key', 'category__name', 'confidence'
+            ).iterator(chunk_size=5000)
+        }
+
+    def match(self, key: str) -> Optional[Tuple[str, float]]:
+        return self.entries.get(key) if key else None
+
+
+_catalogue = MerchantCatalogue()
+_catalogue_lock = threading.Lock()
+
+
+def get_merchant_catalogue() -> MerchantCatalogue:
+    """Returns the shared catalogue, reloading it after each aggregation run."""
+    if _catalogue.version != get_catalogue_version():
+        with _catalogue_lock:
+            if _catalogue.version != get_catalogue_version():
+                _catalogue.load()
+    return _catalogue
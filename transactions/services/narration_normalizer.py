@@ -0,0 +1,55 @@
+import re
+from typing import List
+
+# Splits a narration into tokens on whitespace and the separators banks put
+# between references, e.g. "TRF|2MPT99l1w|1966..." or "<12345> <REF>".
+_TOKEN_SPLIT_RE = re.compile(r'[\s|/\\:;,.<>()\[\]{}"\'=_+&@-]+')
+
+# Masked account numbers and card numbers, e.g. "*****1234", "xxxx", "###".
+_MASKED_RE = re.compile(r'^(?:[x*#]{3,}|[x*#]+\d+|\d+[x*#]+\d*)$', re.IGNORECASE)
+
+# Channel and bank codes that carry no information about the merchant.
+CHANNEL_TOKENS = {
+    'nip', 'nibss', 'fip', 'trf', 'trfr', 'bpt', 'pos', 'web', 'ussd', 'mob', 'mb', 'ft', 'inw', 'outw', 'ref', 'rrn',
+    'txn', 'trx', 'tnx', 'frm', 'pmt', 'pymt', 'nxg', 'nqr', 'ng', 'nga', 'lag', 'lang', 'ngn', 'tid', 'stan', 'auth',
+}
+
+# Words that on their own do not identify a merchant. A key made only of
+# these would lump unrelated transactions together, so none is produced.
+GENERIC_TOKENS = {
+    'transfer', 'to', 'from', 'for', 'by', 'of', 'the', 'and', 'payment', 'purchase', 'bill', 'debit', 'credit',
+    'transaction', 'charge', 'charges', 'fee', 'fees', 'narration', 'description', 'being', 'via', 'at', 'on', 'in',
+}
+
+MAX_KEY_TOKENS = 8
+
+
+def narration_tokens(narration: str) -> List[str]:
+    """Returns the meaningful tokens of a narration, with references and codes removed."""
+    tokens = []
+    for token in _TOKEN_SPLIT_RE.split((narration or '').lower()):
+        if len(token) < 2 or _MASKED_RE.match(token) or any(ch.isdigit() for ch in token):
+            continue
+        if token in CHANNEL_TOKENS:
+            continue
+        if tokens and tokens[-1] == token:
+            continue
+        tokens.append(token)
+    return tokens
+
+
+def merchant_key(narration: str) -> str:
+    """
+    Produces a canonical key for a narration so that repeat payments to the
+    same merchant map to the same key regardless of reference numbers, phone
+    numbers, masked accounts or bank codes, e.g.
+
+        "TRANSFER TO Bokku Mart Moniepoint MFB *****1234/TRF|2MPT99l1w|1966..."
+        -> "transfer to bokku mart moniepoint mfb"
+
+    Returns an empty string when nothing merchant-specific is left.
+    """
+    tokens = narration_tokens(narration)[:MAX_KEY_TOKENS]
+    if all(token in GENERIC_TOKENS for token in tokens):
+        return ''
+    return ' '.join(tokens)
@@ -0,0 +1,197 @@
+import io
+import re
+import zlib
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+from scipy import sparse
+
+# Character n-grams hashed into a fixed-size feature space. crc32 is used
+# instead of hash() so vectors are identical across worker processes.
+NGRAM_SIZES = (3, 4)
+N_FEATURES = 2 ** 20
+
+# Caps the size of the intermediate (queries x history) score matrix.
+MAX_SCORE_CELLS = 4_000_000
+
+# Rows kept in the small incremental segment before it is merged into the main one.
+RECENT_SEGMENT_ROWS = 1000
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+class NarrationVectorizer:
+    """
+    A stateless character n-gram hashing vectorizer. Each narration becomes an
+    L2-normalized sparse vector with sublinear term frequencies, so a dot
+    product between two rows is their cosine similarity.
+    """
+
+    def __init__(self, ngram_sizes=NGRAM_SIZES, n_features: int = N_FEATURES):
+        self.ngram_sizes = ngram_sizes
+        self.n_features = n_features
+
+    @property
+    def signature(self) -> str:
+        """Identifies the feature space; vectors from different signatures are not comparable."""
+        return f"crc32:{','.join(map(str, self.ngram_sizes))}:{self.n_features}"
+
+    def _features(self, narration: str) -> dict:
+        text = f" {_WHITESPACE_RE.sub(' ', (narration or '').lower()).strip()} "
+        counts = {}
+        for size in self.ngram_sizes:
+            for i in range(len(text) - size + 1):
+                index = zlib.crc32(text[i:i + size].encode('utf-8')) % self.n_features
+                counts[index] = counts.get(index, 0) + 1
+        return counts
+
+    def transform(self, narrations: Iterable[str]) -> sparse.csr_matrix:
+        indptr = [0]
+        indices = []
+        data = []
+        for narration in narrations:
+            counts = self._features(narration)
+            indices.extend(counts.keys())
+            data.extend(1.0 + np.log(list(counts.values())) if counts else [])
+            indptr.append(len(indices))
+
+        matrix = sparse.csr_matrix(
+            (np.asarray(data, dtype=np.float32), np.asarray(indices, dtype=np.int32), np.asarray(indptr, dtype=np.int64)),
+            shape=(len(indptr) - 1, self.n_features),
+        )
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+        norms[norms == 0] = 1.0
+        return sparse.csr_matrix(sparse.diags(1.0 / norms).dot(matrix), dtype=np.float32)
+
+    def similarities(self, narration: str, others: List[str]) -> np.ndarray:
+        """Cosine similarity between one narration and each of the others."""
+        if not others:
+            return np.zeros(0, dtype=np.float32)
+        vectors = self.transform([narration] + list(others))
+        return vectors[1:].dot(vectors[0].T).toarray().ravel()
+
+
+class NarrationIndex:
+    """
+    Holds the vectorized, de-duplicated narrations of a user's categorized
+    transactions and scores many pending narrations against all of them with
+    one sparse matrix product.
+
+    Rows added one at a time go into a small "recent" segment first, so
+    incremental updates do not copy the whole matrix on every call.
+    """
+
+    def __init__(self, vectorizer: Optional[NarrationVectorizer] = None):
+        self.vectorizer = vectorizer or NarrationVectorizer()
+        self.labels: List[str] = []
+        self.positions = {}
+        self._main = self._empty()
+        self._recent = self._empty()
+        self._transposed = {}
+        self._pending_rows: List[str] = []
+
+    def __len__(self):
+        return len(self.labels)
+
+    def _empty(self) -> sparse.csr_matrix:
+        return sparse.csr_matrix((0, self.vectorizer.n_features), dtype=np.float32)
+
+    def add(self, narration: str, label: str):
+        """Adds a narration, or relabels it if the same narration is already indexed."""
+        key = (narration or '').lower()
+        if key in self.positions:
+            self.labels[self.positions[key]] = label
+            return
+        self.positions[key] = len(self.labels)
+        self.labels.append(label)
+        self._pending_rows.append(key)
+
+    def label_for(self, narration: str) -> Optional[str]:
+        """Returns the label of an exactly matching (case-insensitive) narration."""
+        position = self.positions.get((narration or '').lower())
+        return self.labels[position] if position is not None else None
+
+    def narrations(self) -> List[str]:
+        """The indexed (lower-cased) narrations, in row order."""
+        return list(self.positions)
+
+    def to_bytes(self) -> bytes:
+        """Serializes the vectors of every indexed row."""
+        buffer = io.BytesIO()
+        sparse.save_npz(buffer, self.matrix, compressed=True)
+        return buffer.getvalue()
+
+    @classmethod
+    def from_snapshot(cls, narrations: List[str], labels: List[str], vectors: bytes,
+                      vectorizer: Optional[NarrationVectorizer] = None) -> 'NarrationIndex':
+        """Rebuilds an index from to_bytes() output without re-vectorizing anything."""
+        index = cls(vectorizer)
+        matrix = sparse.load_npz(io.BytesIO(bytes(vectors))).tocsr()
+        if matrix.shape != (len(narrations), index.vectorizer.n_features) or len(labels) != len(narrations):
+            raise ValueError("Snapshot vectors do not match its narrations.")
+        index.positions = {narration: i for i, narration in enumerate(narrations)}
+        index.labels = list(labels)
+        index._main = matrix.astype(np.float32)
+        return index
+
+    def _flush(self):
+        if not self._pending_rows:
+            return
+        self._recent = sparse.vstack([self._recent, self.vectorizer.transform(self._pending_rows)], format='csr')
+        self._pending_rows = []
+        self._transposed.pop('recent', None)
+        if self._recent.shape[0] > max(RECENT_SEGMENT_ROWS, self._main.shape[0] // 10):
+            self._compact()
+
+    def _compact(self):
+        self._main = sparse.vstack([self._main, self._recent], format='csr')
+        self._recent = self._empty()
+        self._transposed = {}
+
+    @property
+    def matrix(self) -> sparse.csr_matrix:
+        """All indexed rows, in insertion order."""
+        self._flush()
+        if self._recent.shape[0]:
+            self._compact()
+        return self._main
+
+    def _segments(self):
+        self._flush()
+        offset = 0
+        for name, segment in (('main', self._main), ('recent', self._recent)):
+            if segment.shape[0]:
+                if name not in self._transposed:
+                    self._transposed[name] = segment.T.tocsr()
+                yield offset, self._transposed[name]
+            offset += segment.shape[0]
+
+    def best_matches(self, narrations: List[str]) -> List[Tuple[Optional[str], float]]:
+        """Returns (best label, cosine score) for each narration, in order."""
+        if not narrations:
+            return []
+        if not self.labels:
+            return [(None, 0.0)] * len(narrations)
+
+        queries = self.vectorizer.transform(narrations)
+        best_rows = np.zeros(queries.shape[0], dtype=np.int64)
+        best_scores = np.zeros(queries.shape[0], dtype=np.float32)
+
+        for offset, history in self._segments():
+            chunk_size = max(1, MAX_SCORE_CELLS // history.shape[1])
+            for start in range(0, queries.shape[0], chunk_size):
+                scores = queries[start:start + chunk_size].dot(history)
+                rows = np.asarray(scores.argmax(axis=1)).ravel() + offset
+                values = scores.max(axis=1).toarray().ravel()
+                current = best_scores[start:start + chunk_size]
+                better = values > current
+                best_rows[start:start + chunk_size][better] = rows[better]
+                current[better] = values[better]
+
+        return [
+            (self.labels[row] if score > 0 else None, float(score))
+            for row, score in zip(best_rows, best_scores)
+        ]
+
+    def best_match(self, narration: str) -> Tuple[Optional[str], float]:
+        return self.best_matches([narration])[0]
@@ -0,0 +1,256 @@
+import re
+import logging
+import threading
+from collections import defaultdict
+from typing import Optional, Dict, Any
+
+from bs4 import BeautifulSoup, Comment
+
+logger = logging.getLogger(__name__)
+
+# Rough heuristic used by both Gemini and OpenAI docs: ~4 characters per token.
+CHARS_PER_TOKEN = 4
+
+# Upper bounds for what we send to the models. Transaction details in bank
+# alerts rarely need more than a couple of KB of text.
+MAX_TEXT_CHARS = 3000
+MAX_HTML_CHARS = 12000
+
+# Blocks of text that appear in almost every bank email but never carry
+# transaction details (legal footers, marketing, unsubscribe text, etc.).
+BOILERPLATE_PATTERNS = [
+    r'unsubscribe',
+    r'manage (?:your )?(?:email )?preferences',
+    r'(?:this|the) (?:e-?mail|message) (?:and any attachments? )?(?:is|are) (?:confidential|intended)',
+    r'do not reply to this (?:e-?mail|message)',
+    r'this is an automated (?:e-?mail|message)',
+    r'privacy (?:policy|notice)',
+    r'terms (?:and|&) conditions',
+    r'all rights reserved',
+    r'copyright\s*(?:©|\(c\))?\s*\d{4}',
+    r'©\s*\d{4}',
+    r'download (?:our|the) (?:mobile )?app',
+    r'(?:get it on|available on) (?:google play|the app store)',
+    r'follow us on',
+    r'connect with us',
+    r'licensed by the central bank',
+    r'deposits? (?:are )?insured by (?:the )?ndic',
+    r'never (?:share|disclose) your (?:pin|password|otp|card details)',
+    r'will never (?:ask|call) (?:you )?for your',
+    r'beware of (?:fraudsters|scam)',
+    r'for (?:any )?(?:enquiries|complaints|inquiries),? (?:please )?(?:contact|call|send)',
+    r'(?:call|contact) our (?:customer )?(?:care|service|support)',
+    r'if you did not (?:initiate|authori[sz]e) this',
+    r'click here to',
+]
+BOILERPLATE_RE = re.compile('|'.join(BOILERPLATE_PATTERNS), re.IGNORECASE)
+
+# Markers of the transaction-relevant region of an email.
+TRANSACTION_ANCHOR_RE = re.compile(
+    r'(?:NGN|₦|\bN\b)\s*[\d,]+(?:\.\d{2})?'
+    r'|\b(?:debit|credit|amount|narration|narrative|description|remarks?|balance|'
+    r'transaction|transfer|sent|received|spent|withdrawal)\b',
+    re.IGNORECASE,
+)
+
+# A money-like value; blocks containing one are never treated as boilerplate.
+AMOUNT_RE = re.compile(r'(?:NGN|₦)\s*[\d,]+|\d{1,3}(?:,\d{3})+(?:\.\d{2})?|\d+\.\d{2}')
+
+# Boilerplate blocks are short; anything longer is likely a layout wrapper.
+MAX_BOILERPLATE_BLOCK_CHARS = 600
+
+REGION_PADDING_CHARS = 300
+
+# Elements a footer is laid out in.
+BLOCK_TAGS = ['table', 'tr', 'td', 'th', 'div', 'p', 'section', 'footer', 'center']
+
+
+def estimate_tokens(text: Optional[str]) -> int:
+    """Cheap token estimate, good enough for tracking cost and size trends."""
+    if not text:
+        return 0
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+def unminimized_text(email_body: str) -> str:
+    """
+    The email text the extraction prompts sent before minimizing (every
+    string of the HTML joined by single spaces), to count the tokens saved.
+    """
+    if not email_body:
+        return ""
+    return ' '.join(' '.join(BeautifulSoup(email_body, 'html.parser').stripped_strings).split())
+
+
+def _is_boilerplate(text: str) -> bool:
+    return (
+        len(text) <= MAX_BOILERPLATE_BLOCK_CHARS
+        and bool(BOILERPLATE_RE.search(text))
+        and not AMOUNT_RE.search(text)
+    )
+
+
+def _cap_to_transaction_region(text: str, max_chars: int) -> str:
+    """
+    Trims text to the span between the first and last transaction anchors
+    (plus some padding), then hard-caps it at max_chars.
+    """
+    if len(text) <= max_chars:
+        return text
+
+    anchors = [m.start() for m in TRANSACTION_ANCHOR_RE.finditer(text)]
+    if anchors:
+        start = max(0, anchors[0] - REGION_PADDING_CHARS)
+        end = min(len(text), anchors[-1] + REGION_PADDING_CHARS)
+        text = text[start:end]
+
+    return text[:max_chars]
+
+
+def _drop_footer_blocks(soup: BeautifulSoup) -> None:
+    """
+    Removes the boilerplate blocks that follow the last amount in the
+    document. Elements before that amount keep their positions.
+    """
+    amounts = soup.find_all(string=AMOUNT_RE)
+    if not amounts:
+        return
+    for block in amounts[-1].find_all_next(BLOCK_TAGS):
+        if block.decomposed:
+            continue
+        text = ' '.join(block.get_text(' ', strip=True).split())
+        if text and _is_boilerplate(text):
+            block.decompose()
+
+
+def _cap_html_to_amount_region(html: str, max_chars: int) -> str:
+    """
+    Cuts html to max_chars, keeping the span from the first to the last
+    amount (plus some padding) and as much of the start as still fits.
+    """
+    if len(html) <= max_chars:
+        return html
+
+    amounts = [m.start() for m in AMOUNT_RE.finditer(html)]
+    if not amounts:
+        return html[:max_chars]
+    end = min(len(html), amounts[-1] + REGION_PADDING_CHARS)
+    start = max(0, min(amounts[0] - REGION_PADDING_CHARS, end - max_chars))
+    return html[start:start + max_chars]
+
+
+class PromptMinimizer:
+    """
+    Shrinks email content before it is sent to an LLM. Plain text has its
+    boilerplate removed and is cut to the region that carries the transaction
+    details; HTML only loses content that cannot affect a parser's selectors,
+    plus its trailing footer when it is over the size limit.
+    """
+
+    def __init__(self, max_text_chars: int = MAX_TEXT_CHARS, max_html_chars: int = MAX_HTML_CHARS):
+        self.max_text_chars = max_text_chars
+        self.max_html_chars = max_html_chars
+
+    def minimize_text(self, email_body: str) -> str:
+        """Returns the cleaned, boilerplate-free plain text of an email."""
+        if not email_body:
+            return ""
+
+        soup = BeautifulSoup(email_body, 'html.parser')
+        for tag in soup(['script', 'style', 'head', 'title', 'meta', 'noscript']):
+            tag.decompose()
+
+        lines = []
+        # Each table row becomes a single "cell | cell" line so key/value
+        # layouts survive as one compact line instead of scattered fragments.
+        for row in soup.find_all('tr'):
+            if row.find('tr'):
+                continue
+            cells = [' '.join(cell.get_text(' ', strip=True).split()) for cell in row.find_all(['td', 'th'])]
+            cells = [cell for cell in cells if cell]
+            if cells:
+                row.replace_with(soup.new_string('\n' + ' | '.join(cells) + '\n'))
+
+        seen = set()
+        for segment in soup.get_text('\n').split('\n'):
+            segment = ' '.join(segment.split())
+            if not segment or segment in seen or _is_boilerplate(segment):
+                continue
+            seen.add(segment)
+            lines.append(segment)
+
+        return _cap_to_transaction_region('\n'.join(lines), self.max_text_chars)
+
+    def minimize_html(self, email_html: str) -> str:
+        """
+        Returns the email HTML without scripts, styles and comments and with
+        whitespace collapsed. The tag structure and attributes are left as
+        they are: parsers generated from this HTML run on the original email,
+        so any element they index or select by attribute must still be there.
+        Oversized HTML first loses the footer boilerplate after the last
+        amount, then is cut to a window that keeps the amounts, so a long
+        template cannot push the transaction table past the limit.
+        """
+        if not email_html:
+            return ""
+
+        soup = BeautifulSoup(email_html, 'html.parser')
+        for tag in soup(['script', 'style']):
+            tag.decompose()
+        for comment in soup.find_all(string=lambda s: isinstance(s, Comment)):
+            comment.extract()
+
+        # Whitespace-only text nodes are collapsed, not removed, so sibling
+        # positions stay the same as in the original document.
+        html = re.sub(r'\s+', ' ', str(soup)).strip()
+        if len(html) > self.max_html_chars:
+            _drop_footer_blocks(soup)
+            html = re.sub(r'\s+', ' ', str(soup)).strip()
+        return _cap_html_to_amount_region(html, self.max_html_chars)
+
+
+class TokenUsageTracker:
+    """
+    Keeps running, per-bank totals of estimated LLM token usage in this worker
+    and logs every call so input/output sizes can be compared over time.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = defaultdict(lambda: {
+            'calls': 0,
+            'raw_input_tokens': 0,
+            'input_tokens': 0,
+            'output_tokens': 0,
+        })
+
+    def record(self, call_name: str, bank_name: Optional[str], prompt: str,
+               response_text: Optional[str] = None, raw_input: Optional[str] = None) -> Dict[str, int]:
+        bank = bank_name or 'Unknown'
+        input_tokens = estimate_tokens(prompt)
+        output_tokens = estimate_tokens(response_text)
+        raw_input_tokens = estimate_tokens(raw_input) if raw_input is not None else input_tokens
+
+        with self._lock:
+            stats = self._stats[bank]
+            stats['calls'] += 1
+            stats['raw_input_tokens'] += raw_input_tokens
+            stats['input_tokens'] += input_tokens
+            stats['output_tokens'] += output_tokens
+            totals = dict(stats)
+
+        saved = totals['raw_input_tokens'] - totals['input_tokens']
+        logger.info(
+            f"LLM call '{call_name}' for {bank}: ~{input_tokens} input tokens "
+            f"(~{raw_input_tokens} before minimizing), ~{output_tokens} output tokens. "
+            f"{bank} totals: {totals['calls']} calls, ~{totals['input_tokens']} input, "
+            f"~{totals['output_tokens']} output, ~{saved} input tokens saved."
+        )
+        return {'input_tokens': input_tokens, 'output_tokens': output_tokens}
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {bank: dict(stats) for bank, stats in self._stats.items()}
+
+
+token_usage = TokenUsageTracker()
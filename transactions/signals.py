@@ -1,8 +1,12 @@
 import logging
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete, pre_delete
 from django.dispatch import receiver
-from .models import Transaction
-from .tasks import reconcile_similar_transactions_task
+from django.utils import timezone
+from .models import Transaction, TransactionCategory, UserCategoryMapping
+from .response_cache import bump_category_version
+from .rollups import apply_rollup_change, move_category_to_uncategorized
+from .tasks import schedule_reconciliation
+from .services.keyword_rules import bump_keyword_rules_version
 
 logger = logging.getLogger(__name__)
 
@@ -10,15 +14,51 @@ logger = logging.getLogger(__name__)
 def trigger_transaction_reconciliation(sender, instance, created, **kwargs):
     """
     Listens for saves on the Transaction model. If a category was manually updated,
-    it triggers a background task to find and update similar transactions.
+    it schedules a debounced background pass that reconciles all of the user's
+    pending corrections together.
     """
     # We only care about updates where the 'is_manually_categorized' flag has been set to True.
+    # The flag stays set until the correction has been reconciled.
     if not created and instance.is_manually_categorized:
-        logger.info(f"Manual category change detected for Tx {instance.id}. Triggering reconciliation task.")
-        
-        # Trigger the background task to do the heavy lifting.
-        reconcile_similar_transactions_task.delay(instance.id)
-        
-        # Reset the flag to False immediately using a direct update.
-        # This prevents the signal from re-triggering on subsequent saves of this instance.
-        Transaction.objects.filter(pk=instance.pk).update(is_manually_categorized=False)
+        logger.info(f"Manual category change detected for Tx {instance.id}. Scheduling reconciliation.")
+        schedule_reconciliation(instance.user_id)
+
+
+@receiver(post_save, sender=UserCategoryMapping)
+@receiver(post_delete, sender=UserCategoryMapping)
+def invalidate_keyword_rules(sender, instance, **kwargs):
+    """Makes workers recompile the user's keyword rules after a mapping changes."""
+    bump_keyword_rules_version(instance.user_id)
+
+
+@receiver(post_delete, sender=Transaction)
+def remove_transaction_from_rollups(sender, instance, origin=None, **kwargs):
+    """
+    Subtracts a deleted transaction from the daily rollups. Runs inside the
+    deletion's DB transaction. Cascades from deleting a user are skipped,
+    since that user's rollups are deleted by the same cascade.
+    """
+    if origin is not None and not isinstance(origin, Transaction) and getattr(origin, 'model', None) is not Transaction:
+        return
+    apply_rollup_change(instance, None)
+
+
+@receiver(pre_delete, sender=TransactionCategory)
+def uncategorize_category_rollups(sender, instance, **kwargs):
+    """Moves a deleted category's totals to the uncategorized rollups, mirroring Transaction.category's SET_NULL."""
+    move_category_to_uncategorized(instance.id)
+
+
+@receiver(pre_delete, sender=TransactionCategory)
+def requeue_category_transactions(sender, instance, **kwargs):
+    """The cascade's SET_NULL bypasses Transaction.save, so requeue those transactions here."""
+    Transaction.objects.filter(category=instance).update(
+        next_categorization_at=timezone.now(), categorization_attempts=0
+    )
+
+
+@receiver(post_save, sender=TransactionCategory)
+@receiver(post_delete, sender=TransactionCategory)
+def invalidate_category_responses(sender, instance, **kwargs):
+    """Category names appear in every user's cached analytics, so any category write invalidates them all."""
+    bump_category_version()
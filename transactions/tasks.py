@@ -8,24 +8,39 @@ from decimal import Decimal
 from datetime import datetime
 from google.auth.exceptions import RefreshError
 import os, re
+import time
 import pytz
-import difflib
 from dateutil import parser as date_parser
 from .services.ai_service import AIService
 from django.conf import settings
 import logging
 from decimal import InvalidOperation
 from .html_parser import HTMLParserService
+from .email_classifier import EmailClassifier
+from .services.categorization_service import SIMILARITY_THRESHOLD, CategorizationService, record_categorizations
+from .services.merchant_catalogue import rebuild_merchant_catalogue
+from .rollups import ROLLUP_FIELDS, apply_rollup_changes, snapshot
+from django.db import connection, transaction as db_transaction
+import numpy as np
+from .services.narration_normalizer import merchant_key
+from .services.narration_similarity import NarrationVectorizer
 from .models import RawEmail
 from django.db.models import Q
-from transactions.models import TransactionCategory
 from receipts.models import Receipt
 from datetime import timedelta
+from django.utils import timezone
+from django.core.cache import cache
+from . import metrics
 
 logger = logging.getLogger(__name__)
 User = get_user_model()
 
 
+def get_header(headers, name):
+    """Returns the value of the named email header, or an empty string."""
+    return next((h['value'] for h in headers if h['name'].lower() == name), '')
+
+
 def extract_decimal(value):
     """Extracts a decimal number from a string, removing currency symbols and commas."""
     if not value:
@@ -61,42 +76,115 @@ def parse_date_with_fallback(date_str):
         logger.warning(f"Failed to parse date: {date_str}")
         return None
 
-@shared_task(max_retries=2, default_retry_delay=60)
-def process_raw_email_task(raw_email_id: int):
+REQUIRED_FIELDS = ['amount', 'date', 'transaction_type', 'narration']
+
+# RawEmail.parsing_method values of emails that failed and can be reprocessed.
+FAILED_PARSING_METHODS = ('all_methods_failed', 'creation_failed_data_error')
+
+# How far before the checkpoint an incremental categorization run looks again.
+CATEGORIZATION_CHECKPOINT_OVERLAP = timedelta(minutes=10)
+
+# Minimum n-gram similarity for propagating a manual correction to another transaction.
+RECONCILE_SIMILARITY_THRESHOLD = SIMILARITY_THRESHOLD
+
+# Bounds on the reconciliation prefilter and scoring: corrections per OR'd
+# trigram query, the pg_trgm similarity those queries require, the most
+# candidates loaded per pass and the candidates scored per sparse product.
+RECONCILE_PREFILTER_GROUP_SIZE = 50
+RECONCILE_TRIGRAM_THRESHOLD = 0.45
+RECONCILE_MAX_CANDIDATES = 50000
+RECONCILE_SCORE_CHUNK_SIZE = 5000
+
+# Manual corrections are reconciled together once the user has paused editing
+# for this long, but never later than RECONCILE_MAX_DELAY_SECONDS after the first.
+RECONCILE_DEBOUNCE_SECONDS = 30
+RECONCILE_MAX_DELAY_SECONDS = 300
+
+
+def _is_complete(parsed_data):
+    return bool(parsed_data) and all(parsed_data.get(key) for key in REQUIRED_FIELDS)
+
+
+def _load_unparsed_email(raw_email_id):
     try:
         raw_email = RawEmail.objects.get(id=raw_email_id)
     except RawEmail.DoesNotExist:
         logger.error(f"RawEmail with ID {raw_email_id} not found.")
-        return
-
+        return None
     if raw_email.parsed:
+        return None
+    return raw_email
+
+
+# The email pipeline is split into stages that run on separate queues (see
+# CELERY_TASK_ROUTES), so a backlog of slow LLM fallbacks never delays emails
+# that a saved parser can handle in milliseconds:
+#   process_raw_email_task (parse) -> ai_extract_raw_email_task (LLM, only if needed)
+#   -> persist_raw_email_task (validate/persist) -> categorize_transaction_task
+# Each stage hands a small JSON state dict to the next one.
+
+@shared_task(max_retries=2, default_retry_delay=60)
+def process_raw_email_task(raw_email_id: int):
+    """Stage 1: cheap checks and saved parsers. Only falls through to the LLM stage when they fail."""
+    raw_email = _load_unparsed_email(raw_email_id)
+    if not raw_email:
         return
 
-    # Quick check for login emails to avoid unnecessary processing
-    if "you have logged-in successfully" in raw_email.raw_text.lower():
-        logger.info(f"Detected and deleting login notification email (ID: {raw_email.id})")
+    # Quick rule-based check to avoid unnecessary processing of emails that were
+    # stored before the ingestion pre-classifier existed (e.g. on reprocessing).
+    is_transactional, reason = EmailClassifier().classify(
+        body=raw_email.raw_text, bank_name=raw_email.bank_name, require_signal=False
+    )
+    if not is_transactional:
+        logger.info(f"Detected and deleting non-transactional email (ID: {raw_email.id}, reason: {reason})")
+        RejectedEmail.objects.get_or_create(
+            user=raw_email.user,
+            email_id=raw_email.email_id,
+            defaults={'bank_name': raw_email.bank_name, 'reason': reason, 'sent_date': raw_email.sent_date}
+        )
         raw_email.delete()
+        metrics.record_email_outcome('non_transactional_deleted')
+        return
+
+    # Step 1: Attempt parsing with saved functions
+    with metrics.stage_timer('saved_parsers'):
+        parsed_data = HTMLParserService().run_all_parsers(raw_email.raw_text)
+
+    state = {'raw_email_id': raw_email.id, 'parsed_data': parsed_data, 'parsing_method': 'none', 'llm_calls': 0}
+    if _is_complete(parsed_data):
+        logger.info(f"Successfully parsed email {raw_email.id} with a saved parser.")
+        state['parsing_method'] = 'dynamic_html_parser_success'
+        persist_raw_email_task.delay(state)
+    else:
+        ai_extract_raw_email_task.delay(state)
+
+
+@shared_task(max_retries=2, default_retry_delay=60)
+def ai_extract_raw_email_task(state: dict):
+    """Stage 2 (LLM queue): parser generation, AI extraction, regex fallback and data recovery."""
+    raw_email = _load_unparsed_email(state['raw_email_id'])
+    if not raw_email:
         return
 
     html_parser = HTMLParserService()
     ai_service = AIService()
     parsed_data = None
     parsing_method_used = 'none'
-
-    # Step 1 & 2: Attempt parsing with saved functions or generate a new one
-    parsed_data = html_parser.run_all_parsers(raw_email.raw_text)
-    if parsed_data and all(parsed_data.get(key) for key in ['amount', 'date', 'transaction_type', 'narration']):
-        parsing_method_used = 'dynamic_html_parser_success'
-        logger.info(f"Successfully parsed email {raw_email.id} with a saved parser.")
-    else:
-        bank_name = html_parser.get_bank_name_from_html(raw_email.raw_text)
-        if bank_name and bank_name != 'Unknown':
+    llm_calls = state.get('llm_calls', 0)
+    partial_data = state.get('parsed_data') or {}
+    new_parser_code = None
+
+    # Step 2: Generate a new parser for this bank
+    bank_name = html_parser.get_bank_name_from_html(raw_email.raw_text)
+    if bank_name and bank_name != 'Unknown':
+        with metrics.stage_timer('parser_generation'):
             logger.info(f"No working parser for {bank_name}. Attempting to generate a new one.")
-            new_parser_code = ai_service.generate_parser_function(raw_email.raw_text)
+            new_parser_code = ai_service.generate_parser_function(raw_email.raw_text, bank_name=bank_name)
+            llm_calls += 1
             if new_parser_code:
                 logger.info(f"Generated new parser for {bank_name}. Testing...")
                 parsed_data = html_parser.run_single_parser(new_parser_code, raw_email.raw_text)
-                if parsed_data and all(parsed_data.get(key) for key in ['amount', 'date', 'transaction_type', 'narration']):
+                if _is_complete(parsed_data):
                     ParserFunction.objects.update_or_create(bank_name=bank_name, defaults={'parser_code': new_parser_code})
                     parsing_method_used = 'ai_generated_parser_success'
                     logger.info(f"New parser for {bank_name} worked and has been saved.")
@@ -106,75 +194,73 @@ def process_raw_email_task(raw_email_id: int):
             else:
                 logger.error(f"AI failed to generate a parser for {bank_name}.")
 
+    # Without a new parser, a saved parser's partial result goes straight to
+    # data recovery (step 6) instead of the full AI extraction.
+    if not new_parser_code and partial_data:
+        logger.info(f"Completing the partial saved parser result for RawEmail {raw_email.id} with data recovery.")
+        parsed_data = dict(partial_data)
+        parsing_method_used = 'dynamic_html_parser_success'
+
     # Step 3: Final fallback to direct AI extraction
     if not parsed_data:
-        parsed_data = ai_service.extract_transaction_from_email(raw_email.raw_text)
+        with metrics.stage_timer('ai_extraction'):
+            parsed_data = ai_service.extract_transaction_from_email(raw_email.raw_text, bank_name=raw_email.bank_name)
+            llm_calls += 1
         if parsed_data:
             parsing_method_used = 'ai_fallback_success'
 
     # Step 4: Final fallback to direct AI extraction with a direct prompt
     if not parsed_data:
-        parsed_data = ai_service.extract_transaction_from_email_with_direct_prompt(raw_email.raw_text)
+        with metrics.stage_timer('direct_prompt'):
+            parsed_data = ai_service.extract_transaction_from_email_with_direct_prompt(raw_email.raw_text, bank_name=raw_email.bank_name)
+            llm_calls += 1
         if parsed_data:
             parsing_method_used = 'ai_direct_prompt_fallback_success'
 
     # Step 5: Final fallback to regex/subject line extraction
     if not parsed_data:
-        from bs4 import BeautifulSoup
-        import re
-        soup = BeautifulSoup(raw_email.raw_text, 'html.parser')
-        text = soup.get_text(separator=' ', strip=True)
-        subject = ""
-        if hasattr(raw_email, "bank_name") and raw_email.bank_name:
-            subject = raw_email.bank_name.lower()
-        # Try to infer transaction type from subject or text
-        transaction_type = None
-        if "debit" in text.lower() or "debit" in subject:
-            transaction_type = "debit"
-        elif "credit" in text.lower() or "credit" in subject:
-            transaction_type = "credit"
-        # Try to extract amount
-        amount_match = re.search(r'(?:NGN|₦)?\s*([\d,]+\.\d{2})', text)
-        amount = amount_match.group(1).replace(',', '') if amount_match else None
-        # Try to extract date
-        date_match = re.search(r'\d{1,2}[-/]\d{1,2}[-/]\d{4}\s+\d{2}:\d{2}:\d{2}|\w+\s+\d{1,2}(?:th|st|nd|rd)?,\s+\d{4}\s+\d{2}:\d{2}:\d{2}', text)
-        date = date_match.group(0) if date_match else None
-        # Try to extract narration/narrative/description only
-        narration = None
-        narration_match = re.search(r'(?:Narration|Narrative|Description):?\s*(.+?)(?=\n|\s{2,}|$)', text, re.IGNORECASE)
-        if narration_match:
-            narration = narration_match.group(1).strip()
-        else:
-            # Try to find a short phrase that looks like a transaction description (e.g., after "for", "to", "at", etc.)
-            short_desc_match = re.search(r'(?:for|to|at)\s+([A-Za-z0-9\s\-\.\,\&]+?)(?=[\.\,\n]|$)', text, re.IGNORECASE)
-            if short_desc_match:
-                narration = short_desc_match.group(1).strip()
-            else:
-                narration = None
-        # Try to extract account balance
-        balance_match = re.search(r'(?:Balance|Available Balance).*?(?:NGN|₦)?\s*([\d,]+\.\d{2})', text, re.IGNORECASE)
-        account_balance = balance_match.group(1).replace(',', '') if balance_match else None
-
-        parsed_data = {
-            "transaction_type": transaction_type,
-            "amount": amount,
-            "date": date,
-            "narration": narration,
-            "account_balance": account_balance,
-            "bank_name": raw_email.bank_name,
-        }
-
-    # Step 6: Validate and Process the Data
-    is_data_complete = all(parsed_data.get(key) for key in ['amount', 'date', 'transaction_type', 'narration'])
-    if not is_data_complete and parsed_data.get('narration'):
+        with metrics.stage_timer('regex_fallback'):
+            parsed_data = extract_transaction_with_regex(raw_email)
+        if parsed_data.get('transaction_type') or parsed_data.get('amount'):
+            parsing_method_used = 'regex_fallback_success'
+
+    # Keep the fields a saved parser did extract in stage 1 wherever the result
+    # above lacks them, provided that parser belongs to the detected bank.
+    if partial_data and partial_data.get('bank_name') == bank_name:
+        for key, value in partial_data.items():
+            if not parsed_data.get(key) and value is not None:
+                parsed_data[key] = value
+
+    # Step 6: Recover missing fields from an incomplete parse
+    if not _is_complete(parsed_data) and parsed_data.get('narration'):
         logger.warning(f"Initial parse for RawEmail {raw_email.id} is incomplete. Attempting data recovery...")
-        recovered_data = ai_service.recover_missing_data_from_text(parsed_data['narration'])
+        with metrics.stage_timer('data_recovery'):
+            recovered_data = ai_service.recover_missing_data_from_text(parsed_data['narration'], bank_name=raw_email.bank_name)
+            llm_calls += 1
         if recovered_data:
             for key, value in recovered_data.items():
                 if not parsed_data.get(key) and value is not None:
                     parsed_data[key] = value
             logger.info(f"Successfully recovered data for RawEmail {raw_email.id}.")
 
+    persist_raw_email_task.delay({
+        'raw_email_id': raw_email.id,
+        'parsed_data': parsed_data,
+        'parsing_method': parsing_method_used,
+        'llm_calls': llm_calls,
+    })
+
+
+@shared_task
+def persist_raw_email_task(state: dict):
+    """Stage 3: drop non-transactional emails, validate and save the transaction."""
+    raw_email = _load_unparsed_email(state['raw_email_id'])
+    if not raw_email:
+        return
+
+    parsed_data = state['parsed_data'] or {}
+    llm_calls = state.get('llm_calls', 0)
+
     # Step 7: Handle Non-Transactional Emails
     narration_lower = (parsed_data.get('narration') or "").lower()
     non_transactional_keywords = [
@@ -185,9 +271,77 @@ def process_raw_email_task(raw_email_id: int):
     if any(keyword in narration_lower for keyword in non_transactional_keywords) or parsed_data.get('transaction_type') is None:
         logger.info(f"Detected and deleting non-transactional email (ID: {raw_email.id})")
         raw_email.delete()
+        metrics.record_email_outcome('non_transactional_deleted', llm_calls)
         return
 
-    # Step 7: Final Validation and Transaction Creation
+    # Step 8: Final Validation and Transaction Creation
+    with metrics.stage_timer('persistence'):
+        outcome, transaction = persist_parsed_email(raw_email, parsed_data, state['parsing_method'])
+    metrics.record_email_outcome(outcome, llm_calls)
+
+    # Categorize inline from the user's history; only narrations it cannot
+    # resolve are handed to the LLM categorization stage.
+    if transaction and transaction.category_id is None:
+        service = CategorizationService()
+        category_name = service.resolve(transaction)
+        if category_name:
+            service.assign(transaction, category_name)
+        else:
+            categorize_transaction_task.delay(transaction.id)
+
+
+def extract_transaction_with_regex(raw_email):
+    """Last-resort extraction of transaction details from the email text using regexes."""
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(raw_email.raw_text, 'html.parser')
+    text = soup.get_text(separator=' ', strip=True)
+    subject = ""
+    if hasattr(raw_email, "bank_name") and raw_email.bank_name:
+        subject = raw_email.bank_name.lower()
+    # Try to infer transaction type from subject or text
+    transaction_type = None
+    if "debit" in text.lower() or "debit" in subject:
+        transaction_type = "debit"
+    elif "credit" in text.lower() or "credit" in subject:
+        transaction_type = "credit"
+    # Try to extract amount
+    amount_match = re.search(r'(?:NGN|₦)?\s*([\d,]+\.\d{2})', text)
+    amount = amount_match.group(1).replace(',', '') if amount_match else None
+    # Try to extract date
+    date_match = re.search(r'\d{1,2}[-/]\d{1,2}[-/]\d{4}\s+\d{2}:\d{2}:\d{2}|\w+\s+\d{1,2}(?:th|st|nd|rd)?,\s+\d{4}\s+\d{2}:\d{2}:\d{2}', text)
+    date = date_match.group(0) if date_match else None
+    # Try to extract narration/narrative/description only
+    narration = None
+    narration_match = re.search(r'(?:Narration|Narrative|Description):?\s*(.+?)(?=\n|\s{2,}|$)', text, re.IGNORECASE)
+    if narration_match:
+        narration = narration_match.group(1).strip()
+    else:
+        # Try to find a short phrase that looks like a transaction description (e.g., after "for", "to", "at", etc.)
+        short_desc_match = re.search(r'(?:for|to|at)\s+([A-Za-z0-9\s\-\.\,\&]+?)(?=[\.\,\n]|$)', text, re.IGNORECASE)
+        if short_desc_match:
+            narration = short_desc_match.group(1).strip()
+        else:
+            narration = None
+    # Try to extract account balance
+    balance_match = re.search(r'(?:Balance|Available Balance).*?(?:NGN|₦)?\s*([\d,]+\.\d{2})', text, re.IGNORECASE)
+    account_balance = balance_match.group(1).replace(',', '') if balance_match else None
+
+    return {
+        "transaction_type": transaction_type,
+        "amount": amount,
+        "date": date,
+        "narration": narration,
+        "account_balance": account_balance,
+        "bank_name": raw_email.bank_name,
+    }
+
+
+def persist_parsed_email(raw_email, parsed_data, parsing_method_used):
+    """
+    Validates the parsed data, creates or updates the Transaction and marks the
+    RawEmail as parsed. Returns the final parsing method recorded on the email
+    and the saved transaction (None when nothing was saved).
+    """
     try:
         amount = extract_decimal(parsed_data.get('amount'))
         account_balance = extract_decimal(parsed_data.get('account_balance'))
@@ -205,7 +359,7 @@ def process_raw_email_task(raw_email_id: int):
             raw_email.transaction_data = parsed_data
             raw_email.save()
             logger.critical(f"CRITICAL: All parsing methods failed for RawEmail ID {raw_email.id}. Marked for manual review.")
-            return
+            return raw_email.parsing_method, None
 
         trans_date = parse_date_with_fallback(date_str)
         if not trans_date:
@@ -218,7 +372,7 @@ def process_raw_email_task(raw_email_id: int):
                 raw_email.transaction_data = parsed_data
                 raw_email.save()
                 logger.critical(f"CRITICAL: Could not parse date for RawEmail ID {raw_email.id}. Marked for manual review.")
-                return
+                return raw_email.parsing_method, None
 
         # Ensure both dates are timezone-aware or naive for comparison
         if raw_email.sent_date:
@@ -259,6 +413,8 @@ def process_raw_email_task(raw_email_id: int):
         else:
             logger.info(f"Updated transaction for RawEmail {raw_email.id} using {parsing_method_used}.")
 
+        return raw_email.parsing_method, transaction
+
     except Exception as e:
         logger.error(f"Error for RawEmail {raw_email.id}. Error: {str(e)}, Data: {parsed_data}")
         raw_email.parsed = True
@@ -267,6 +423,8 @@ def process_raw_email_task(raw_email_id: int):
         raw_email.transaction_data = parsed_data
         raw_email.save()
 
+    return raw_email.parsing_method, None
+
 
 @shared_task(max_retries=3, default_retry_delay=60)
 def sync_user_transactions_task(user_id, start_date_iso, end_date_iso):
@@ -310,34 +468,98 @@ def sync_user_transactions_task(user_id, start_date_iso, end_date_iso):
         logger.error(f"Failed to fetch emails for user {user_id}: {e}")
         return
 
+    message_ids = [email_details['id'] for email_details in emails]
+    already_seen = set(RawEmail.objects.filter(user=user, email_id__in=message_ids).values_list('email_id', flat=True))
+    already_seen |= set(RejectedEmail.objects.filter(user=user, email_id__in=message_ids).values_list('email_id', flat=True))
+
+    classifier = EmailClassifier()
     email_count = 0
+    rejected_count = 0
     for email_details in emails:
         email_body = email_details['body']
         message_id = email_details['id']
         sent_date = email_details.get('sent_date')
         bank_name = gmail_service.get_bank_name(email_details['headers'])
 
-        if not RawEmail.objects.filter(user=user, email_id=message_id).exists():
-            raw_email = RawEmail.objects.create(
+        if message_id in already_seen:
+            continue
+        if not email_body or not email_details['headers']:
+            # get_email_details returns an empty email when Gmail fails; leave it
+            # unrecorded so the next sync fetches it again.
+            logger.warning(f"Skipping email {message_id} for user {user_id}: Gmail returned no body or headers.")
+            continue
+        already_seen.add(message_id)
+
+        # Discard login alerts, security notices, marketing, etc. before any parsing work.
+        subject = get_header(email_details['headers'], 'subject')
+        sender = get_header(email_details['headers'], 'from')
+        is_transactional, reason = classifier.classify(subject=subject, sender=sender, body=email_body, bank_name=bank_name)
+        if not is_transactional:
+            RejectedEmail.objects.get_or_create(
                 user=user,
                 email_id=message_id,
-                raw_text=email_body,
-                bank_name=bank_name,
-                sent_date=sent_date,
-                parsing_method='none'
+                defaults={
+                    'bank_name': bank_name,
+                    'sender': sender[:255],
+                    'subject': subject[:255],
+                    'reason': reason,
+                    'sent_date': sent_date,
+                }
             )
-            process_raw_email_task.delay(raw_email.id)
-            email_count += 1
+            rejected_count += 1
+            continue
+
+        raw_email = RawEmail.objects.create(
+            user=user,
+            email_id=message_id,
+            raw_text=email_body,
+            bank_name=bank_name,
+            sent_date=sent_date,
+            parsing_method='none'
+        )
+        process_raw_email_task.delay(raw_email.id)
+        email_count += 1
 
+    logger.info(f"Rejected {rejected_count} non-transactional emails for user {user.username}.")
     logger.info(f"Found {len(emails)} emails, processing {email_count} new ones for user {user.username}.")
     return f"Initiated processing for {email_count} new emails for user {user.username}."
 
 @shared_task
-def categorize_transactions_for_user(user_id):
+def categorize_transaction_task(transaction_id):
+    """
+    Stage 4 of the email pipeline: categorizes a single new transaction that the
+    user's history could not resolve during persistence, using the LLM.
+    """
+    try:
+        tx = Transaction.objects.get(id=transaction_id)
+    except Transaction.DoesNotExist:
+        logger.error(f"Categorization failed: Transaction {transaction_id} not found.")
+        return
+
+    if tx.category_id is not None:
+        return
+
+    service = CategorizationService()
+    matched_category_name = service.categorize(tx)
+    if matched_category_name and matched_category_name != "Unknown":
+        service.assign(tx, matched_category_name)
+    else:
+        # Picked up again by retry_due_categorizations_task once the backoff expires.
+        service.defer(tx)
+    return matched_category_name
+
+
+@shared_task
+def categorize_transactions_for_user(user_id, full_scan=False):
     """
     A robust task to categorize a user's transactions using a multi-step process:
-    1. Similarity check against already categorized transactions.
-    2. AI-powered categorization with few-shot learning from the user's history.
+    1. Keyword rules and similarity check against already categorized transactions.
+    2. Batched AI-powered categorization with few-shot learning from the user's history.
+
+    Runs are incremental: only transactions created since the user's checkpoint
+    and failed ones whose retry is due are examined. Transactions the AI could
+    not categorize are retried on a backoff schedule. Pass full_scan=True to
+    ignore the checkpoint (retry schedules are still respected).
     """
     try:
         user = User.objects.get(id=user_id)
@@ -345,136 +567,257 @@ def categorize_transactions_for_user(user_id):
         logger.error(f"Categorization task failed: User with id {user_id} not found.")
         return
 
-    # Fetch all uncategorized transactions for the user
+    state, _ = UserTransactionCategorizationState.objects.get_or_create(user=user)
+    now = timezone.now()
+
     transactions_to_process = Transaction.objects.filter(
         user=user,
         category__isnull=True
-    ).order_by('date')
+    ).filter(
+        Q(next_categorization_at__isnull=True) | Q(next_categorization_at__lte=now)
+    )
+    if state.last_processed_date and not full_scan:
+        # The overlap catches rows whose creating transaction committed after a
+        # newer row was already checkpointed.
+        transactions_to_process = transactions_to_process.filter(
+            Q(created_at__gt=state.last_processed_date - CATEGORIZATION_CHECKPOINT_OVERLAP)
+            | Q(next_categorization_at__lte=now)
+        )
+    transactions_to_process = list(transactions_to_process.order_by('date'))
 
-    if not transactions_to_process.exists():
+    if not transactions_to_process:
         logger.info(f"No new transactions to categorize for user {user.username}")
         return "No new transactions to categorize."
 
-    # --- Prepare data for categorization ---
-    
-    # 1. Get all possible category names
-    all_categories = list(TransactionCategory.objects.values_list('name', flat=True))
-    if not all_categories:
+    # The service keeps an in-memory lookup of the user's categorized history,
+    # warmed once per worker and extended as this run assigns new categories.
+    service = CategorizationService()
+    if not service.category_ids:
         logger.warning(f"Cannot categorize for user {user.username}: No TransactionCategory records exist.")
         return "No categories available to assign."
 
-    # 2. Get all of the user's *already categorized* transactions for learning
-    # We convert to a list to dynamically add new categorizations during the run
-    categorized_transactions = list(Transaction.objects.filter(
-        user=user,
-        category__isnull=False
-    ).exclude(category__name="Unknown").values('narration', 'category__name'))
+    # Score every pending narration against the history in one batch; the ones
+    # left unresolved go to the LLM in batched prompts, one per merchant.
+    categorized = service.categorize_many(transactions_to_process)
 
-    # 3. Initialize the AI service
-    ai_service = AIService()
-    
-    processed_count = 0
+    assignments, failed = [], []
     for tx in transactions_to_process:
-        narration_lower = tx.narration.lower()
-        matched_category_name = None
-
-        # --- Step 1: Fast Similarity Check (difflib) ---
-        # Find the best match among existing transactions if similarity is high.
-        if categorized_transactions:
-            # Create a simple function to calculate similarity
-            def get_similarity(item):
-                return difflib.SequenceMatcher(None, narration_lower, item['narration'].lower()).ratio()
-
-            best_match = max(categorized_transactions, key=get_similarity)
-            similarity_score = get_similarity(best_match)
-
-            if similarity_score > 0.85: # Using a slightly higher threshold for confidence
-                matched_category_name = best_match['category__name']
-                logger.info(f"Categorized tx {tx.id} as '{matched_category_name}' via similarity match (score: {similarity_score:.2f})")
-
-        # --- Step 2: AI-Powered Categorization (if no high-similarity match) ---
-        if not matched_category_name:
-            # Provide recent, relevant examples for the AI to learn from
-            ai_examples = categorized_transactions[-10:] # Use last 10 as examples
-            
-            logger.info(f"Using AI to categorize transaction {tx.id}...")
-            matched_category_name = ai_service.categorize_transaction(
-                narration=tx.narration,
-                categories=all_categories,
-                examples=ai_examples
-            )
-            logger.info(f"AI categorized tx {tx.id} as '{matched_category_name}'")
+        matched_category_name = categorized.get(tx.id)
+        if matched_category_name and matched_category_name != "Unknown":
+            assignments.append((tx, matched_category_name))
+        else:
+            failed.append(tx)
+
+    try:
+        # Rows categorized by hand while the LLM was working are skipped.
+        assignments = service.assign_many(assignments)
+    except Exception as e:
+        logger.error(f"Could not assign categories for user {user.username}. Error: {e}")
+        return f"Categorization failed for user {user.username}."
+    retrying = service.defer_many(failed)
+
+    newest = max(tx.created_at for tx in transactions_to_process)
+    if not state.last_processed_date or newest > state.last_processed_date:
+        state.last_processed_date = newest
+        state.save(update_fields=['last_processed_date'])
+
+    return (
+        f"Categorized {len(assignments)} transactions for user {user.username}; "
+        f"{len(retrying)} scheduled for retry."
+    )
+
+
+@shared_task
+def aggregate_merchant_catalogue_task():
+    """
+    Periodic task that rebuilds the shared merchant -> category catalogue from
+    all users' categorized transactions.
+    """
+    published = rebuild_merchant_catalogue()
+    return f"Published {published} merchants."
+
+
+@shared_task
+def retry_due_categorizations_task():
+    """
+    Periodic task that re-runs categorization for every user with failed
+    transactions whose backoff has expired.
+    """
+    user_ids = Transaction.objects.filter(
+        category__isnull=True,
+        next_categorization_at__lte=timezone.now()
+    ).values_list('user_id', flat=True).distinct()
+    for user_id in user_ids:
+        categorize_transactions_for_user.delay(user_id)
+
 
-        # --- Step 3: Assign the Category ---
-        if matched_category_name:
-            try:
-                # Get or create to be safe, though it should exist from `all_categories`
-                category_obj, _ = TransactionCategory.objects.get_or_create(name=matched_category_name)
-                tx.category = category_obj
-                tx.save()
-                
-                # Only count non-"Unknown" as successfully processed
-                if matched_category_name != "Unknown":
-                    processed_count += 1
-                    # Add this newly categorized transaction to our list for the next iteration in this run
-                    # This helps the model learn from its own recent decisions within the same batch
-                    categorized_transactions.append({'narration': tx.narration, 'category__name': matched_category_name})
+def _reconcile_keys(user_id):
+    return f"reconcile:scheduled:{user_id}", f"reconcile:last_edit:{user_id}"
+
+
+def schedule_reconciliation(user_id):
+    """
+    Debounces reconciliation for a user: the first manual correction schedules
+    one reconcile_user_corrections_task, and later corrections only extend its
+    wait, so a burst of edits is reconciled in a single pass.
+    """
+    scheduled_key, last_edit_key = _reconcile_keys(user_id)
+    now = time.time()
+    try:
+        cache.set(last_edit_key, now, timeout=RECONCILE_MAX_DELAY_SECONDS * 2)
+        if not cache.add(scheduled_key, now, timeout=RECONCILE_MAX_DELAY_SECONDS * 2):
+            return
+    except Exception as e:
+        logger.warning(f"Could not debounce reconciliation for user {user_id}: {e}")
+    reconcile_user_corrections_task.apply_async((user_id, now), countdown=RECONCILE_DEBOUNCE_SECONDS)
 
-            except Exception as e:
-                logger.error(f"Could not assign category '{matched_category_name}' to transaction {tx.id}. Error: {e}")
 
-    return f"Categorized {processed_count} transactions for user {user.username}."
+@shared_task
+def reconcile_user_corrections_task(user_id, first_edit_at=None):
+    """
+    Applies every pending manual correction of a user (transactions with
+    is_manually_categorized set) in one reconciliation pass, once the user has
+    stopped editing for RECONCILE_DEBOUNCE_SECONDS.
+    """
+    scheduled_key, last_edit_key = _reconcile_keys(user_id)
+    now = time.time()
+    try:
+        last_edit = cache.get(last_edit_key)
+    except Exception:
+        last_edit = None
+    if last_edit and first_edit_at and now - last_edit < RECONCILE_DEBOUNCE_SECONDS \
+            and now - first_edit_at < RECONCILE_MAX_DELAY_SECONDS:
+        countdown = RECONCILE_DEBOUNCE_SECONDS - (now - last_edit)
+        reconcile_user_corrections_task.apply_async((user_id, first_edit_at), countdown=countdown)
+        return "Reconciliation deferred; the user is still editing."
+
+    # Corrections made from here on schedule a new pass.
+    try:
+        cache.delete(scheduled_key)
+    except Exception:
+        pass
+
+    # Oldest first, so the latest correction of a merchant is applied last.
+    corrections = list(
+        Transaction.objects.filter(user_id=user_id, is_manually_categorized=True)
+        .select_related('category').order_by('date', 'id')
+    )
+    if not corrections:
+        return "No corrections to reconcile."
+    return _reconcile_corrections(user_id, corrections)
 
 
 @shared_task
 def reconcile_similar_transactions_task(transaction_id):
     """
-    Triggered after a user manually changes a transaction's category.
-    This task finds transactions with similar narrations and updates their
-    category to match the user's correction, effectively 'learning' from it.
+    Reconciles a single manual correction. Kept for messages queued before
+    corrections were coalesced per user; see reconcile_user_corrections_task.
     """
     try:
-        source_transaction = Transaction.objects.get(id=transaction_id)
+        source_transaction = Transaction.objects.select_related('category').get(id=transaction_id)
     except Transaction.DoesNotExist:
         logger.error(f"Reconciliation task failed: Transaction {transaction_id} not found.")
         return
+    return _reconcile_corrections(source_transaction.user_id, [source_transaction])
 
-    user = source_transaction.user
-    correct_category = source_transaction.category
-    source_narration = source_transaction.narration.lower()
 
-    # If the user sets the category to null, we don't propagate this change.
-    if not correct_category:
-        logger.info(f"Reconciliation skipped: Category for Tx {transaction_id} was set to null.")
-        return
+def _reconcile_corrections(user_id, corrections):
+    """
+    Triggered after a user manually changes transaction categories. Finds
+    transactions with similar narrations and updates their category to match
+    the user's corrections, effectively 'learning' from them. All corrections
+    are applied in one pass; a transaction similar to several of them takes
+    the category of the closest one.
+    """
+    # Clearing the flag only where the category is unchanged keeps a
+    # correction that was edited again meanwhile pending for the next pass.
+    def clear_flags():
+        for tx in corrections:
+            Transaction.objects.filter(
+                pk=tx.pk, category_id=tx.category_id, is_manually_categorized=True
+            ).update(is_manually_categorized=False)
 
-    # Find other transactions from the same user that are NOT in the correct category yet.
-    # This includes uncategorized transactions or those with a different category.
-    candidate_transactions = Transaction.objects.filter(
-        user=user
-    ).exclude(
-        id=transaction_id
-    ).exclude(
-        category=correct_category
+    # If the user sets the category to null, we don't propagate this change.
+    sources = [tx for tx in corrections if tx.category_id]
+    if not sources:
+        logger.info(f"Reconciliation skipped: {len(corrections)} corrections for user {user_id} set the category to null.")
+        clear_flags()
+        return "Reconciled 0 transactions."
+
+    # Pre-select candidates in SQL with the pg_trgm index on narration, so only
+    # plausible matches are loaded instead of the user's whole history. The OR
+    # of trigram conditions is split into bounded groups and uses a stricter
+    # threshold than pg_trgm's 0.3 default.
+    exclude_ids = {tx.id for tx in corrections}
+    candidates = {}
+    narrations = list(dict.fromkeys(tx.narration for tx in sources))
+    with db_transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute("SET LOCAL pg_trgm.similarity_threshold = %s", [RECONCILE_TRIGRAM_THRESHOLD])
+        for start in range(0, len(narrations), RECONCILE_PREFILTER_GROUP_SIZE):
+            similar = Q()
+            for narration in narrations[start:start + RECONCILE_PREFILTER_GROUP_SIZE]:
+                similar |= Q(narration__trigram_similar=narration)
+            remaining = RECONCILE_MAX_CANDIDATES - len(candidates)
+            rows = Transaction.objects.filter(user_id=user_id).filter(similar).exclude(
+                id__in=exclude_ids
+            ).order_by('-date').only('id', 'narration', *ROLLUP_FIELDS)[:remaining]
+            for tx in rows:
+                candidates.setdefault(tx.id, tx)
+            if len(candidates) >= RECONCILE_MAX_CANDIDATES:
+                logger.warning(f"Reconciliation for user {user_id} stopped at {RECONCILE_MAX_CANDIDATES} candidates.")
+                break
+    candidates = list(candidates.values())
+
+    # Confirm with the same measures the categorizer uses: an identical merchant
+    # key, or a high n-gram similarity to be confident in the automatic change.
+    # A merchant key match wins; among several, the latest correction.
+    matched, changes = [], []
+    if candidates:
+        vectorizer = NarrationVectorizer()
+        source_vectors_t = vectorizer.transform([tx.narration for tx in sources]).T.tocsr()
+        source_by_key = {}
+        for col, source in enumerate(sources):
+            key = merchant_key(source.narration)
+            if key:
+                source_by_key[key] = col
+
+        for start in range(0, len(candidates), RECONCILE_SCORE_CHUNK_SIZE):
+            chunk = candidates[start:start + RECONCILE_SCORE_CHUNK_SIZE]
+            # Sparse (chunk x sources) scores; only the row-wise best is kept.
+            scores = vectorizer.transform([tx.narration for tx in chunk]).dot(source_vectors_t)
+            best_cols = np.asarray(scores.argmax(axis=1)).ravel()
+            best_scores = scores.max(axis=1).toarray().ravel()
+
+            for row, tx in enumerate(chunk):
+                key = merchant_key(tx.narration)
+                if key and key in source_by_key:
+                    best = sources[source_by_key[key]]
+                elif best_scores[row] > RECONCILE_SIMILARITY_THRESHOLD:
+                    best = sources[best_cols[row]]
+                else:
+                    continue
+                if tx.category_id == best.category_id:
+                    continue
+                logger.info(f"Reconciling Tx {tx.id} based on user correction for Tx {best.id}. New category: '{best.category.name}'.")
+                changes.append((snapshot(tx), tx))
+                tx.category_id = best.category_id
+                tx.is_manually_categorized = False # This change is automatic, not manual.
+                matched.append((tx, best.category.name))
+
+    with db_transaction.atomic():
+        Transaction.objects.bulk_update([tx for tx, _ in matched], ['category', 'is_manually_categorized'], batch_size=500)
+        apply_rollup_changes(changes)
+    record_categorizations(
+        user_id,
+        [(tx.narration, tx.category.name) for tx in sources] + [(tx.narration, name) for tx, name in matched]
     )
+    clear_flags()
 
-    updated_count = 0
-    for tx in candidate_transactions:
-        # Use a high similarity ratio to be confident in the automatic change.
-        similarity = difflib.SequenceMatcher(None, source_narration, tx.narration.lower()).ratio()
-        
-        if similarity > 0.85:
-            logger.info(f"Reconciling Tx {tx.id} based on user correction for Tx {source_transaction.id}. New category: '{correct_category.name}'.")
-            tx.category = correct_category
-            tx.is_manually_categorized = False # This change is automatic, not manual.
-            tx.save(update_fields=['category', 'is_manually_categorized'])
-            updated_count += 1
-            
-    logger.info(f"Reconciled and updated {updated_count} transactions based on user correction for Tx {transaction_id}.")
+    updated_count = len(matched)
+    logger.info(f"Reconciled and updated {updated_count} transactions based on {len(sources)} user corrections for user {user_id}.")
     return f"Reconciled {updated_count} transactions."
 
 
-
 @shared_task
 def reprocess_failed_emails_task(user_id):
     """
@@ -489,9 +832,10 @@ def reprocess_failed_emails_task(user_id):
         return
 
     # Find emails that are either un-parsed or marked as failed.
+    # Exact method values, unlike icontains, can use rawemail_user_parsed_idx.
     failed_emails = RawEmail.objects.filter(
         Q(user=user) & 
-        (Q(parsed=False) | Q(parsing_method__icontains='failed'))
+        (Q(parsed=False) | Q(parsing_method__in=FAILED_PARSING_METHODS))
     )
     
     count = failed_emails.count()
@@ -514,7 +858,6 @@ def reprocess_failed_emails_task(user_id):
 
 from .pdf_generate import PDFReportGenerator
 from django.core.mail import EmailMessage
-from django.utils import timezone
 
 
 @shared_task
@@ -1,3 +1,1190 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import random
+import unittest
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Q, Sum
+from django.http import QueryDict
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from receipts.models import Receipt
+from transactions import analytics, lean_serialization, metrics, response_cache
+
+from transactions.email_classifier import EmailClassifier
+from transactions.filters import filter_transactions
+from transactions.models import (
+    DailyTransactionRollup, RawEmail, Transaction, TransactionCategory, UserCategorizationIndex, UserCategoryMapping,
+    UserTransactionCategorizationState,
+)
+from transactions.rollups import rebuild_rollups
+from transactions.serializers import TransactionSerializer
+from transactions.services import categorization_service, keyword_rules, merchant_catalogue
+from transactions.services.ai_service import AIService
+from transactions.services.categorization_service import (
+    CATEGORIZATION_RETRY_BASE, MAX_CATEGORIZATION_ATTEMPTS, SIMILARITY_THRESHOLD, CategorizationService,
+    UserCategoryLookup, get_user_lookup,
+)
+from transactions.services.keyword_rules import KeywordRuleSet
+from transactions.services.merchant_catalogue import (
+    MIN_MERCHANT_USERS, aggregate_merchant_votes, get_merchant_catalogue, rebuild_merchant_catalogue
+)
+from transactions.services.narration_normalizer import merchant_key
+from transactions.services.narration_similarity import NarrationIndex, NarrationVectorizer
+from transactions.services.prompt_minimizer import PromptMinimizer, TokenUsageTracker
+from transactions import tasks
+from transactions.tasks import FAILED_PARSING_METHODS, categorize_transactions_for_user
+
+User = get_user_model()
+
+
+def _plan_nodes(plan):
+    yield plan
+    for child in plan.get('Plans', []):
+        yield from _plan_nodes(child)
+
+
+def sequential_scans(queryset):
+    """Tables read with a sequential scan anywhere in a queryset's JSON EXPLAIN plan."""
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return [node['Relation Name'] for node in _plan_nodes(plan[0]['Plan']) if node['Node Type'] == 'Seq Scan']
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'Query plans are checked on PostgreSQL only.')
+class HotQueryPlanTests(TestCase):
+    """
+    The hot Transaction and RawEmail queries avoid sequential scans on a
+    dataset shaped like production: a few heavy users and a long tail,
+    categories and parse failures unevenly spread, and fresh statistics.
+    """
+
+    USERS = 40
+    # The heaviest user has this many transactions and raw emails; user n has 1/(n+1) of it.
+    LARGEST_USER_ROWS = 12000
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(42)
+        now = timezone.now()
+        categories = [TransactionCategory.objects.create(name=f'Category {n}') for n in range(15)]
+        category_weights = [1 / (rank + 1) for rank in range(len(categories))]
+        users = []
+        for rank in range(cls.USERS):
+            user = User.objects.create(username=f'plans{rank}')
+            users.append(user)
+            rows = cls.LARGEST_USER_ROWS // (rank + 1)
+            Transaction.objects.bulk_create(
+                (
+                    Transaction(
+                        user=user,
+                        transaction_type='credit' if rng.random() < 0.2 else 'debit',
+                        amount=Decimal(rng.randint(100, 500000)),
+                        date=now - timedelta(minutes=53 * i),
+                        narration=f'TRF/{rng.randint(10 ** 9, 10 ** 10)}/merchant {int(rng.paretovariate(1.2)) % 500}',
+                        category=None if rng.random() < 0.03 else rng.choices(categories, weights=category_weights)[0],
+                        next_categorization_at=now - timedelta(hours=1) if rng.random() < 0.005 else None,
+                    )
+                    for i in range(rows)
+                ),
+                batch_size=5000,
+            )
+            RawEmail.objects.bulk_create(
+                (
+                    RawEmail(
+                        user=user,
+                        email_id=f'{user.id}-{i}',
+                        raw_text='email',
+                        parsed=rng.random() >= 0.01,
+                        parsing_method=rng.choice(FAILED_PARSING_METHODS) if rng.random() < 0.01
+                        else 'dynamic_html_parser_success',
+                    )
+                    for i in range(rows)
+                ),
+                batch_size=5000,
+            )
+        # A user from the middle of the distribution, like most requests.
+        cls.user = users[10]
+        cls.category = categories[0]
+        with connection.cursor() as cursor:
+            for model in (Transaction, RawEmail):
+                cursor.execute(f'ANALYZE {connection.ops.quote_name(model._meta.db_table)}')
+
+    def assertNoSequentialScans(self, queryset):
+        self.assertEqual(sequential_scans(queryset), [])
+
+    def test_transaction_list_page(self):
+        self.assertNoSequentialScans(Transaction.objects.filter(user=self.user).order_by('-date', '-id')[:100])
+
+    def test_debit_aggregate(self):
+        now = timezone.now()
+        self.assertNoSequentialScans(
+            Transaction.objects.filter(
+                user=self.user, transaction_type='debit', date__range=[now - timedelta(days=30), now]
+            ).values('transaction_type').annotate(total=Sum('amount')).order_by()
+        )
+
+    def test_category_transactions(self):
+        self.assertNoSequentialScans(
+            Transaction.objects.filter(user=self.user, category=self.category).values('narration')
+        )
+
+    def test_uncategorized_backlog(self):
+        self.assertNoSequentialScans(
+            Transaction.objects.filter(user=self.user, category__isnull=True).order_by('date')
+        )
+
+    def test_retry_due_categorizations(self):
+        self.assertNoSequentialScans(
+            Transaction.objects.filter(
+                category__isnull=True, next_categorization_at__lte=timezone.now()
+            ).values_list('user_id', flat=True).distinct()
+        )
+
+    def test_narration_search(self):
+        self.assertNoSequentialScans(
+            Transaction.objects.filter(user=self.user, narration__icontains='merchant 17').order_by('-date', '-id')[:100]
+        )
+
+    def test_unparsed_emails(self):
+        self.assertNoSequentialScans(RawEmail.objects.filter(user=self.user, parsed=False))
+
+    def test_reprocess_failed_emails(self):
+        self.assertNoSequentialScans(
+            RawEmail.objects.filter(Q(user=self.user) & (Q(parsed=False) | Q(parsing_method__in=FAILED_PARSING_METHODS)))
+        )
+
+
+def rollup_rows(user):
+    return {
+        (row.day, row.category_id, row.transaction_type, row.bank_name): (row.total_amount, row.transaction_count)
+        for row in DailyTransactionRollup.objects.filter(user=user)
+    }
+
+
+class RollupMaintenanceTests(TestCase):
+    """Every write path leaves the daily rollups equal to a rebuild from the Transaction table."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='rollups')
+        cls.food = TransactionCategory.objects.create(name='Food')
+        cls.transport = TransactionCategory.objects.create(name='Transport')
+
+    def create(self, amount, category=None, days_ago=0, **kwargs):
+        return Transaction.objects.create(
+            user=self.user, transaction_type='debit', amount=Decimal(amount),
+            date=timezone.now() - timedelta(days=days_ago), narration=f'POS PURCHASE {amount}',
+            category=category, bank_name='Kuda Bank', **kwargs
+        )
+
+    def assertRollupsMatchTransactions(self):
+        maintained = rollup_rows(self.user)
+        rebuild_rollups(user_id=self.user.id)
+        self.assertEqual(maintained, rollup_rows(self.user))
+
+    def test_created_transactions_are_added(self):
+        self.create('100.00', self.food)
+        self.create('250.50', self.food)
+        self.create('40.00', self.transport, days_ago=1)
+        self.create('12.00')
+        self.assertRollupsMatchTransactions()
+        self.assertEqual(
+            rollup_rows(self.user)[(timezone.localdate(), self.food.id, 'debit', 'Kuda Bank')],
+            (Decimal('350.50'), 2),
+        )
+
+    def test_save_moves_the_amount_between_rollups(self):
+        tx = self.create('100.00', self.food)
+        tx.amount = Decimal('120.00')
+        tx.date = tx.date - timedelta(days=2)
+        tx.save()
+        self.assertRollupsMatchTransactions()
+
+    def test_save_with_update_fields_naming_the_foreign_key(self):
+        tx = self.create('100.00', self.food)
+        tx.category = self.transport
+        tx.save(update_fields=['category'])
+        self.assertRollupsMatchTransactions()
+        self.assertNotIn((timezone.localdate(), self.food.id, 'debit', 'Kuda Bank'), rollup_rows(self.user))
+
+    def test_clearing_the_category_requeues_the_transaction(self):
+        tx = self.create('100.00', self.food)
+        tx.category = None
+        tx.save(update_fields=['category'])
+        tx.refresh_from_db()
+        self.assertIsNotNone(tx.next_categorization_at)
+        self.assertRollupsMatchTransactions()
+
+    def test_deleted_transactions_are_removed(self):
+        kept = self.create('100.00', self.food)
+        self.create('60.00', self.food).delete()
+        self.assertRollupsMatchTransactions()
+        self.assertEqual(
+            rollup_rows(self.user)[(timezone.localdate(), self.food.id, 'debit', 'Kuda Bank')],
+            (kept.amount, 1),
+        )
+
+    def test_deleting_a_category_moves_its_totals_to_uncategorized(self):
+        self.create('100.00', self.food)
+        self.create('30.00')
+        self.food.delete()
+        self.assertRollupsMatchTransactions()
+
+    def test_assign_many_updates_rollups(self):
+        pending = [self.create('100.00'), self.create('200.00')]
+        assigned = CategorizationService().assign_many([(tx, 'Food') for tx in pending])
+        self.assertEqual(len(assigned), 2)
+        self.assertRollupsMatchTransactions()
+
+    def test_assign_many_skips_transactions_categorized_meanwhile(self):
+        stale = self.create('100.00')
+        fresh = Transaction.objects.get(id=stale.id)
+        fresh.category = self.transport
+        fresh.save()
+
+        self.assertEqual(CategorizationService().assign_many([(stale, 'Food')]), [])
+        self.assertEqual(Transaction.objects.get(id=stale.id).category_id, self.transport.id)
+        self.assertRollupsMatchTransactions()
+
+
+class LeanSerializationTests(TestCase):
+    """The transaction list's .values()-based records match TransactionSerializer exactly."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='lean')
+        category = TransactionCategory.objects.create(name='Food')
+        now = timezone.now()
+        cls.with_receipt = Transaction.objects.create(
+            user=cls.user, transaction_type='debit', amount=Decimal('1234.50'), date=now,
+            narration='POS PURCHASE Shoprite Ikeja', category=category, account_balance=Decimal('98765.43'),
+        )
+        Receipt.objects.create(
+            transaction=cls.with_receipt, user=cls.user, uploaded_image_url='https://example.com/r.png',
+            extracted_text='Bread 1,200', items=[{'name': 'Bread', 'price': 1200}],
+        )
+        cls.bare = Transaction.objects.create(
+            user=cls.user, transaction_type='credit', amount=Decimal('5000'), date=now - timedelta(days=3),
+            narration='NIP TRANSFER FROM ADA',
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def serialized(self, transactions):
+        return json.loads(JSONRenderer().render(TransactionSerializer(transactions, many=True).data))
+
+    def test_records_match_the_serializer(self):
+        fields = lean_serialization.parse_fields(None)
+        rows = Transaction.objects.filter(user=self.user).order_by('-date', '-id').values(
+            *lean_serialization.columns_for(fields)
+        )
+        records = [lean_serialization.transaction_record(row, fields) for row in rows]
+        expected = self.serialized(
+            Transaction.objects.filter(user=self.user).order_by('-date', '-id').select_related('receipt', 'category')
+        )
+        self.assertEqual(json.loads(lean_serialization.dumps(records)), expected)
+
+    def test_list_endpoint_matches_the_serializer(self):
+        response = self.client.get(reverse('transaction-list'))
+        self.assertEqual(response.status_code, 200)
+        expected = self.serialized([self.with_receipt, self.bare])
+        self.assertEqual(json.loads(response.content)['results'], expected)
+
+    def test_sparse_fieldset(self):
+        response = self.client.get(reverse('transaction-list'), {'fields': 'id,amount'})
+        self.assertEqual(
+            json.loads(response.content)['results'],
+            [{'id': self.with_receipt.id, 'amount': '1234.50'}, {'id': self.bare.id, 'amount': '5000.00'}],
+        )
+
+    def test_unknown_field_is_rejected(self):
+        response = self.client.get(reverse('transaction-list'), {'fields': 'id,user'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_unchanged_page_returns_304(self):
+        first = self.client.get(reverse('transaction-list'))
+        second = self.client.get(reverse('transaction-list'), HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 304)
+
+
+@mock.patch('transactions.views.schedule_reconciliation')
+class TransactionBulkUpdateTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='bulk')
+        cls.other_user = User.objects.create(username='bulk-other')
+        cls.food = TransactionCategory.objects.create(name='Food')
+        cls.transport = TransactionCategory.objects.create(name='Transport')
+        now = timezone.now()
+        cls.transactions = [
+            Transaction.objects.create(
+                user=cls.user, transaction_type='debit', amount=Decimal(100 * (i + 1)),
+                date=now - timedelta(days=i), narration=f'POS PURCHASE {i}', category=cls.food if i else None,
+            )
+            for i in range(3)
+        ]
+        cls.foreign = Transaction.objects.create(
+            user=cls.other_user, transaction_type='debit', amount=Decimal('50'), date=now, narration='POS PURCHASE',
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def post(self, updates):
+        return self.client.post(reverse('transaction-bulk-update'), {'updates': updates}, format='json')
+
+    def test_updates_categories_and_schedules_one_reconciliation(self, schedule_reconciliation):
+        first, second, _ = self.transactions
+        response = self.post([{'id': first.id, 'category': self.transport.id}, {'id': second.id, 'category': self.transport.id}])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {'updated': 2})
+        for tx in (first, second):
+            tx.refresh_from_db()
+            self.assertEqual(tx.category_id, self.transport.id)
+            self.assertTrue(tx.is_manually_categorized)
+        schedule_reconciliation.assert_called_once_with(self.user.id)
+
+    def test_updates_rollups(self, schedule_reconciliation):
+        self.post([{'id': tx.id, 'category': self.transport.id} for tx in self.transactions])
+        maintained = rollup_rows(self.user)
+        rebuild_rollups(user_id=self.user.id)
+        self.assertEqual(maintained, rollup_rows(self.user))
+
+    def test_clearing_a_category_requeues_the_transaction(self, schedule_reconciliation):
+        tx = self.transactions[1]
+        self.post([{'id': tx.id, 'category': None}])
+        tx.refresh_from_db()
+        self.assertIsNone(tx.category_id)
+        self.assertIsNotNone(tx.next_categorization_at)
+        self.assertEqual(tx.categorization_attempts, 0)
+
+    def test_other_users_transactions_are_not_found(self, schedule_reconciliation):
+        own = self.transactions[0]
+        response = self.post([{'id': own.id, 'category': self.food.id}, {'id': self.foreign.id, 'category': self.food.id}])
+
+        self.assertEqual(response.status_code, 404)
+        own.refresh_from_db()
+        self.foreign.refresh_from_db()
+        self.assertIsNone(own.category_id)
+        self.assertIsNone(self.foreign.category_id)
+        schedule_reconciliation.assert_not_called()
+
+    def test_rejects_duplicates_and_unknown_categories(self, schedule_reconciliation):
+        tx = self.transactions[0]
+        duplicate = self.post([{'id': tx.id, 'category': self.food.id}, {'id': tx.id, 'category': self.transport.id}])
+        unknown = self.post([{'id': tx.id, 'category': 999999}])
+        self.assertEqual(duplicate.status_code, 400)
+        self.assertEqual(unknown.status_code, 400)
+
+    def test_rejects_an_empty_list(self, schedule_reconciliation):
+        self.assertEqual(self.post([]).status_code, 400)
+
+
+class PromptMinimizerTests(SimpleTestCase):
+
+    EMAIL = (
+        '<html><head><style>p {color: red}</style></head><body>'
+        '<table><tr><td>Amount</td><td>NGN 5,000.00</td></tr>'
+        '<tr><td>Narration</td><td>POS SHOPRITE IKEJA</td></tr></table>'
+        '<p>Never share your PIN with anyone.</p><p>Unsubscribe from these alerts</p>'
+        '<p>Copyright 2026 Kuda. All rights reserved.</p>'
+        '</body></html>'
+    )
+
+    def test_text_keeps_table_rows_and_drops_boilerplate(self):
+        self.assertEqual(
+            PromptMinimizer().minimize_text(self.EMAIL),
+            'Amount | NGN 5,000.00\nNarration | POS SHOPRITE IKEJA',
+        )
+
+    def test_html_keeps_the_tag_structure(self):
+        html = '<div><!-- tracking --><script>var a = 1;</script><p>\n\n  Amount  </p><p> </p></div>'
+        self.assertEqual(PromptMinimizer().minimize_html(html), '<div><p> Amount </p><p> </p></div>')
+
+    def test_oversized_html_keeps_the_transaction_table(self):
+        filler = '<div class="promo">' + 'x' * 9000 + '</div>'
+        footer = ''.join(f'<p>Never share your PIN with anyone. Unsubscribe here {i}</p>' for i in range(200))
+        table = '<table><tr><td>Amount</td><td>NGN 5,000.00</td></tr><tr><td>Narration</td><td>POS SHOPRITE</td></tr></table>'
+        html = PromptMinimizer().minimize_html(f'<html><body>{filler}{table}{filler}{footer}</body></html>')
+
+        self.assertLessEqual(len(html), PromptMinimizer().max_html_chars)
+        self.assertIn('NGN 5,000.00', html)
+        self.assertIn('POS SHOPRITE', html)
+        self.assertNotIn('Unsubscribe', html)
+
+
+class TokenUsageTrackerTests(SimpleTestCase):
+
+    def test_totals_are_kept_per_bank(self):
+        tracker = TokenUsageTracker()
+        usage = tracker.record('extract', 'Kuda Bank', 'a' * 400, 'b' * 40, raw_input='c' * 1000)
+        tracker.record('extract', None, 'a' * 4)
+
+        self.assertEqual(usage, {'input_tokens': 100, 'output_tokens': 10})
+        self.assertEqual(tracker.snapshot(), {
+            'Kuda Bank': {'calls': 1, 'raw_input_tokens': 250, 'input_tokens': 100, 'output_tokens': 10},
+            'Unknown': {'calls': 1, 'raw_input_tokens': 1, 'input_tokens': 1, 'output_tokens': 0},
+        })
+
+
+class PipelineMetricsTests(SimpleTestCase):
+
+    def setUp(self):
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+
+    def test_stage_latencies_form_a_cumulative_histogram(self):
+        metrics.record_stage_latency('saved_parsers', 0.004)
+        metrics.record_stage_latency('saved_parsers', 0.2)
+        metrics.record_stage_latency('saved_parsers', 120)
+
+        histogram = metrics.snapshot()['stages']['saved_parsers']
+        buckets = dict(histogram['buckets'])
+        self.assertEqual(histogram['count'], 3)
+        self.assertEqual(histogram['sum'], 4 + 200 + 120000)
+        self.assertEqual(buckets[0.005], 1)
+        self.assertEqual(buckets[0.25], 2)
+        self.assertEqual(buckets[60.0], 2)
+        self.assertEqual(buckets['+Inf'], 3)
+        self.assertEqual(metrics.estimate_quantile(histogram, 0.5), 0.25)
+
+    def test_stage_timer_records_a_failing_block(self):
+        with self.assertRaises(RuntimeError):
+            with metrics.stage_timer('persistence'):
+                raise RuntimeError('boom')
+        self.assertEqual(metrics.snapshot()['stages']['persistence']['count'], 1)
+
+    def test_outcomes_and_llm_calls(self):
+        metrics.record_email_outcome('dynamic_html_parser_success')
+        metrics.record_email_outcome('ai_fallback_success', llm_calls=2)
+        metrics.record_email_outcome('ai_fallback_success', llm_calls=3)
+
+        data = metrics.snapshot()
+        self.assertEqual(data['outcomes']['ai_fallback_success'], 2)
+        self.assertEqual(data['outcomes']['dynamic_html_parser_success'], 1)
+        self.assertEqual(data['outcomes']['all_methods_failed'], 0)
+        self.assertEqual(data['llm_calls']['count'], 3)
+        self.assertEqual(data['llm_calls']['sum'], 5)
+        self.assertEqual(metrics.estimate_quantile(data['llm_calls'], 1.0), 3.0)
+
+    def test_prometheus_rendering(self):
+        metrics.record_stage_latency('ai_extraction', 1.5)
+        metrics.record_email_outcome('regex_fallback_success', llm_calls=1)
+
+        text = metrics.render_prometheus()
+        self.assertIn('email_pipeline_stage_seconds_bucket{stage="ai_extraction",le="2.5"} 1', text)
+        self.assertIn('email_pipeline_stage_seconds_sum{stage="ai_extraction"} 1.500', text)
+        self.assertIn('email_pipeline_outcomes_total{parsing_method="regex_fallback_success"} 1', text)
+        self.assertIn('email_pipeline_llm_calls_per_email_count 1', text)
+
+
+class EmailClassifierTests(SimpleTestCase):
+
+    def classify(self, subject='', sender='alerts@bank.com', body='', **kwargs):
+        return EmailClassifier().classify(subject=subject, sender=sender, body=body, **kwargs)
+
+    def test_alert_with_a_promotional_footer_is_accepted(self):
+        body = (
+            '<p>Your account was debited with NGN 5,000.00</p><p>Narration: POS SHOPRITE</p>'
+            '<p>Special offer: win up to N1m. Unsubscribe</p><p>Insufficient funds? Try our overdraft.</p>'
+        )
+        self.assertEqual(self.classify('Debit Alert', body=body, bank_name='Kuda Bank'), (True, None))
+
+    def test_explicit_rules_name_the_reason_and_where_it_matched(self):
+        self.assertEqual(self.classify('Login Alert', body='<p>Hello</p>'), (False, 'login_alert:subject'))
+        self.assertEqual(self.classify('Weekly digest', sender='newsletter@bank.com'), (False, 'marketing:sender'))
+        self.assertEqual(
+            self.classify('Alert', body='<p>You have logged in successfully</p><p>NGN 0</p>'),
+            (False, 'login_alert:body'),
+        )
+
+    def test_weak_body_rules_apply_only_without_a_transaction_signal(self):
+        self.assertEqual(
+            self.classify('Update', body='<p>A special offer just for you. Unsubscribe</p>'),
+            (False, 'marketing:body'),
+        )
+        self.assertEqual(self.classify('Update', body='<p>Hello there</p>'), (False, 'no_transaction_signal'))
+        self.assertEqual(self.classify('Update', body='<p>Hello there</p>', require_signal=False), (True, None))
+
+    def test_markup_is_not_read_as_text(self):
+        body = '<style>.debit { color: red }</style><p class="credit">Hello</p>'
+        self.assertEqual(self.classify('Update', body=body), (False, 'no_transaction_signal'))
+
+    def test_bank_rules_apply_to_their_bank_only(self):
+        body = 'Your account was credited with NGN 5,000'
+        self.assertEqual(self.classify('Kuda tips', body=body, bank_name='Kuda Bank'), (False, 'marketing:subject'))
+        self.assertEqual(self.classify('Kuda tips', body=body, bank_name='Opay'), (True, None))
+
+
+def reset_categorization_state():
+    """Forgets the shared cache and every in-process lookup, as a fresh worker would."""
+    cache.clear()
+    categorization_service._lookups.clear()
+    keyword_rules._rule_sets.clear()
+    merchant_catalogue._catalogue.version = None
+
+
+class CategorizationLookupTests(TestCase):
+    """Transactions are categorized from the user's history, kept per worker, before any LLM call."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='lookup')
+        cls.food = TransactionCategory.objects.create(name='Food')
+        TransactionCategory.objects.create(name='Transport')
+        cls.create(narration='POS PURCHASE SHOPRITE IKEJA LAGOS', category=cls.food)
+
+    @classmethod
+    def create(cls, narration, category=None):
+        return Transaction.objects.create(
+            user=cls.user, transaction_type='debit', amount=Decimal('100.00'), date=timezone.now(),
+            narration=narration, category=category,
+        )
+
+    def setUp(self):
+        reset_categorization_state()
+        self.ai = mock.Mock()
+
+    def test_history_resolves_without_the_llm(self):
+        tx = self.create('POS PURCHASE SHOPRITE IKEJA LAGOS')
+        self.assertEqual(CategorizationService(ai_service=self.ai).categorize(tx), 'Food')
+        self.ai.categorize_transaction.assert_not_called()
+        self.assertTrue(UserCategorizationIndex.objects.filter(user=self.user).exists())
+
+    def test_unresolved_narrations_go_to_the_llm(self):
+        self.ai.categorize_transaction.return_value = 'Transport'
+        tx = self.create('BOLT RIDE TRIP VICTORIA ISLAND')
+
+        service = CategorizationService(ai_service=self.ai)
+        self.assertIsNone(service.resolve(tx))
+        self.assertEqual(service.categorize(tx), 'Transport')
+        self.ai.categorize_transaction.assert_called_once()
+
+    def test_assignments_reach_other_workers_lookups(self):
+        other_worker = UserCategoryLookup(self.user.id)
+        other_worker.load()
+        tx = self.create('BOLT RIDE TRIP VICTORIA ISLAND')
+
+        CategorizationService(ai_service=self.ai).assign(tx, 'Transport')
+
+        self.assertNotEqual(other_worker.version, categorization_service.get_categorization_version(self.user.id))
+        other_worker.sync()
+        self.assertEqual(other_worker.match('BOLT RIDE TRIP VICTORIA ISLAND')[:1], ('Transport',))
+        self.assertEqual(get_user_lookup(self.user.id).match('BOLT RIDE TRIP VICTORIA ISLAND')[0], 'Transport')
+
+
+class NarrationSimilarityTests(SimpleTestCase):
+
+    def test_scores_are_cosine_similarities(self):
+        scores = NarrationVectorizer().similarities(
+            'POS PURCHASE SHOPRITE IKEJA 1234',
+            ['pos purchase shoprite ikeja 1234', 'POS PURCHASE SHOPRITE IKEJA 9876', 'NIP TRANSFER TO ADA OBI', ''],
+        )
+        self.assertAlmostEqual(scores[0], 1.0, places=5)
+        self.assertGreater(scores[1], SIMILARITY_THRESHOLD)
+        self.assertLess(scores[2], SIMILARITY_THRESHOLD)
+        self.assertEqual(scores[3], 0.0)
+
+    def test_repeat_payments_pass_the_threshold_and_others_do_not(self):
+        index = NarrationIndex()
+        index.add('POS PURCHASE SHOPRITE IKEJA 1234', 'Food')
+        index.add('NIP TRANSFER TO ADA OBI 5521', 'Family')
+
+        (repeat, repeat_score), (other, other_score) = index.best_matches(
+            ['POS PURCHASE SHOPRITE IKEJA 9876', 'AIRTIME RECHARGE MTN 08031234567']
+        )
+        self.assertEqual(repeat, 'Food')
+        self.assertGreater(repeat_score, SIMILARITY_THRESHOLD)
+        self.assertLess(other_score, SIMILARITY_THRESHOLD)
+
+    def test_same_narration_is_relabelled_not_duplicated(self):
+        index = NarrationIndex()
+        index.add('POS PURCHASE SHOPRITE IKEJA', 'Food')
+        index.add('pos purchase shoprite ikeja', 'Groceries')
+        self.assertEqual(len(index), 1)
+        self.assertEqual(index.label_for('Pos Purchase Shoprite Ikeja'), 'Groceries')
+
+    def test_snapshot_round_trip_and_incremental_rows(self):
+        index = NarrationIndex()
+        for n in range(30):
+            index.add(f'MERCHANT {n} LAGOS', f'Category {n}')
+
+        restored = NarrationIndex.from_snapshot(index.narrations(), list(index.labels), index.to_bytes())
+        restored.add('BOLT RIDE TRIP VICTORIA ISLAND', 'Transport')
+
+        self.assertEqual(restored.best_match('MERCHANT 17 LAGOS')[0], 'Category 17')
+        self.assertEqual(restored.best_match('BOLT RIDE TRIP VICTORIA ISLAND')[0], 'Transport')
+        with self.assertRaises(ValueError):
+            NarrationIndex.from_snapshot(index.narrations()[:-1], list(index.labels), index.to_bytes())
+
+
+class MerchantKeyTests(SimpleTestCase):
+
+    def test_references_masks_and_channel_codes_are_dropped(self):
+        self.assertEqual(
+            merchant_key('TRANSFER TO Bokku Mart Moniepoint MFB *****1234/TRF|2MPT99l1w|1966'),
+            'transfer to bokku mart moniepoint mfb',
+        )
+        self.assertEqual(
+            merchant_key('TRANSFER TO BOKKU MART MONIEPOINT MFB ****9876/TRF|7QQ1x|2002'),
+            'transfer to bokku mart moniepoint mfb',
+        )
+        self.assertEqual(merchant_key('POS/WEB/SHOPRITE IKEJA LANG NG <12345>'), 'shoprite ikeja')
+        self.assertEqual(merchant_key('Airtime 08031234567 MTN'), 'airtime mtn')
+
+    def test_generic_narrations_have_no_key(self):
+        self.assertEqual(merchant_key('POS PURCHASE 1234'), '')
+        self.assertEqual(merchant_key('NIP/TRF/0123'), '')
+        self.assertEqual(merchant_key(None), '')
+
+
+class MerchantKeyCategorizationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='merchant-key')
+        Transaction.objects.create(
+            user=cls.user, transaction_type='debit', amount=Decimal('2500.00'), date=timezone.now(),
+            narration='TRANSFER TO Bokku Mart Moniepoint MFB *****1234/TRF|2MPT99l1w|1966',
+            category=TransactionCategory.objects.create(name='Food'),
+        )
+
+    def setUp(self):
+        reset_categorization_state()
+
+    def test_repeat_payment_is_matched_by_merchant_key(self):
+        self.assertEqual(
+            get_user_lookup(self.user.id).match('TRANSFER TO BOKKU MART MONIEPOINT MFB ****9876/TRF|7QQ1x|2002'),
+            ('Food', 1.0, 'merchant_key'),
+        )
+
+
+class BatchCategorizationTests(SimpleTestCase):
+
+    CATEGORIES = ['Food', 'Transport']
+
+    def categorize(self, narrations, *responses, batch_size=40):
+        client = mock.Mock()
+        client.generate_content.side_effect = [mock.Mock(text=text) for text in responses]
+        with mock.patch('transactions.services.ai_service.GEMINI_CLIENTS', [client]):
+            result = AIService().categorize_transactions(narrations, self.CATEGORIES, [], batch_size=batch_size)
+        return result, client
+
+    def test_distinct_narrations_are_sent_in_batches(self):
+        result, client = self.categorize(
+            ['SHOPRITE', 'BOLT RIDE', 'SHOPRITE', 'MTN AIRTIME'],
+            '```json\n{"1": "food", "2": "Transport"}\n```',
+            '{"1": "Airtime"}',
+            batch_size=2,
+        )
+        self.assertEqual(client.generate_content.call_count, 2)
+        self.assertEqual(result, {'SHOPRITE': 'Food', 'BOLT RIDE': 'Transport', 'MTN AIRTIME': 'Unknown'})
+
+    def test_missing_and_unusable_answers_become_unknown(self):
+        result, _ = self.categorize(['SHOPRITE', 'BOLT RIDE'], '{"1": "Food"}')
+        self.assertEqual(result, {'SHOPRITE': 'Food', 'BOLT RIDE': 'Unknown'})
+
+        result, _ = self.categorize(['SHOPRITE', 'BOLT RIDE'], '["Food", "Transport"]')
+        self.assertEqual(result, {'SHOPRITE': 'Unknown', 'BOLT RIDE': 'Unknown'})
+
+        result, _ = self.categorize(['SHOPRITE'], 'Food')
+        self.assertEqual(result, {'SHOPRITE': 'Unknown'})
+
+
+class CategorizeManyTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='batched')
+        for name in ('Food', 'Transport'):
+            TransactionCategory.objects.create(name=name)
+        cls.transactions = [
+            Transaction.objects.create(
+                user=cls.user, transaction_type='debit', amount=Decimal('100.00'), date=timezone.now(),
+                narration=narration,
+            )
+            for narration in (
+                'TRANSFER TO Bokku Mart Moniepoint MFB *****1234/TRF|2MPT99l1w|1966',
+                'TRANSFER TO BOKKU MART MONIEPOINT MFB ****9876/TRF|7QQ1x|2002',
+                'BOLT RIDE TRIP VICTORIA ISLAND',
+            )
+        ]
+
+    def setUp(self):
+        reset_categorization_state()
+
+    def test_one_narration_per_merchant_is_sent_to_the_llm(self):
+        first, second, ride = self.transactions
+        ai = mock.Mock()
+        ai.categorize_transactions.return_value = {first.narration: 'Food'}
+
+        result = CategorizationService(ai_service=ai).categorize_many(self.transactions)
+
+        ai.categorize_transactions.assert_called_once()
+        self.assertEqual(ai.categorize_transactions.call_args.kwargs['narrations'], [first.narration, ride.narration])
+        self.assertEqual(result, {first.id: 'Food', second.id: 'Food', ride.id: 'Unknown'})
+
+    def test_without_the_llm_only_resolved_transactions_are_returned(self):
+        ai = mock.Mock()
+        self.assertEqual(CategorizationService(ai_service=ai).categorize_many(self.transactions, use_llm=False), {})
+        ai.categorize_transactions.assert_not_called()
+
+
+class KeywordRuleSetTests(SimpleTestCase):
+
+    rules = KeywordRuleSet([('uber', 'Transport'), ('Uber Eats', 'Food'), ('  uber ', 'Other'), ('mtn', 'Airtime'), ('', 'Empty')])
+
+    def test_duplicate_and_empty_keywords_are_ignored(self):
+        self.assertEqual(len(self.rules), 3)
+        self.assertEqual(self.rules.match('UBER   TRIP'), ('Transport', 'uber'))
+
+    def test_longest_keyword_wins(self):
+        self.assertEqual(self.rules.match('UBER EATS LAGOS 1234'), ('Food', 'uber eats'))
+
+    def test_keywords_match_whole_words_only(self):
+        self.assertIsNone(self.rules.match('SUBERB STORES'))
+        self.assertEqual(self.rules.match('MTN-AIRTIME'), ('Airtime', 'mtn'))
+        self.assertIsNone(self.rules.match(None))
+
+
+class KeywordRuleCategorizationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='keyword-rules')
+        cls.food = TransactionCategory.objects.create(name='Food')
+        cls.transport = TransactionCategory.objects.create(name='Transport')
+        for narration in ('UBER EATS ORDER 1234', 'UBER EATS ORDER 5678'):
+            Transaction.objects.create(
+                user=cls.user, transaction_type='debit', amount=Decimal('100.00'), date=timezone.now(),
+                narration=narration, category=cls.food,
+            )
+        cls.tx = Transaction.objects.create(
+            user=cls.user, transaction_type='debit', amount=Decimal('100.00'), date=timezone.now(),
+            narration='UBER EATS ORDER 5678',
+        )
+
+    def setUp(self):
+        reset_categorization_state()
+
+    def test_rules_apply_before_history_and_follow_mapping_changes(self):
+        service = CategorizationService(ai_service=mock.Mock())
+        self.assertEqual(service.resolve(self.tx), 'Food')
+
+        mapping = UserCategoryMapping.objects.create(user=self.user, transaction_category=self.transport, keywords=['uber'])
+        self.assertEqual(service.resolve(self.tx), 'Transport')
+
+        mapping.delete()
+        self.assertEqual(service.resolve(self.tx), 'Food')
+
+
+class CategorizationRunTests(TestCase):
+    """categorize_transactions_for_user only examines new and retry-due transactions."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='checkpoint')
+        TransactionCategory.objects.create(name='Food')
+
+    def setUp(self):
+        reset_categorization_state()
+        self.ai = mock.Mock()
+        self.ai.categorize_transactions.return_value = {}
+        patcher = mock.patch.object(CategorizationService, 'ai_service_factory', return_value=self.ai)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.tx = Transaction.objects.create(
+            user=self.user, transaction_type='debit', amount=Decimal('100.00'), date=timezone.now(),
+            narration='BOLT RIDE TRIP VICTORIA ISLAND',
+        )
+
+    def test_failed_transactions_are_retried_with_backoff(self):
+        started = timezone.now()
+        categorize_transactions_for_user(self.user.id)
+
+        self.tx.refresh_from_db()
+        self.assertIsNone(self.tx.category_id)
+        self.assertEqual(self.tx.categorization_attempts, 1)
+        self.assertGreaterEqual(self.tx.next_categorization_at, started + CATEGORIZATION_RETRY_BASE)
+
+        self.assertEqual(categorize_transactions_for_user(self.user.id), "No new transactions to categorize.")
+        self.ai.categorize_transactions.assert_called_once()
+
+    def test_last_attempt_assigns_unknown(self):
+        Transaction.objects.filter(id=self.tx.id).update(
+            categorization_attempts=MAX_CATEGORIZATION_ATTEMPTS - 1,
+            next_categorization_at=timezone.now() - timedelta(minutes=1),
+        )
+        categorize_transactions_for_user(self.user.id)
+
+        self.tx.refresh_from_db()
+        self.assertEqual(self.tx.category.name, 'Unknown')
+        self.assertIsNone(self.tx.next_categorization_at)
+
+    def test_checkpoint_skips_transactions_already_examined(self):
+        UserTransactionCategorizationState.objects.create(user=self.user, last_processed_date=timezone.now() + timedelta(days=1))
+
+        self.assertEqual(categorize_transactions_for_user(self.user.id), "No new transactions to categorize.")
+        categorize_transactions_for_user(self.user.id, full_scan=True)
+        self.ai.categorize_transactions.assert_called_once()
+
+    def test_checkpoint_advances_to_the_newest_examined_transaction(self):
+        categorize_transactions_for_user(self.user.id)
+        self.assertEqual(
+            UserTransactionCategorizationState.objects.get(user=self.user).last_processed_date, self.tx.created_at
+        )
+
+
+class MerchantCatalogueTests(TestCase):
+    """Merchants categorized alike by enough users are shared with everyone."""
+
+    SHOPRITE = 'POS PURCHASE SHOPRITE IKEJA {}'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.food = TransactionCategory.objects.create(name='Food')
+        cls.groceries = TransactionCategory.objects.create(name='Groceries')
+        cls.users = [User.objects.create(username=f'catalogue-{n}') for n in range(MIN_MERCHANT_USERS + 1)]
+
+    def setUp(self):
+        reset_categorization_state()
+
+    def categorize(self, users, narration, category, transaction_type='debit'):
+        for n, user in enumerate(users):
+            Transaction.objects.create(
+                user=user, transaction_type=transaction_type, amount=Decimal('100.00'), date=timezone.now(),
+                narration=narration.format(n), category=category,
+            )
+
+    def test_votes_count_distinct_users(self):
+        votes = aggregate_merchant_votes([
+            (1, 'POS SHOPRITE IKEJA 1', 'Food'),
+            (1, 'POS SHOPRITE IKEJA 2', 'Food'),
+            (2, 'POS SHOPRITE IKEJA 3', 'Groceries'),
+            (3, 'POS SHOPRITE IKEJA 4', 'Unknown'),
+        ])
+        self.assertEqual(votes, {'shoprite ikeja': ({'Food': 1, 'Groceries': 1}, 2)})
+
+    def test_merchant_is_published_once_enough_users_agree(self):
+        self.categorize(self.users[:MIN_MERCHANT_USERS - 1], self.SHOPRITE, self.food)
+        self.assertEqual(rebuild_merchant_catalogue(), 0)
+
+        self.categorize(self.users[MIN_MERCHANT_USERS - 1:], self.SHOPRITE, self.food)
+        self.assertEqual(rebuild_merchant_catalogue(), 1)
+        self.assertEqual(get_merchant_catalogue().match('shoprite ikeja'), ('Food', 1.0))
+
+    def test_disputed_merchants_and_credits_are_not_published(self):
+        half = len(self.users) // 2
+        self.categorize(self.users[:half], self.SHOPRITE, self.food)
+        self.categorize(self.users[half:], self.SHOPRITE, self.groceries)
+        self.categorize(self.users, 'NIP TRANSFER FROM ADA OBI {}', self.food, transaction_type='credit')
+        self.assertEqual(rebuild_merchant_catalogue(), 0)
+
+    def test_catalogue_answers_for_users_without_history(self):
+        self.categorize(self.users, self.SHOPRITE, self.food)
+        rebuild_merchant_catalogue()
+        newcomer = User.objects.create(username='catalogue-newcomer')
+
+        category, _, source = get_user_lookup(newcomer.id).match('POS PURCHASE SHOPRITE IKEJA 9999')
+        self.assertEqual((category, source), ('Food', 'merchant_catalogue'))
+
+
+@mock.patch.object(tasks.reconcile_user_corrections_task, 'apply_async')
+class ReconciliationTests(TestCase):
+    """Manual corrections are coalesced per user and reconciled in one pass."""
+
+    BOKKU = 'TRANSFER TO Bokku Mart Moniepoint MFB *****{}/TRF|2MPT99l1w|1966'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='reconcile')
+        cls.food = TransactionCategory.objects.create(name='Food')
+        cls.groceries = TransactionCategory.objects.create(name='Groceries')
+
+    def setUp(self):
+        reset_categorization_state()
+
+    def create(self, narration, category=None, days_ago=0, **kwargs):
+        return Transaction.objects.create(
+            user=self.user, transaction_type='debit', amount=Decimal('100.00'),
+            date=timezone.now() - timedelta(days=days_ago), narration=narration, category=category, **kwargs
+        )
+
+    def test_a_burst_of_edits_schedules_one_pass(self, apply_async):
+        for _ in range(3):
+            tasks.schedule_reconciliation(self.user.id)
+        apply_async.assert_called_once()
+        self.assertEqual(apply_async.call_args.kwargs['countdown'], tasks.RECONCILE_DEBOUNCE_SECONDS)
+
+    def test_pass_waits_while_the_user_is_still_editing(self, apply_async):
+        tasks.schedule_reconciliation(self.user.id)
+        first_edit_at = apply_async.call_args.args[0][1]
+
+        result = tasks.reconcile_user_corrections_task(self.user.id, first_edit_at)
+        self.assertEqual(result, "Reconciliation deferred; the user is still editing.")
+        self.assertEqual(apply_async.call_count, 2)
+
+        stale = first_edit_at - tasks.RECONCILE_MAX_DELAY_SECONDS
+        self.assertEqual(tasks.reconcile_user_corrections_task(self.user.id, stale), "No corrections to reconcile.")
+
+    def test_latest_correction_of_a_merchant_wins(self, apply_async):
+        self.create(self.BOKKU.format(1111), self.groceries, days_ago=5, is_manually_categorized=True)
+        latest = self.create(self.BOKKU.format(2222), self.food, days_ago=1, is_manually_categorized=True)
+        pending = self.create(self.BOKKU.format(3333))
+
+        self.assertEqual(tasks.reconcile_user_corrections_task(self.user.id), "Reconciled 1 transactions.")
+        pending.refresh_from_db()
+        latest.refresh_from_db()
+        self.assertEqual(pending.category_id, self.food.id)
+        self.assertFalse(latest.is_manually_categorized)
+
+
+class ResponseCacheTests(TestCase):
+    """Analytics responses are cached per user until that user's data or a category changes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='response-cache')
+        cls.other_user = User.objects.create(username='response-cache-other')
+        cls.food = TransactionCategory.objects.create(name='Food')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        patcher = mock.patch.object(analytics, 'category_breakdown', wraps=analytics.category_breakdown)
+        self.breakdown = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def create(self, user, amount):
+        with self.captureOnCommitCallbacks(execute=True):
+            Transaction.objects.create(
+                user=user, transaction_type='debit', amount=Decimal(amount), date=timezone.now(),
+                narration='POS PURCHASE SHOPRITE', category=self.food,
+            )
+
+    def statistics(self, **params):
+        return self.client.get(reverse('spending-statistics'), params).data['spending_by_category']
+
+    def test_repeat_requests_are_served_from_the_cache(self):
+        self.create(self.user, '100.00')
+        first = self.statistics(startdate='2020-01-01', enddate='2100-01-01')
+        second = self.statistics(enddate='2100-01-01', startdate='2020-01-01')
+
+        self.assertEqual(first, second)
+        self.assertEqual(self.breakdown.call_count, 1)
+        self.assertEqual(metrics.snapshot()['response_cache']['spending_statistics']['hits'], 1)
+
+    def test_writes_invalidate_only_the_writers_responses(self):
+        self.create(self.user, '100.00')
+        self.statistics()
+        self.create(self.other_user, '50.00')
+        self.statistics()
+        self.assertEqual(self.breakdown.call_count, 1)
+
+        self.create(self.user, '20.00')
+        self.assertEqual(self.statistics()[0]['total_amount'], 120.0)
+
+    def test_renaming_a_category_invalidates_every_user(self):
+        self.create(self.user, '100.00')
+        self.statistics()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.food.name = 'Groceries'
+            self.food.save()
+        self.assertEqual(self.statistics()[0]['category'], 'Groceries')
+
+    def test_parameters_are_normalized(self):
+        self.assertEqual(
+            response_cache.normalize_params(QueryDict('b=2&a=1&c=&a=0')),
+            response_cache.normalize_params(QueryDict('a=0&a=1&b=2')),
+        )
+
+
+class TimeSeriesViewTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='timeseries')
+        food = TransactionCategory.objects.create(name='Food')
+        for day, transaction_type, amount, category, bank_name in (
+            (2, 'debit', '100.00', food, 'Kuda Bank'),
+            (4, 'debit', '50.00', None, 'Opay'),
+            (10, 'credit', '500.00', None, 'Kuda Bank'),
+        ):
+            Transaction.objects.create(
+                user=cls.user, transaction_type=transaction_type, amount=Decimal(amount),
+                date=timezone.make_aware(datetime.combine(date(2026, 3, day), time(12))),
+                narration=f'TRANSACTION {day}', category=category, bank_name=bank_name,
+            )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get(self, **params):
+        return self.client.get(reverse('transaction-timeseries'), params)
+
+    def test_days_are_gap_filled(self):
+        data = json.loads(self.get(startdate='2026-03-01', enddate='2026-03-05').content)
+        self.assertEqual(data['periods'], ['2026-03-01', '2026-03-02', '2026-03-03', '2026-03-04', '2026-03-05'])
+        self.assertEqual(data['series'], [
+            {'key': None, 'label': 'All', 'debit': [0.0, 100.0, 0.0, 50.0, 0.0], 'credit': [0.0] * 5},
+        ])
+
+    def test_weeks_start_on_monday(self):
+        data = json.loads(self.get(granularity='week', startdate='2026-03-01', enddate='2026-03-10').content)
+        self.assertEqual(data['periods'], ['2026-02-23', '2026-03-02', '2026-03-09'])
+        self.assertEqual(data['series'][0]['debit'], [0.0, 150.0, 0.0])
+        self.assertEqual(data['series'][0]['credit'], [0.0, 0.0, 500.0])
+
+    def test_split_by_category_orders_series_by_spend(self):
+        data = json.loads(self.get(
+            granularity='month', split_by='category', startdate='2026-03-01', enddate='2026-03-31'
+        ).content)
+        self.assertEqual([entry['label'] for entry in data['series']], ['Food', 'Uncategorized'])
+        self.assertEqual(data['series'][1]['debit'], [50.0])
+        self.assertEqual(data['series'][1]['credit'], [500.0])
+
+    def test_split_by_bank(self):
+        data = json.loads(self.get(split_by='bank', startdate='2026-03-01', enddate='2026-03-31', granularity='month').content)
+        self.assertEqual(
+            {entry['label']: entry['debit'] for entry in data['series']},
+            {'Kuda Bank': [100.0], 'Opay': [50.0]},
+        )
+
+    def test_invalid_parameters_are_rejected(self):
+        self.assertEqual(self.get(granularity='year').status_code, 400)
+        self.assertEqual(self.get(split_by='merchant').status_code, 400)
+        self.assertEqual(self.get(startdate='2000-01-01', enddate='2026-01-01').status_code, 400)
+
+
+class TransactionFilterTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='filters')
+        cls.food = TransactionCategory.objects.create(name='Food')
+        cls.transport = TransactionCategory.objects.create(name='Transport')
+
+        def create(day, transaction_type, amount, narration, category, bank_name):
+            return Transaction.objects.create(
+                user=cls.user, transaction_type=transaction_type, amount=Decimal(amount),
+                date=timezone.make_aware(datetime.combine(date(2026, 3, day), time(12))),
+                narration=narration, category=category, bank_name=bank_name,
+            )
+
+        cls.shoprite = create(1, 'debit', '2500.00', 'POS PURCHASE Shoprite Ikeja', cls.food, 'Kuda Bank')
+        cls.bolt = create(2, 'debit', '1200.00', 'BOLT RIDE TRIP', cls.transport, 'Opay')
+        cls.salary = create(3, 'credit', '250000.00', 'NIP TRANSFER FROM ACME LTD SALARY', None, 'Kuda Bank')
+        cls.airtime = create(4, 'debit', '500.00', 'MTN AIRTIME 08031234567', None, 'Opay')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def filtered(self, query):
+        return set(filter_transactions(Transaction.objects.filter(user=self.user), QueryDict(query)))
+
+    def test_each_filter(self):
+        self.assertEqual(self.filtered(f'category={self.food.id},{self.transport.id}'), {self.shoprite, self.bolt})
+        self.assertEqual(self.filtered(f'category=uncategorized,{self.food.id}'), {self.shoprite, self.salary, self.airtime})
+        self.assertEqual(self.filtered('bank=Opay'), {self.bolt, self.airtime})
+        self.assertEqual(self.filtered('type=credit'), {self.salary})
+        self.assertEqual(self.filtered('min_amount=1000&max_amount=2500'), {self.shoprite, self.bolt})
+        self.assertEqual(self.filtered('startdate=2026-03-02&enddate=2026-03-03'), {self.bolt, self.salary})
+        self.assertEqual(self.filtered('search=shoprite'), {self.shoprite})
+
+    def test_filters_combine(self):
+        self.assertEqual(self.filtered('type=debit&bank=Kuda Bank,Opay&max_amount=1500'), {self.bolt, self.airtime})
+        self.assertEqual(self.filtered(''), {self.shoprite, self.bolt, self.salary, self.airtime})
+
+    def test_invalid_values_are_rejected(self):
+        for query in ('category=food', 'type=refund', 'min_amount=lots', 'startdate=03/02/2026', 'search=ab'):
+            with self.subTest(query=query), self.assertRaises(ValueError):
+                self.filtered(query)
+
+    def test_list_endpoint_applies_the_filters(self):
+        response = self.client.get(reverse('transaction-list'), {'bank': 'Opay', 'fields': 'id'})
+        self.assertEqual(json.loads(response.content)['results'], [{'id': self.airtime.id}, {'id': self.bolt.id}])
+        self.assertEqual(self.client.get(reverse('transaction-list'), {'type': 'refund'}).status_code, 400)
+
+
+class TransactionExportTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='export')
+        food = TransactionCategory.objects.create(name='Food')
+        now = timezone.now()
+        cls.older = Transaction.objects.create(
+            user=cls.user, transaction_type='debit', amount=Decimal('2500'), date=now - timedelta(days=1),
+            narration='POS PURCHASE Shoprite, Ikeja', category=food, bank_name='Kuda Bank',
+            account_balance=Decimal('10000.5'),
+        )
+        cls.newer = Transaction.objects.create(
+            user=cls.user, transaction_type='credit', amount=Decimal('700.25'), date=now, narration='NIP TRANSFER FROM ADA',
+        )
+        Transaction.objects.create(
+            user=User.objects.create(username='export-other'), transaction_type='debit', amount=Decimal('1'),
+            date=now, narration='NOT MINE',
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def export(self, file_format, **params):
+        response = self.client.get(reverse('transaction-export', args=[file_format]), params)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content).decode('utf-8')
+
+    def test_csv(self):
+        response, body = self.export('csv')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn('attachment; filename="transactions-', response['Content-Disposition'])
+
+        rows = list(csv.reader(io.StringIO(body)))
+        self.assertEqual(rows[0], ['id', 'date', 'type', 'amount', 'narration', 'category', 'bank', 'account_balance'])
+        self.assertEqual([row[0] for row in rows[1:]], [str(self.newer.id), str(self.older.id)])
+        self.assertEqual(rows[2][2:], ['debit', '2500.00', 'POS PURCHASE Shoprite, Ikeja', 'Food', 'Kuda Bank', '10000.50'])
+
+    def test_ndjson_matches_the_list_records(self):
+        _, body = self.export('ndjson', type='credit')
+        records = [json.loads(line) for line in body.splitlines()]
+        listed = json.loads(self.client.get(reverse('transaction-list'), {'type': 'credit'}).content)['results']
+
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0]['id'], self.newer.id)
+        self.assertEqual(records[0]['date'], listed[0]['date'])
+        self.assertEqual(records[0]['amount'], '700.25')
+        self.assertIsNone(records[0]['category'])
+
+    def test_lines_are_written_in_blocks(self):
+        with mock.patch.object(lean_serialization, 'EXPORT_CHUNK_SIZE', 2):
+            blocks = list(lean_serialization.export_lines(Transaction.objects.filter(user=self.user), 'csv'))
+        self.assertEqual([block.count(b'\r\n') for block in blocks], [2, 1])
+
+    def test_invalid_requests_are_rejected(self):
+        self.assertEqual(self.client.get(reverse('transaction-export', args=['xlsx'])).status_code, 400)
+        self.assertEqual(self.client.get(reverse('transaction-export', args=['csv']), {'type': 'refund'}).status_code, 400)
@@ -14,15 +14,19 @@ urlpatterns = [
     path('oauth2callback/', OAuth2CallbackView.as_view(), name='oauth2callback'),
     path('get/', TransactionListView.as_view(), name='transaction-list'),
     path('<int:pk>/', TransactionUpdateView.as_view(), name='transaction-update'),
+    path('bulk-update/', TransactionBulkUpdateView.as_view(), name='transaction-bulk-update'),
+    path('export/<str:file_format>/', TransactionExportView.as_view(), name='transaction-export'),
     path('budget-suggestion/', BudgetSuggestionView.as_view(), name='budget-suggestion'),
     path('categories/', TransactionCategoryListView.as_view(), name='category-list'),
     path('categorize/', CategorizeUserTransactionsView.as_view(), name='categorize-transactions'),
     path('summary/', TransactionSummaryView.as_view(), name='transaction-summary'),
     path('spending-statistics/', SpendingStatisticsView.as_view(), name='spending-statistics'),
+    path('timeseries/', TimeSeriesView.as_view(), name='transaction-timeseries'),
     path('report/download/', PDFReportView.as_view(), name='download-pdf-report'),
     path('report/email/', EmailReportView.as_view(), name='email-pdf-report'),
     path('reprocess-failed/', ReprocessFailedEmailsView.as_view(), name='reprocess-failed-emails'),
     path('clean-narrations/', CleanTransactionNarrationsView.as_view(), name='clean-narrations'),
+    path('metrics/', PipelineMetricsView.as_view(), name='pipeline-metrics'),
 
     path('', include(router.urls)),
 ]
@@ -1,11 +1,14 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.permissions import IsAuthenticated, AllowAny, BasePermission
+from rest_framework.authentication import BaseAuthentication
+from rest_framework.settings import api_settings
 from rest_framework import generics, viewsets
 from datetime import datetime
 from django.shortcuts import redirect
 from google_auth_oauthlib.flow import Flow
 from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
 from django.utils import timezone
 from .tasks import *
 from transactions.models import Transaction
@@ -14,14 +17,17 @@ from .models import Transaction
 from .serializers import *
 from datetime import datetime, timedelta
 from django.utils.dateparse import parse_date
-from django.db.models import Sum, Count, Q
 from .pdf_generate import PDFReportGenerator
+from . import analytics, lean_serialization, metrics
+from .filters import filter_transactions
+from .rollups import ROLLUP_FIELDS, apply_rollup_changes, snapshot
+from .response_cache import cached_response
 
+import hmac
 import io
-from django.http import HttpResponse
-from django.db import IntegrityError
+from django.http import HttpResponse, StreamingHttpResponse
+from django.db import IntegrityError, transaction as db_transaction
 from django.db.models import F
-from django.db.models.functions import TruncMonth, TruncDay
 import jwt
 from django.core.management import call_command
 
@@ -147,22 +153,80 @@ class OAuth2CallbackView(APIView):
 
 
 
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import CursorPagination
 
-class StandardResultsSetPagination(PageNumberPagination):
+class TransactionCursorPagination(CursorPagination):
+    """
+    Cursor pagination, newest first, with opaque cursor tokens. DRF keys the
+    cursor on the first ordering field only: a page starts with a date range
+    on transaction_user_date_id_idx from the previous page's last date, plus
+    an offset past the rows already served on that date. Pages therefore run
+    no COUNT(*) and do not shift when new transactions arrive, and only rows
+    sharing one date are skipped by offset; 'id' keeps that order stable.
+    """
     page_size = 100
     page_size_query_param = 'page_size'
     max_page_size = 1000
+    ordering = ('-date', '-id')
 
 class TransactionListView(generics.ListAPIView):
     serializer_class = TransactionSerializer
     permission_classes = [IsAuthenticated]
-    pagination_class = StandardResultsSetPagination
+    pagination_class = TransactionCursorPagination
 
     def get_queryset(self):
-        # Return transactions only for the authenticated user, ordered by date desc
-        return Transaction.objects.filter(user=self.request.user).select_related('receipt', 'category').order_by('-date')
+        # Return transactions only for the authenticated user; the paginator orders them
+        return Transaction.objects.filter(user=self.request.user)
 
+    def list(self, request, *args, **kwargs):
+        """
+        Serves pages from .values() rows as flat dicts instead of running
+        TransactionSerializer per row; the output has the same shape. An
+        optional 'fields' parameter (e.g. fields=id,amount,date) limits the
+        columns fetched and returned, and ETag/If-None-Match give 304s.
+        Filters and narration search are described in filter_transactions.
+        """
+        try:
+            fields = lean_serialization.parse_fields(request.query_params.get('fields'))
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+
+        try:
+            transactions = filter_transactions(self.get_queryset(), request.query_params)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+
+        rows = transactions.values(*lean_serialization.columns_for(fields))
+        page = self.paginate_queryset(rows)
+        records = [lean_serialization.transaction_record(row, fields) for row in page]
+        return lean_serialization.json_response(request, self.get_paginated_response(records).data)
+
+
+
+class TransactionExportView(APIView):
+    """
+    Streams the user's transactions as CSV or NDJSON. Accepts the same
+    filters as the transaction list. Rows are read through a server-side
+    cursor and written as they arrive, so memory use does not grow with the
+    number of transactions.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, file_format):
+        if file_format not in lean_serialization.EXPORT_FORMATS:
+            return Response({"error": f"Unsupported export format '{file_format}'. Use csv or ndjson."}, status=400)
+        try:
+            transactions = filter_transactions(Transaction.objects.filter(user=request.user), request.query_params)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+
+        response = StreamingHttpResponse(
+            lean_serialization.export_lines(transactions, file_format),
+            content_type=lean_serialization.EXPORT_FORMATS[file_format],
+        )
+        filename = f"transactions-{timezone.localdate().isoformat()}.{file_format}"
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
 
 
 class TransactionUpdateView(generics.RetrieveUpdateAPIView):
@@ -171,7 +235,7 @@ class TransactionUpdateView(generics.RetrieveUpdateAPIView):
 
     def get_queryset(self):
         # Only allow user to update their own transactions
-        return Transaction.objects.filter(user=self.request.user)
+        return Transaction.objects.filter(user=self.request.user).select_related('receipt', 'category')
 
     def update(self, request, *args, **kwargs):
         instance = self.get_object()
@@ -186,6 +250,50 @@ class TransactionUpdateView(generics.RetrieveUpdateAPIView):
         return Response(serializer.data)
 
 
+class TransactionBulkUpdateView(APIView):
+    """
+    Sets the categories of many of the user's transactions at once. Ownership
+    is checked with one query and the rows are written with one bulk_update,
+    then a single debounced reconciliation pass learns from all the edits.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        serializer = TransactionBulkUpdateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        categories = {item['id']: item['category'] for item in serializer.validated_data['updates']}
+
+        transactions = list(
+            Transaction.objects.filter(user=request.user, id__in=categories).only(
+                'id', 'next_categorization_at', 'categorization_attempts', *ROLLUP_FIELDS
+            )
+        )
+        missing = set(categories) - {tx.id for tx in transactions}
+        if missing:
+            return Response(
+                {"error": f"Transactions not found: {', '.join(map(str, sorted(missing)))}."}, status=404
+            )
+
+        changes = []
+        for tx in transactions:
+            changes.append((snapshot(tx), tx))
+            if tx.category_id is not None and categories[tx.id] is None:
+                tx.requeue_for_categorization()
+            tx.category_id = categories[tx.id]
+            tx.is_manually_categorized = True
+        with db_transaction.atomic():
+            Transaction.objects.bulk_update(
+                transactions,
+                ['category', 'is_manually_categorized', 'next_categorization_at', 'categorization_attempts'],
+                batch_size=500,
+            )
+            apply_rollup_changes(changes)
+
+        # bulk_update sends no post_save, so schedule the reconciliation here.
+        schedule_reconciliation(request.user.id)
+        return Response({"updated": len(transactions)})
+
+
 class TransactionCategoryListView(generics.ListAPIView):
     serializer_class = TransactionCategorySerializer
     permission_classes = [IsAuthenticated]
@@ -197,53 +305,39 @@ class CategorizeUserTransactionsView(APIView):
 
     def post(self, request):
         user = request.user
-        categorize_transactions_for_user.delay(user.id)
+        # An explicit request also re-examines rows older than the checkpoint.
+        categorize_transactions_for_user.delay(user.id, full_scan=True)
         return Response({"message": "Categorization started for your transactions."})
 
 
 
+def _date_range_params(request):
+    """Parses the optional 'startdate' and 'enddate' query parameters."""
+    start_date = request.query_params.get('startdate')
+    end_date = request.query_params.get('enddate')
+    return (parse_date(start_date) if start_date else None), (parse_date(end_date) if end_date else None)
+
+
 class TransactionSummaryView(APIView):
     permission_classes = [IsAuthenticated]
 
+    @cached_response('summary')
     def get(self, request):
-        user = request.user
-
-        start_date = request.query_params.get('startdate')
-        end_date = request.query_params.get('enddate')
-
-        filters = {'user': user}
-
-        if start_date:
-            parsed_start = parse_date(start_date)
-            if parsed_start:
-                filters['date__gte'] = parsed_start
-        if end_date:
-            parsed_end = parse_date(end_date)
-            if parsed_end:
-                filters['date__lte'] = parsed_end
-
-        debit_agg = Transaction.objects.filter(**filters, transaction_type='debit').aggregate(
-            total_amount=Sum('amount'),
-            total_count=Count('id')
-        )
-        credit_agg = Transaction.objects.filter(**filters, transaction_type='credit').aggregate(
-            total_amount=Sum('amount'),
-            total_count=Count('id')
-        )
+        start_date, end_date = _date_range_params(request)
 
-        total_debit = debit_agg["total_amount"] or 0
-        total_credit = credit_agg["total_amount"] or 0
+        # One conditional aggregation over the daily rollups.
+        summary = analytics.summarize(request.user, start_date, end_date)
 
         data = {
             "debit": {
-                "total_count": debit_agg["total_count"] or 0,
-                "total_amount": float(total_debit)
+                "total_count": summary["debit"]["total_count"],
+                "total_amount": float(summary["debit"]["total_amount"])
             },
             "credit": {
-                "total_count": credit_agg["total_count"] or 0,
-                "total_amount": float(total_credit)
+                "total_count": summary["credit"]["total_count"],
+                "total_amount": float(summary["credit"]["total_amount"])
             },
-            "balance": float(total_credit - total_debit)
+            "balance": float(summary["balance"])
         }
         return Response(data)
 
@@ -251,59 +345,86 @@ class TransactionSummaryView(APIView):
 class SpendingStatisticsView(APIView):
     permission_classes = [IsAuthenticated]
 
+    @cached_response('spending_statistics')
     def get(self, request):
-        user = request.user
+        start_date, end_date = _date_range_params(request)
 
-        start_date = request.query_params.get('startdate')
-        end_date = request.query_params.get('enddate')
+        breakdown = analytics.category_breakdown(request.user, start_date, end_date)
 
-        filters = {'user': user, 'transaction_type': 'debit'}  # only spending
+        # Format response; only spending is reported
+        data = {
+            "spending_by_category": [
+                {
+                    "category": entry['category_name'] or "Uncategorized",
+                    "total_amount": float(entry['debit_total']),
+                    "transaction_count": entry['debit_count']
+                } for entry in breakdown if entry['debit_count']
+            ]
+        }
 
-        if start_date:
-            parsed_start = parse_date(start_date)
-            if parsed_start:
-                filters['date__gte'] = parsed_start
+        return Response(data)
+    
 
-        if end_date:
-            parsed_end = parse_date(end_date)
-            if parsed_end:
-                filters['date__lte'] = parsed_end
+class TimeSeriesView(APIView):
+    """
+    Debit and credit totals per day, week or month, gap-filled so the app can
+    chart them directly. Query parameters: 'granularity' (day, week or month;
+    default day), 'startdate', 'enddate' (default: the last 30 periods up to
+    today) and 'split_by' (category or bank).
+    """
+    permission_classes = [IsAuthenticated]
+
+    @cached_response('timeseries')
+    def get(self, request):
+        granularity = request.query_params.get('granularity', 'day')
+        split_by = request.query_params.get('split_by') or None
+        start_date, end_date = _date_range_params(request)
+        end_date = end_date or timezone.localdate()
+        start_date = start_date or analytics.series_start(end_date, granularity)
+
+        try:
+            result = analytics.timeseries(request.user, start_date, end_date, granularity, split_by)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
 
-        qs = Transaction.objects.filter(**filters).values('category__name').annotate(
-            total_amount=Sum('amount'),
-            transaction_count=Count('id')
-        ).order_by('-total_amount')
+        def label(entry):
+            if split_by == 'category':
+                return entry['label'] or "Uncategorized"
+            if split_by == 'bank':
+                return entry['label'] or "Unknown"
+            return "All"
 
-        # Format response
         data = {
-            "spending_by_category": [
+            "granularity": granularity,
+            "split_by": split_by,
+            "start_date": start_date,
+            "end_date": end_date,
+            "periods": result['periods'],
+            "series": [
                 {
-                    "category": entry['category__name'] or "Uncategorized",
-                    "total_amount": float(entry['total_amount'] or 0),
-                    "transaction_count": entry['transaction_count']
-                } for entry in qs
+                    "key": entry['key'],
+                    "label": label(entry),
+                    "debit": [float(value) for value in entry['debit']],
+                    "credit": [float(value) for value in entry['credit']],
+                } for entry in result['series']
             ]
         }
-
         return Response(data)
-    
+
 
 class BudgetSuggestionView(APIView):
     permission_classes = [IsAuthenticated]
 
+    @cached_response('budget_suggestion')
     def get(self, request):
         user = request.user
         # Analyze last 90 days of spending for a 3-month average
         ninety_days_ago = timezone.now().date() - timedelta(days=90)
         
-        spending_data = Transaction.objects.filter(
-            user=user,
-            transaction_type='debit',
-            date__gte=ninety_days_ago,
-            category__isnull=False
-        ).values('category__id', 'category__name').annotate(
-            total_spent=Sum('amount')
-        ).order_by('-total_spent')
+        spending_data = [
+            item for item in analytics.category_breakdown(user, start=ninety_days_ago, categorized_only=True)
+            if item['debit_count']
+        ]
 
         if not spending_data:
             return Response({"message": "Not enough transaction data to suggest a budget."}, status=404)
@@ -312,10 +433,10 @@ class BudgetSuggestionView(APIView):
         total_suggested_budget = 0
         for item in spending_data:
             # Average monthly spend = total over 90 days / 3
-            monthly_avg = item['total_spent'] / 3
+            monthly_avg = item['debit_total'] / 3
             suggestions.append({
-                "category": item['category__id'],
-                "category_name": item['category__name'],
+                "category": item['category_id'],
+                "category_name": item['category_name'],
                 "budgeted_amount": round(float(monthly_avg), 2)
             })
             total_suggested_budget += monthly_avg
@@ -436,3 +557,51 @@ class CleanTransactionNarrationsView(APIView):
             return Response({"message": "Transaction narrations have been successfully cleaned."})
         except Exception as e:
             return Response({"error": str(e)}, status=500)
+
+
+
+# request.auth of a client authenticated with METRICS_AUTH_TOKEN.
+METRICS_AUTH = 'metrics_token'
+
+
+def _is_metrics_token(request) -> bool:
+    token = getattr(settings, 'METRICS_AUTH_TOKEN', None)
+    auth_header = request.META.get('HTTP_AUTHORIZATION', '')
+    return bool(token) and hmac.compare_digest(auth_header.encode(), f"Bearer {token}".encode())
+
+
+class MetricsTokenAuthentication(BaseAuthentication):
+    """
+    Accepts the configured METRICS_AUTH_TOKEN as a bearer token (e.g. from a
+    Prometheus scraper) and otherwise defers to the next authenticator, so the
+    token is not rejected as a malformed JWT.
+    """
+
+    def authenticate(self, request):
+        if _is_metrics_token(request):
+            return AnonymousUser(), METRICS_AUTH
+        return None
+
+
+class HasMetricsToken(BasePermission):
+    """
+    Allows staff users signed in with a JWT, or any client presenting the
+    configured METRICS_AUTH_TOKEN as a bearer token.
+    """
+
+    def has_permission(self, request, view):
+        if request.user and request.user.is_staff:
+            return True
+        return request.auth == METRICS_AUTH
+
+
+class PipelineMetricsView(APIView):
+    """
+    Exposes email pipeline stage latencies, outcomes and LLM call counts
+    in the Prometheus text format.
+    """
+    authentication_classes = [MetricsTokenAuthentication, *api_settings.DEFAULT_AUTHENTICATION_CLASSES]
+    permission_classes = [HasMetricsToken]
+
+    def get(self, request):
+        return HttpResponse(metrics.render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')